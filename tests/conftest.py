@@ -0,0 +1,9 @@
+import os
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGE_DIR = os.path.join(ROOT_DIR, 'wahadloNEAT')
+
+# The modules of wahadloNEAT import each other as top-level modules
+if PACKAGE_DIR not in sys.path:
+    sys.path.insert(0, PACKAGE_DIR)
@@ -0,0 +1,77 @@
+"""CheckpointLog must restore the population it logged, also after a resume from an older generation."""
+
+import neat
+from neat.reporting import BaseReporter
+
+from checkpoint_log import CheckpointLog, list_segments
+from settings import DEFAULT_CONFIG_PATH
+
+SNAPSHOT_INTERVAL = 3
+
+
+class PopulationRecorder(BaseReporter):
+    """Keys and fitness of the population handed to every end_generation."""
+
+    def __init__(self):
+        self.generation = None
+        self.populations = {}
+
+    def start_generation(self, generation):
+        self.generation = generation
+
+    def end_generation(self, config, population, species_set):
+        self.populations[self.generation] = {key: genome.fitness for key, genome in population.items()}
+
+
+def connection_count(genomes, config):
+    for _, genome in genomes:
+        genome.fitness = float(len(genome.connections))
+
+
+def negative_connection_count(genomes, config):
+    for _, genome in genomes:
+        genome.fitness = -float(len(genome.connections))
+
+
+def run(population, prefix, fitness_function, generations):
+    log = CheckpointLog(filename_prefix=prefix, snapshot_interval=SNAPSHOT_INTERVAL, fsync=False)
+    recorder = PopulationRecorder()
+    population.add_reporter(log)
+    population.add_reporter(recorder)
+    population.run(fitness_function, generations)
+    log.close()
+    return recorder.populations
+
+
+def logged(population):
+    return {key: genome.fitness for key, genome in population.population.items()}
+
+
+def test_resume_from_older_generation_keeps_both_branches(tmp_path):
+    prefix = str(tmp_path / 'neat-log-')
+    config = neat.Config(neat.DefaultGenome, neat.DefaultReproduction, neat.DefaultSpeciesSet,
+                         neat.DefaultStagnation, DEFAULT_CONFIG_PATH)
+    config.no_fitness_termination = True
+    first = run(neat.Population(config), prefix, connection_count, 8)
+    first_segments = {filename: open(filename, 'rb').read() for _, _, filename in list_segments(prefix)}
+
+    # Resume from generation 3, which started a segment of the first run, on a different fitness
+    population, _ = CheckpointLog.restore(prefix, 3)
+    assert logged(population) == first[3]
+    second = run(population, prefix, negative_connection_count, 4)
+
+    # The first run's segments are untouched and the branch wrote new ones
+    for filename, content in first_segments.items():
+        assert open(filename, 'rb').read() == content
+    assert len(list_segments(prefix)) > len(first_segments)
+
+    # The newest generation is the last one of the most recently written branch
+    population, _ = CheckpointLog.restore(prefix)
+    assert population.generation == max(second)
+    assert logged(population) == second[max(second)]
+
+    # A generation logged by both runs comes from the branch, one only the first run reached from it
+    assert second[5] != first[5]
+    assert logged(CheckpointLog.restore(prefix, 5)[0]) == second[5]
+    assert logged(CheckpointLog.restore(prefix, 7)[0]) == first[7]
+    assert CheckpointLog.generations(prefix) == list(range(8))
@@ -0,0 +1,67 @@
+"""VectorizedSpeciesSet must form exactly the species of neat.DefaultSpeciesSet."""
+import copy
+import os
+import random
+from itertools import count
+
+import neat
+import pytest
+from neat.reporting import ReporterSet
+from neat.species import DefaultSpeciesSet
+
+from conftest import ROOT_DIR
+from fast_species import VectorizedSpeciesSet
+from settings import DEFAULT_CONFIG_PATH
+
+CHECKPOINT_FILE = os.path.join(ROOT_DIR, 'neat-checkpoint-1799')
+MUTANTS = 300
+GENERATIONS = 4
+# Far below the shipped threshold, so the mutants fall into hundreds of species
+COMPATIBILITY_THRESHOLD = 1.0
+
+
+def make_config(species_set_type, min_species=None):
+    config = neat.Config(neat.DefaultGenome, neat.DefaultReproduction, species_set_type,
+                         neat.DefaultStagnation, DEFAULT_CONFIG_PATH)
+    config.species_set_config.compatibility_threshold = COMPATIBILITY_THRESHOLD
+    if min_species is not None:
+        config.species_set_config.min_species = min_species
+    return config
+
+
+def mutants(parents, first_key, config, rng_seed):
+    """MUTANTS mutated copies of the parents (round robin) with consecutive keys."""
+    random.seed(rng_seed)
+    config.genome_config.node_indexer = count(max(max(g.nodes) for g in parents) + 1)
+    population = {}
+    for i in range(MUTANTS):
+        genome = copy.deepcopy(parents[i % len(parents)])
+        genome.key = first_key + i
+        genome.fitness = None
+        genome.mutate(config.genome_config)
+        population[genome.key] = genome
+    return population
+
+
+def species_of(species_set):
+    return species_set.genome_to_species, {sid: s.representative.key for sid, s in species_set.species.items()}
+
+
+@pytest.fixture(scope='module')
+def parents():
+    return list(neat.Checkpointer.restore_checkpoint(CHECKPOINT_FILE).population.values())
+
+
+@pytest.mark.parametrize('min_species', [0, 1000])
+def test_same_species_over_generations(parents, min_species):
+    default_config = make_config(DefaultSpeciesSet)
+    vectorized_config = make_config(VectorizedSpeciesSet, min_species)
+    default = DefaultSpeciesSet(default_config.species_set_config, ReporterSet())
+    vectorized = VectorizedSpeciesSet(vectorized_config.species_set_config, ReporterSet())
+
+    for generation in range(GENERATIONS):
+        population = mutants(parents, generation * MUTANTS, default_config, generation)
+        default.speciate(default_config, population, generation)
+        vectorized.speciate(vectorized_config, population, generation)
+        assert len(default.species) > 100
+        assert species_of(vectorized) == species_of(default)
@@ -0,0 +1,67 @@
+"""A reused SimulationContext must reproduce episodes on a freshly built pymunk space bit for bit."""
+import os
+
+import neat
+import pytest
+
+import odwroconeWahadloModelNN_modul_old as pymunk_model
+from compiled_net import CompiledNetwork
+from conftest import ROOT_DIR
+from genome_codec import load_genome
+from settings import DEFAULT_CONFIG_PATH
+
+GENOME_FILE = os.path.join(ROOT_DIR, 'best_genome.pkl')
+CHECKPOINT_FILE = os.path.join(ROOT_DIR, 'neat-checkpoint-199')
+
+
+@pytest.fixture(scope='module')
+def config():
+    return neat.Config(neat.DefaultGenome, neat.DefaultReproduction,
+                       neat.DefaultSpeciesSet, neat.DefaultStagnation, DEFAULT_CONFIG_PATH)
+
+
+@pytest.fixture(scope='module')
+def net(config):
+    return CompiledNetwork.create(load_genome(GENOME_FILE, config), config)
+
+
+@pytest.fixture(scope='module')
+def other_net(config):
+    genomes = neat.Checkpointer.restore_checkpoint(CHECKPOINT_FILE).population.values()
+    return CompiledNetwork.create(min(genomes, key=lambda g: g.key), config)
+
+
+def test_reset_matches_fresh_build(net):
+    fresh = pymunk_model.SimulationContext().run(net, False)
+    context = pymunk_model.SimulationContext()
+    context.run(net, False)
+    assert context.run(net, False) == fresh
+
+
+def test_reset_after_other_genome_matches_fresh_build(net, other_net):
+    fresh = pymunk_model.SimulationContext().run(net, False)
+    context = pymunk_model.SimulationContext()
+    context.run(other_net, False)
+    assert context.run(net, False) == fresh
+
+
+def test_reset_after_early_termination_matches_fresh_build(net):
+    from termination import TerminationPolicy
+
+    fresh = pymunk_model.SimulationContext().run(net, False)
+    context = pymunk_model.SimulationContext()
+    context.run(net, False, TerminationPolicy(max_angle=0.01))
+    assert context.run(net, False) == fresh
+
+
+def test_reset_restores_bodies(net):
+    fresh = pymunk_model.SimulationContext()
+    context = pymunk_model.SimulationContext()
+    context.run(net, False)
+    context.reset()
+    for body, expected in zip((context.cart_body, context.arm1_body, context.arm2_body),
+                              (fresh.cart_body, fresh.arm1_body, fresh.arm2_body)):
+        assert body.position == expected.position
+        assert body.angle == expected.angle
+        assert body.velocity == expected.velocity
+        assert body.angular_velocity == expected.angular_velocity
@@ -0,0 +1,52 @@
+"""StreamingStatistics must work with the plots that take a neat.StatisticsReporter."""
+import os
+import random
+
+import neat
+import pytest
+
+import visualize
+from conftest import ROOT_DIR
+from streaming_stats import StreamingStatistics, StatsReader
+
+CHECKPOINT_FILE = os.path.join(ROOT_DIR, 'neat-checkpoint-199')
+GENERATIONS = 5
+
+
+@pytest.fixture(scope='module')
+def population():
+    return neat.Checkpointer.restore_checkpoint(CHECKPOINT_FILE)
+
+
+def record(stats, population):
+    rng = random.Random(0)
+    for generation in range(GENERATIONS):
+        stats.start_generation(generation)
+        for genome in population.population.values():
+            genome.fitness = rng.uniform(-1000.0, 0.0)
+        best = max(population.population.values(), key=lambda g: g.fitness)
+        stats.post_evaluate(population.config, population.population, population.species, best)
+
+
+def test_accessors_cover_recent_generations(population):
+    stats = StreamingStatistics(directory=None, capacity=3)
+    record(stats, population)
+    assert list(stats.generations()['generation']) == [2, 3, 4]
+    assert len(stats.get_fitness_mean()) == len(stats.get_fitness_median()) == 3
+    sizes = stats.get_species_sizes()
+    assert len(sizes) == 3
+    assert all(sum(row) == len(population.population) for row in sizes)
+
+
+def test_plots_accept_reporter_and_reader(population, tmp_path):
+    stats = StreamingStatistics(directory=str(tmp_path / 'stats'))
+    record(stats, population)
+    for statistics in (stats, StatsReader(str(tmp_path / 'stats'))):
+        visualize.plot_stats(statistics, filename=str(tmp_path / 'fitness.svg'))
+        visualize.plot_species(statistics, filename=str(tmp_path / 'speciation.svg'))
+        assert (tmp_path / 'fitness.svg').exists() and (tmp_path / 'speciation.svg').exists()
+        os.remove(str(tmp_path / 'fitness.svg'))
+        os.remove(str(tmp_path / 'speciation.svg'))
+    reader = StatsReader(str(tmp_path / 'stats'))
+    reader.update()
+    assert reader.species_sizes()[2].tolist() == stats.get_species_sizes()
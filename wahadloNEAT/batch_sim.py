@@ -0,0 +1,298 @@
+"""
+Reduced-order analytic model of the cart + double pendulum from odwroconeWahadloModelNN_modul_old.
+
+Instead of pymunk's general rigid-body solver, the system is advanced with its closed-form
+(Lagrangian) equations of motion and a fixed-step integrator. The same code runs on Python floats
+(``odwroconeWahadloModelKx``, a drop-in replacement for the pymunk simulator) and on NumPy arrays
+(``simulate_batch``, the whole population in lockstep).
+
+The integrator is chosen with ``integrator`` in the [Simulation] section of neat-config.txt
+(``integrator_from_config``) and passed to the simulation functions by their callers.
+"""
+import math
+
+import numpy as np
+
+from odwroconeWahadloModelNN_modul_old import (
+    DT, MAX_FORCE, INIT_FORCE, GRAVITY, L1, L2, CART_MASS, ARM1_MASS, ARM2_MASS,
+    SIM_TIME, CART_START_X, TRACK_MIN_X, TRACK_MAX_X, DESIRED_STATES,
+)
+from settings import DEFAULT_CONFIG_PATH, read_section
+
+# Distances from the pivots to the centres of mass of the arms
+A1 = L1 / 2
+A2 = L2 / 2
+# Moments of inertia about the centres of mass (same boxes as moment_for_box in the pymunk model)
+I1 = ARM1_MASS * (10 ** 2 + 100 ** 2) / 12.0
+I2 = ARM2_MASS * (10 ** 2 + 50 ** 2) / 12.0
+# Error scaling used by the pymunk model: positions/velocities of the cart are divided by 100
+ERROR_SCALE = np.array([100.0, 100.0, 1.0, 1.0, 1.0, 1.0])
+# Viscous friction of the pivot joints; stands in for the energy pymunk's iterative constraint
+# solver dissipates (fitted on the energy decay of an uncontrolled episode)
+JOINT_DAMPING = 1000.0
+
+# Constant parts of the mass matrix
+_K1 = ARM1_MASS * A1 + ARM2_MASS * L1
+_K2 = ARM2_MASS * A2
+_K12 = ARM2_MASS * L1 * A2
+_M00 = CART_MASS + ARM1_MASS + ARM2_MASS
+_M11 = ARM1_MASS * A1 ** 2 + I1 + ARM2_MASS * L1 ** 2
+_M22 = ARM2_MASS * A2 ** 2 + I2
+
+
+def accelerations(theta1, theta2, omega1, omega2, force, damping=0.0, cos=np.cos, sin=np.sin):
+    """
+    Evaluate the equations of motion of the cart + double pendulum.
+
+    The generalized coordinates are the cart position x and the body angles of both arms
+    (pymunk convention, 0 = upright). Gravity acts along +y, so the upright position is unstable.
+    The symmetric 3x3 mass matrix is inverted in closed form, so the function works elementwise
+    on Python floats (pass math.cos/math.sin) as well as on arrays of any shape.
+
+    Args:
+        theta1, theta2: Arm angles.
+        omega1, omega2: Arm angular velocities.
+        force: Horizontal force applied to the cart.
+        damping (float): Viscous friction coefficient of both pivot joints.
+        cos, sin: Trigonometric functions matching the argument types.
+
+    Returns:
+        Tuple (x_acc, theta1_acc, theta2_acc).
+    """
+    s1, s2, s12 = sin(theta1), sin(theta2), sin(theta1 - theta2)
+
+    # Mass matrix M(q) = [[a, b, c], [b, d, e], [c, e, f]]
+    a, d, f = _M00, _M11, _M22
+    b = _K1 * cos(theta1)
+    c = _K2 * cos(theta2)
+    e = _K12 * cos(theta1 - theta2)
+
+    # Generalized forces minus Coriolis/centrifugal terms
+    r0 = force + _K1 * s1 * omega1 ** 2 + _K2 * s2 * omega2 ** 2
+    r1 = GRAVITY * _K1 * s1 - _K12 * s12 * omega2 ** 2 - damping * (2 * omega1 - omega2)
+    r2 = GRAVITY * _K2 * s2 + _K12 * s12 * omega1 ** 2 - damping * (omega2 - omega1)
+
+    # M^-1 r via the (symmetric) adjugate
+    c00, c01, c02 = d * f - e * e, c * e - b * f, b * e - c * d
+    c11, c12, c22 = a * f - c * c, b * c - a * e, a * d - b * b
+    det = a * c00 + b * c01 + c * c02
+    return ((c00 * r0 + c01 * r1 + c02 * r2) / det,
+            (c01 * r0 + c11 * r1 + c12 * r2) / det,
+            (c02 * r0 + c12 * r1 + c22 * r2) / det)
+
+
+def semi_implicit_step(state, force, dt, cos=np.cos, sin=np.sin):
+    """
+    Advance the state (x, vx, theta1, omega1, theta2, omega2) by one semi-implicit Euler step
+    (velocities first, as in pymunk).
+    """
+    x, vx, theta1, omega1, theta2, omega2 = state
+    ax, a1, a2 = accelerations(theta1, theta2, omega1, omega2, force, JOINT_DAMPING, cos, sin)
+    vx = vx + ax * dt
+    omega1 = omega1 + a1 * dt
+    omega2 = omega2 + a2 * dt
+    return x + vx * dt, vx, theta1 + omega1 * dt, omega1, theta2 + omega2 * dt, omega2
+
+
+def rk4_step(state, force, dt, cos=np.cos, sin=np.sin):
+    """
+    Advance the state (x, vx, theta1, omega1, theta2, omega2) by one classic Runge-Kutta step,
+    with the force held constant over the step.
+    """
+    def derivative(s):
+        _, vx, theta1, omega1, theta2, omega2 = s
+        ax, a1, a2 = accelerations(theta1, theta2, omega1, omega2, force, JOINT_DAMPING, cos, sin)
+        return vx, ax, omega1, a1, omega2, a2
+
+    k1 = derivative(state)
+    k2 = derivative([s + 0.5 * dt * k for s, k in zip(state, k1)])
+    k3 = derivative([s + 0.5 * dt * k for s, k in zip(state, k2)])
+    k4 = derivative([s + dt * k for s, k in zip(state, k3)])
+    return tuple(s + dt / 6.0 * (p + 2 * q + 2 * r + w) for s, p, q, r, w in zip(state, k1, k2, k3, k4))
+
+
+INTEGRATORS = {
+    'semi_implicit': semi_implicit_step,
+    'rk4': rk4_step,
+}
+
+# Integrator used when none is given explicitly
+DEFAULT_INTEGRATOR = 'semi_implicit'
+
+
+def integrator_from_config(filename=DEFAULT_CONFIG_PATH):
+    """
+    Name of the integrator selected by ``integrator`` in the [Simulation] section.
+
+    Returns:
+        str: Key of INTEGRATORS, DEFAULT_INTEGRATOR if nothing is configured.
+    """
+    integrator = read_section(filename, 'Simulation').get('integrator', DEFAULT_INTEGRATOR).strip()
+    if integrator not in INTEGRATORS:
+        raise ValueError("Unknown integrator {0!r}, expected one of {1}".format(integrator, sorted(INTEGRATORS)))
+    return integrator
+
+
+def _activate_all(nets, error):
+    """Run one control step for every network, returns the first output of each as an (N,) array."""
+    if hasattr(nets, 'activate_batch'):
+        return nets.activate_batch(error)[:, 0]
+    return np.array([net.activate(row)[0] for net, row in zip(nets, error.tolist())])
+
+
+def _take(nets, rows):
+    """Keep only the selected networks (boolean mask)."""
+    if hasattr(nets, 'take'):
+        return nets.take(rows)
+    return [net for net, keep in zip(nets, rows) if keep]
+
+
+def odwroconeWahadloModelKx(net, isVis: bool, termination=None, observer=None, duration=SIM_TIME,
+                            integrator=None):
+    """
+    Analytic-model counterpart of odwroconeWahadloModelNN_modul_old.odwroconeWahadloModelKx.
+
+    Runs the same episode (finite-difference velocities, scaled error as the network input,
+    INIT_FORCE kick, force limits) on Python floats and returns the same value, so the
+    evaluator can load this module as its simulator.
+
+    Args:
+        net: The neural network controlling the cart.
+        isVis (bool): The analytic model has no renderer; visualization needs an observer.
+        termination: Optional termination.TerminationPolicy.
+        observer: Optional observer, ``step(None, state, force)`` is called after every step.
+        duration (float): Length of the episode in seconds, SIM_TIME by default.
+        integrator: Name of the integrator (key of INTEGRATORS), default DEFAULT_INTEGRATOR.
+
+    Returns:
+        List[float]: The cumulative error vector.
+    """
+    if isVis and observer is None:
+        raise ValueError("The analytic model has no renderer, replay the genome with the pymunk simulator")
+    step = INTEGRATORS[integrator or DEFAULT_INTEGRATOR]
+
+    physics = (float(CART_START_X), 0.0, 0.0, 0.0, 0.0, 0.0)
+    previous = (float(CART_START_X), 0.0, 0.0)
+    cumulative_error = [0, 0, 0, 0, 0, 0]
+    elapsed_time = 0
+
+    while True:
+        # Observed state with finite-difference velocities, like the pymunk model
+        cart_x, arm1_angle, arm2_angle = physics[0], physics[2], physics[4]
+        state = (cart_x, (cart_x - previous[0]) / DT,
+                 arm1_angle, (arm1_angle - previous[1]) / DT,
+                 arm2_angle, (arm2_angle - previous[2]) / DT)
+        previous = (cart_x, arm1_angle, arm2_angle)
+
+        error = [(state[i] - DESIRED_STATES[i]) / (100 if i < 2 else 1) for i in range(6)]
+        cumulative_error = [cumulative_error[i] + abs(error[i]) for i in range(6)]
+
+        if termination is not None and termination.should_stop(cart_x, (arm1_angle, arm2_angle), cumulative_error):
+            remaining = termination.remaining_steps(elapsed_time, duration, DT)
+            return termination.charge_remaining(cumulative_error, error, remaining)
+
+        # Neural network control
+        force = 2000 * net.activate(error)[0]
+        force = max(min(force, MAX_FORCE), -MAX_FORCE)
+        if elapsed_time < 0.03:
+            force = INIT_FORCE
+
+        physics = step(physics, force, DT, math.cos, math.sin)
+
+        # Ends of the groove joint: the cart stops dead
+        if not TRACK_MIN_X <= physics[0] <= TRACK_MAX_X:
+            physics = (min(max(physics[0], TRACK_MIN_X), TRACK_MAX_X), 0.0) + tuple(physics[2:])
+
+        if observer is not None and not observer.step(None, state, force):
+            break
+
+        elapsed_time += DT
+        if elapsed_time > duration:
+            break
+
+    return cumulative_error
+
+
+def simulate_batch(nets, duration: float = SIM_TIME, termination=None, integrator=None, initial_angles=None,
+                   kick=INIT_FORCE, desired=DESIRED_STATES):
+    """
+    Simulate the inverted double pendulum for many controllers at once.
+
+    Every controller gets its own cart + pendulum, all of them advance together with the same
+    time step. The episode mirrors odwroconeWahadloModelNN_modul_old.odwroconeWahadloModelKx:
+    finite-difference velocities, scaled error as the network input, the INIT_FORCE kick and
+    force limits.
+
+    Args:
+        nets: Sequence of networks with an ``activate(inputs)`` method, or a
+              compiled_net.BatchNetwork activating all of them in one call.
+        duration (float): Length of the episode in seconds.
+        termination: Optional termination.TerminationPolicy; episodes it stops are dropped from the
+                     batch and charged a penalty for the skipped steps.
+        integrator: Name of the integrator (key of INTEGRATORS), default DEFAULT_INTEGRATOR.
+        initial_angles: Optional pair (theta1, theta2) of start angles, scalars or (N,) arrays;
+                        the arms start at rest (upright by default).
+        kick: Force of the initial perturbation, scalar or (N,) array.
+        desired: Target state, a 6-vector or an (N, 6) array with one target per episode.
+
+    Returns:
+        np.ndarray: Array of shape (N, 6) with the cumulative error vector of every network.
+    """
+    step = INTEGRATORS[integrator or DEFAULT_INTEGRATOR]
+    n = len(nets)
+    theta1, theta2 = (np.zeros(n), np.zeros(n)) if initial_angles is None else (
+        np.broadcast_to(np.asarray(a, dtype=float), (n,)).copy() for a in initial_angles)
+    physics = (np.full(n, float(CART_START_X)), np.zeros(n), theta1, np.zeros(n), theta2, np.zeros(n))
+    desired = np.broadcast_to(np.asarray(desired, dtype=float), (n, 6))
+    kick = np.broadcast_to(np.asarray(kick, dtype=float), (n,))
+
+    prev = np.stack(physics[0::2], axis=1)
+    cumulative_error = np.zeros((n, 6))
+    active = np.arange(n)       # Original indices of the episodes still running
+    elapsed_time = 0
+
+    while True:
+        # Observed state with finite-difference velocities, like the pymunk model
+        current = np.stack(physics[0::2], axis=1)
+        state = np.empty((len(active), 6))
+        state[:, 0::2] = current
+        state[:, 1::2] = (current - prev) / DT
+        prev = current
+
+        error = (state - desired) / ERROR_SCALE
+        cumulative_error[active] += np.abs(error)
+
+        # Early termination: charge the stopped episodes and drop them from the batch
+        if termination is not None:
+            stop = termination.stop_mask(current[:, 0], current[:, 1:], cumulative_error[active])
+            if stop.any():
+                remaining = termination.remaining_steps(elapsed_time, duration, DT)
+                cumulative_error[active[stop]] = termination.charge_remaining(
+                    cumulative_error[active[stop]], error[stop], remaining)
+                keep = ~stop
+                active = active[keep]
+                if not len(active):
+                    break
+                physics = tuple(v[keep] for v in physics)
+                prev, error = prev[keep], error[keep]
+                desired, kick = desired[keep], kick[keep]
+                nets = _take(nets, keep)
+
+        # Neural network control
+        force = np.clip(2000 * _activate_all(nets, error), -MAX_FORCE, MAX_FORCE)
+        if elapsed_time < 0.03:
+            force[:] = kick
+
+        x, vx, theta1, omega1, theta2, omega2 = step(physics, force, DT)
+
+        # Ends of the groove joint: the cart stops dead
+        hit = (x < TRACK_MIN_X) | (x > TRACK_MAX_X)
+        x = np.clip(x, TRACK_MIN_X, TRACK_MAX_X)
+        vx = np.where(hit, 0.0, vx)
+        physics = (x, vx, theta1, omega1, theta2, omega2)
+
+        elapsed_time += DT
+        if elapsed_time > duration:
+            break
+
+    return cumulative_error
@@ -0,0 +1,241 @@
+"""
+Reproducible throughput benchmark of the simulators and the evolution loop.
+
+Measures, with fixed seeds:
+    * steps/s of odwroconeWahadloModelKx of both simulator modules,
+    * genomes/s of EvaluationExecutor.eval_genomes for several population sizes,
+    * resume latency (restore + first generation) of the bundled neat-checkpoint-* files,
+    * bytes per genome (in memory and pickled) of the default and the compact genome storage for
+      large populations copied from the newest checkpoint.
+
+Results are written as JSON; ``--compare`` checks them against an earlier result and exits with
+status 1 if any metric got worse by more than ``--threshold``.
+
+Usage:
+    python benchmark.py --output bench.json
+    python benchmark.py --output new.json --compare bench.json --threshold 0.1
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+
+import neat
+import numpy as np
+
+import odwroconeWahadloModelNN_modul
+import odwroconeWahadloModelNN_modul_old
+from compact_population import memory_per_genome, DEFAULT_POP_SIZES as MEMORY_POP_SIZES
+from compiled_net import CompiledNetwork
+from evaluation import EvaluationExecutor
+from genome_codec import load_genome
+from pruning import Pruner
+from settings import DEFAULT_CONFIG_PATH
+from termination import TerminationPolicy
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_GENOME = os.path.join(ROOT_DIR, 'best_genome.pkl')
+DEFAULT_POP_SIZES = (30, 300, 3000)
+SEED = 12345
+
+
+class StepCounter(object):
+    """Observer counting the simulation steps of an episode."""
+
+    def __init__(self):
+        self.steps = 0
+
+    def step(self, space, state, force):
+        self.steps += 1
+        return True
+
+
+class ConstantController(object):
+    """Controller applying no force; the single-pendulum model takes a 4-element input the genomes do not fit."""
+
+    def activate(self, inputs):
+        return [0.0]
+
+
+def _metric(value, unit, higher_is_better):
+    return {'value': value, 'unit': unit, 'higher_is_better': higher_is_better}
+
+
+def load_config(filename=DEFAULT_CONFIG_PATH):
+    return neat.Config(neat.DefaultGenome, neat.DefaultReproduction,
+                       neat.DefaultSpeciesSet, neat.DefaultStagnation, filename)
+
+
+def bench_simulators(config, genome_file=DEFAULT_GENOME, repeat=3):
+    """
+    Steps per second of one full episode of each simulator module (best of ``repeat``).
+
+    The double-pendulum model runs the genome from ``genome_file``; the single-pendulum model runs
+    a ConstantController.
+    """
+    genome = load_genome(genome_file, config)
+    cases = {
+        'odwroconeWahadloModelNN_modul_old': (odwroconeWahadloModelNN_modul_old, CompiledNetwork.create(genome, config)),
+        'odwroconeWahadloModelNN_modul': (odwroconeWahadloModelNN_modul, ConstantController()),
+    }
+    metrics = {}
+    for name, (module, net) in cases.items():
+        best = 0.0
+        for _ in range(repeat):
+            counter = StepCounter()
+            start = time.perf_counter()
+            module.odwroconeWahadloModelKx(net, False, observer=counter)
+            best = max(best, counter.steps / (time.perf_counter() - start))
+        metrics['steps_per_second.' + name] = _metric(best, 'steps/s', True)
+    return metrics
+
+
+def bench_evaluation(config_file=DEFAULT_CONFIG_PATH, pop_sizes=DEFAULT_POP_SIZES, processes=None):
+    """
+    Genomes per second of EvaluationExecutor.eval_genomes on a seeded initial population of each size.
+
+    The pool is started before timing; termination follows the [Termination] section, no cache.
+    """
+    metrics = {}
+    config = load_config(config_file)
+    with EvaluationExecutor(config, processes=processes, pruner=Pruner.from_config(config_file),
+                            termination=TerminationPolicy.from_config(config_file)) as executor:
+        for pop_size in pop_sizes:
+            config.pop_size = pop_size
+            random.seed(SEED)
+            population = neat.Population(config)
+            genomes = list(population.population.items())
+            start = time.perf_counter()
+            executor.eval_genomes(genomes, config)
+            elapsed = time.perf_counter() - start
+            metrics['genomes_per_second.pop{0}'.format(pop_size)] = _metric(pop_size / elapsed, 'genomes/s', True)
+    return metrics
+
+
+def bench_resume(checkpoints, config_file=DEFAULT_CONFIG_PATH, processes=None):
+    """Seconds to restore each checkpoint and run its first generation."""
+    metrics = {}
+    config = load_config(config_file)
+    with EvaluationExecutor(config, processes=processes, pruner=Pruner.from_config(config_file),
+                            termination=TerminationPolicy.from_config(config_file)) as executor:
+        for checkpoint in checkpoints:
+            start = time.perf_counter()
+            population = neat.Checkpointer.restore_checkpoint(checkpoint)
+            random.seed(SEED)
+            executor.best_fitness = None
+            population.run(executor.eval_genomes, 1)
+            name = 'resume_seconds.' + os.path.basename(checkpoint)
+            metrics[name] = _metric(time.perf_counter() - start, 's', False)
+    return metrics
+
+
+def bench_memory(checkpoint, config_file=DEFAULT_CONFIG_PATH, pop_sizes=MEMORY_POP_SIZES):
+    """Bytes per genome of both genome storages (compact_population.memory_per_genome)."""
+    metrics = {}
+    config = load_config(config_file)
+    if checkpoint is None:
+        random.seed(SEED)
+        templates = list(neat.Population(config).population.values())
+    else:
+        templates = list(neat.Checkpointer.restore_checkpoint(checkpoint).population.values())
+    for storage, pop_size, traced, pickled in memory_per_genome(templates, config, pop_sizes):
+        metrics['bytes_per_genome.{0}.pop{1}'.format(storage, pop_size)] = _metric(traced, 'B', False)
+        metrics['pickled_bytes_per_genome.{0}.pop{1}'.format(storage, pop_size)] = _metric(pickled, 'B', False)
+    return metrics
+
+
+def metadata():
+    """Environment of the run, to tell apart results from different machines or commits."""
+    info = {'python': sys.version.split()[0], 'platform': platform.platform(), 'cpu_count': os.cpu_count(),
+            'numpy': np.__version__, 'seed': SEED}
+    try:
+        import pymunk
+        info['pymunk'] = pymunk.version
+    except (ImportError, AttributeError):
+        pass
+    try:
+        info['commit'] = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT_DIR, capture_output=True,
+                                        text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        pass
+    return info
+
+
+def compare(result, baseline, threshold):
+    """
+    Compare two benchmark results.
+
+    Args:
+        result: New result (dict with 'metrics').
+        baseline: Earlier result.
+        threshold: Allowed relative deterioration, e.g. 0.1 = 10%.
+
+    Returns:
+        List of (metric name, baseline value, new value, relative change, regressed) for every
+        metric present in both results; the change is positive when the metric improved.
+    """
+    rows = []
+    for name, new in sorted(result['metrics'].items()):
+        old = baseline['metrics'].get(name)
+        if old is None or not old['value']:
+            continue
+        change = (new['value'] - old['value']) / old['value']
+        if not new['higher_is_better']:
+            change = -change
+        rows.append((name, old['value'], new['value'], change, change < -threshold))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pendulum simulators and the evolution loop.")
+    parser.add_argument('--config', default=DEFAULT_CONFIG_PATH, help="NEAT configuration file")
+    parser.add_argument('--genome', default=DEFAULT_GENOME, help="Pickled genome for the simulator benchmark")
+    parser.add_argument('--pop-sizes', type=int, nargs='*', default=list(DEFAULT_POP_SIZES))
+    parser.add_argument('--checkpoints', nargs='*', default=None,
+                        help="Checkpoints for the resume benchmark (default: the bundled neat-checkpoint-*)")
+    parser.add_argument('--memory-pop-sizes', type=int, nargs='*', default=list(MEMORY_POP_SIZES),
+                        help="Population sizes of the memory benchmark")
+    parser.add_argument('--processes', type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument('--repeat', type=int, default=3, help="Repetitions of the simulator benchmark")
+    parser.add_argument('--output', help="Write the result to this JSON file")
+    parser.add_argument('--compare', help="Earlier result to check for regressions")
+    parser.add_argument('--threshold', type=float, default=0.1, help="Allowed relative deterioration")
+    args = parser.parse_args()
+
+    checkpoints = args.checkpoints
+    if checkpoints is None:
+        checkpoints = sorted(glob.glob(os.path.join(ROOT_DIR, 'neat-checkpoint-*[0-9]')),
+                             key=lambda name: int(name.rsplit('-', 1)[1]))
+
+    metrics = {}
+    metrics.update(bench_simulators(load_config(args.config), args.genome, args.repeat))
+    metrics.update(bench_evaluation(args.config, args.pop_sizes, args.processes))
+    metrics.update(bench_resume(checkpoints, args.config, args.processes))
+    metrics.update(bench_memory(checkpoints[-1] if checkpoints else None, args.config, args.memory_pop_sizes))
+    result = {'metadata': metadata(), 'metrics': metrics}
+
+    for name, metric in sorted(metrics.items()):
+        print("{0:<55} {1:>14.3f} {2}".format(name, metric['value'], metric['unit']))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        rows = compare(result, baseline, args.threshold)
+        for name, old, new, change, regressed in rows:
+            print("{0:<55} {1:>12.3f} -> {2:>12.3f} {3:+7.1%}{4}".format(
+                name, old, new, change, '  REGRESSION' if regressed else ''))
+        if any(row[4] for row in rows):
+            print("Performance regression beyond {0:.0%}".format(args.threshold))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
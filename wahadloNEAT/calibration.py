@@ -0,0 +1,301 @@
+"""
+Calibration report of the analytic double-pendulum model (batch_sim) against the pymunk model.
+
+Five checks:
+    * open loop: a genome is run on pymunk, the forces it applied are replayed on the analytic
+      model and the two trajectories are compared (RMS deviation per state variable over several
+      horizons, time until the arm angles diverge);
+    * closed loop: every genome of a checkpoint is evaluated on both backends and the rank
+      correlation of the fitness values is reported;
+    * speed: cost of one physics step of each backend;
+    * timing: the pymunk model with the [Simulation] timing (physics/control rates, velocity source)
+      against the original lockstep 1/FPS loop, fitness agreement, trajectory deviation and speedup;
+    * termination: the [Termination] policy against full episodes (rank agreement of the fitness
+      values, rank of the best genome, speedup), to be checked before early termination is enabled.
+
+Usage:
+    python calibration.py --genome ../best_genome.pkl --checkpoint ../neat-checkpoint-1799 --json report.json
+    python calibration.py --checkpoint ../neat-checkpoint-1799 --timing
+    python calibration.py --checkpoint ../neat-checkpoint-1799 --termination
+"""
+import argparse
+import json
+import math
+import time
+
+import neat
+import numpy as np
+
+import batch_sim
+import odwroconeWahadloModelNN_modul_old as pymunk_model
+from compiled_net import CompiledNetwork
+from fitness import fitness_from_errors
+from genome_codec import load_genome
+from settings import DEFAULT_CONFIG_PATH, read_section
+from termination import TerminationPolicy
+from trajectory import TrajectoryRecorder
+
+STATE_NAMES = ('cart_x', 'cart_vx', 'arm1_angle', 'arm1_angular_velocity', 'arm2_angle', 'arm2_angular_velocity')
+HORIZONS = (0.5, 2.0, 10.0, pymunk_model.SIM_TIME)
+# Angle deviation (radians) at which the trajectories count as diverged
+DIVERGENCE_ANGLE = 0.1
+
+
+def replay_forces(forces, integrator=None):
+    """
+    Drive the analytic model with a recorded force sequence.
+
+    Args:
+        forces: Force applied to the cart at every step.
+        integrator: Name of the batch_sim integrator, default batch_sim.DEFAULT_INTEGRATOR.
+
+    Returns:
+        np.ndarray: Observed states (finite-difference velocities) of shape (steps, 6).
+    """
+    step = batch_sim.INTEGRATORS[integrator or batch_sim.DEFAULT_INTEGRATOR]
+    dt = pymunk_model.DT
+    physics = (float(pymunk_model.CART_START_X), 0.0, 0.0, 0.0, 0.0, 0.0)
+    previous = physics[0::2]
+    states = []
+    for force in forces:
+        current = physics[0::2]
+        states.append((current[0], (current[0] - previous[0]) / dt,
+                       current[1], (current[1] - previous[1]) / dt,
+                       current[2], (current[2] - previous[2]) / dt))
+        previous = current
+        physics = step(physics, force, dt, math.cos, math.sin)
+        if not pymunk_model.TRACK_MIN_X <= physics[0] <= pymunk_model.TRACK_MAX_X:
+            x = min(max(physics[0], pymunk_model.TRACK_MIN_X), pymunk_model.TRACK_MAX_X)
+            physics = (x, 0.0) + tuple(physics[2:])
+    return np.array(states)
+
+
+def open_loop_report(net, integrator=None):
+    """
+    Compare the pymunk trajectory of a controller with the analytic replay of its forces.
+
+    Returns:
+        dict: RMS deviation per state variable for every horizon and the divergence time (s).
+    """
+    recorder = TrajectoryRecorder()
+    pymunk_model.odwroconeWahadloModelKx(net, False, observer=recorder)
+    reference = np.array(recorder.states)
+    deviation = replay_forces(recorder.forces, integrator) - reference
+
+    rms = {}
+    for horizon in HORIZONS:
+        steps = min(len(deviation), int(round(horizon / pymunk_model.DT)))
+        values = np.sqrt(np.mean(deviation[:steps] ** 2, axis=0))
+        rms['{0:g}s'.format(horizon)] = dict(zip(STATE_NAMES, values.tolist()))
+
+    diverged = np.flatnonzero(np.max(np.abs(deviation[:, [2, 4]]), axis=1) > DIVERGENCE_ANGLE)
+    divergence_time = float(diverged[0] * pymunk_model.DT) if len(diverged) else None
+    return {'steps': len(deviation), 'rms': rms, 'divergence_time': divergence_time}
+
+
+def _ranks(values):
+    """Ranks 0..n-1 of the values (ties broken by order)."""
+    ranks = np.empty(len(values))
+    ranks[np.argsort(values, kind='stable')] = np.arange(len(values))
+    return ranks
+
+
+def _ranking_agreement(reference, other):
+    """Spearman rank correlation and top-10% overlap of two fitness arrays."""
+    rank_correlation = float(np.corrcoef(_ranks(reference), _ranks(other))[0, 1])
+    top = max(1, len(reference) // 10)
+    overlap = len(set(np.argsort(-reference)[:top]) & set(np.argsort(-other)[:top])) / top
+    return {'rank_correlation': rank_correlation, 'top10_overlap': overlap}
+
+
+def closed_loop_report(genomes, config, integrator=None):
+    """
+    Evaluate genomes on both backends and compare the fitness rankings.
+
+    Returns:
+        dict: Spearman rank correlation, top-10% overlap and the evaluation times.
+    """
+    nets = [CompiledNetwork.create(genome, config) for genome in genomes]
+
+    start = time.perf_counter()
+    reference = np.array([fitness_from_errors(pymunk_model.odwroconeWahadloModelKx(net, False)) for net in nets])
+    pymunk_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    surrogate = fitness_from_errors(batch_sim.simulate_batch(nets, integrator=integrator))
+    analytic_time = time.perf_counter() - start
+
+    report = {'genomes': len(genomes)}
+    report.update(_ranking_agreement(reference, surrogate))
+    report.update(pymunk_seconds=pymunk_time, analytic_seconds=analytic_time)
+    return report
+
+
+def timing_report(genomes, config, timing, reference=None):
+    """
+    Compare the pymunk model under ``timing`` with the original lockstep loop.
+
+    Args:
+        genomes: Genomes evaluated with both timings; the best one (reference fitness) is also
+                 compared step by step.
+        config: NEAT configuration object.
+        timing: pymunk_model.SimulationTiming to check (e.g. the [Simulation] timing).
+        reference: Timing of the reference runs, default pymunk_model.LEGACY_TIMING.
+
+    Returns:
+        dict: Fitness agreement (rank correlation, top-10% overlap, relative deviation), RMS
+              deviation of the best genome's trajectory per horizon, divergence time and speedup.
+    """
+    reference = reference or pymunk_model.LEGACY_TIMING
+    nets = [CompiledNetwork.create(genome, config) for genome in genomes]
+
+    fitness, seconds = [], []
+    for t in (reference, timing):
+        start = time.perf_counter()
+        fitness.append(np.array([fitness_from_errors(pymunk_model.odwroconeWahadloModelKx(net, False, timing=t))
+                                 for net in nets]))
+        seconds.append(time.perf_counter() - start)
+    deviation = np.abs(fitness[1] - fitness[0]) / np.abs(fitness[0])
+    report = {'timing': repr(timing), 'reference': repr(reference), 'genomes': len(genomes)}
+    report.update(_ranking_agreement(fitness[0], fitness[1]))
+    report.update(median_fitness_deviation=float(np.median(deviation)), max_fitness_deviation=float(deviation.max()),
+                  reference_seconds=seconds[0], timing_seconds=seconds[1], speedup=seconds[0] / seconds[1])
+
+    # Trajectory of the best genome, the checked timing interpolated onto the reference steps
+    best = nets[int(np.argmax(fitness[0]))]
+    rows = []
+    for t in (reference, timing):
+        recorder = TrajectoryRecorder(dt=t.control_dt)
+        pymunk_model.odwroconeWahadloModelKx(best, False, observer=recorder, timing=t)
+        rows.append(recorder.array())
+    times = rows[0][:, 0]
+    deviation = np.column_stack([np.interp(times, rows[1][:, 0], rows[1][:, column]) for column in range(1, 7)]) \
+        - rows[0][:, 1:7]
+    rms = {}
+    for horizon in HORIZONS:
+        steps = min(len(deviation), int(round(horizon / reference.control_dt)))
+        values = np.sqrt(np.mean(deviation[:steps] ** 2, axis=0))
+        rms['{0:g}s'.format(horizon)] = dict(zip(STATE_NAMES, values.tolist()))
+    diverged = np.flatnonzero(np.max(np.abs(deviation[:, [2, 4]]), axis=1) > DIVERGENCE_ANGLE)
+    report.update(rms=rms, divergence_time=float(times[diverged[0]]) if len(diverged) else None)
+    return report
+
+
+def termination_report(genomes, config, policy, timing=None):
+    """
+    Compare the fitness of genomes under an early termination policy with full episodes.
+
+    The error budget is derived from the best full-episode fitness, as it is once the run has
+    found that genome.
+
+    Args:
+        genomes: Genomes to evaluate.
+        config: NEAT configuration object.
+        policy: termination.TerminationPolicy to check.
+        timing: pymunk_model.SimulationTiming of both runs, default LEGACY_TIMING.
+
+    Returns:
+        dict: Rank agreement (rank correlation, top-10% overlap), top-5 overlap, rank of the
+              full-episode best genome under the policy (0 = still the best), speedup.
+    """
+    nets = [CompiledNetwork.create(genome, config) for genome in genomes]
+    start = time.perf_counter()
+    reference = np.array([fitness_from_errors(pymunk_model.odwroconeWahadloModelKx(net, False, timing=timing))
+                          for net in nets])
+    reference_seconds = time.perf_counter() - start
+
+    policy = policy.with_budget(float(reference.max()))
+    start = time.perf_counter()
+    terminated = np.array([fitness_from_errors(pymunk_model.odwroconeWahadloModelKx(net, False, policy, timing=timing))
+                           for net in nets])
+    terminated_seconds = time.perf_counter() - start
+
+    top = min(5, len(genomes))
+    report = {'genomes': len(genomes)}
+    report.update(_ranking_agreement(reference, terminated))
+    report.update(top5_overlap=len(set(np.argsort(-reference)[:top]) & set(np.argsort(-terminated)[:top])) / top,
+                  best_genome_rank=int(_ranks(-terminated)[int(np.argmax(reference))]),
+                  reference_seconds=reference_seconds, terminated_seconds=terminated_seconds,
+                  speedup=reference_seconds / terminated_seconds)
+    return report
+
+
+def step_cost_report(steps=20000, batch_size=1000):
+    """
+    Time one physics step of every backend.
+
+    Returns:
+        dict: Microseconds per step of pymunk's ``space.step``, the scalar analytic integrators and
+              the batched analytic integrators (per pendulum).
+    """
+    dt = pymunk_model.DT
+    context = pymunk_model.get_context()
+    context.reset()
+    start = time.perf_counter()
+    for k in range(steps):
+        context.cart_body.apply_force_at_world_point((100.0 if k % 2 else -100.0, 0), context.cart_body.position)
+        context.space.step(dt)
+    report = {'pymunk': (time.perf_counter() - start) / steps * 1e6}
+
+    for name, step in batch_sim.INTEGRATORS.items():
+        physics = (float(pymunk_model.CART_START_X), 0.0, 0.01, 0.0, 0.0, 0.0)
+        start = time.perf_counter()
+        for k in range(steps):
+            physics = step(physics, 100.0 if k % 2 else -100.0, dt, math.cos, math.sin)
+        report['analytic_' + name] = (time.perf_counter() - start) / steps * 1e6
+
+        physics = (np.full(batch_size, float(pymunk_model.CART_START_X)), np.zeros(batch_size),
+                   np.full(batch_size, 0.01), np.zeros(batch_size), np.zeros(batch_size), np.zeros(batch_size))
+        force = np.full(batch_size, 100.0)
+        batch_steps = max(1, steps // 100)
+        start = time.perf_counter()
+        for _ in range(batch_steps):
+            physics = step(physics, force, dt)
+        report['analytic_{0}_batched'.format(name)] = (time.perf_counter() - start) / (batch_steps * batch_size) * 1e6
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calibrate the analytic pendulum model against pymunk.")
+    parser.add_argument('--config', default=DEFAULT_CONFIG_PATH, help="NEAT configuration file")
+    parser.add_argument('--genome', help="Saved genome for the open-loop comparison")
+    parser.add_argument('--checkpoint', help="Checkpoint whose population is used for the rank correlation")
+    parser.add_argument('--integrator', choices=sorted(batch_sim.INTEGRATORS), default=None,
+                        help="Integrator of the analytic model (default: the [Simulation] integrator)")
+    parser.add_argument('--timing', action='store_true',
+                        help="Compare the [Simulation] timing with the original loop on the checkpoint's genomes")
+    parser.add_argument('--termination', action='store_true',
+                        help="Compare the [Termination] policy (enabled or not) with full episodes on the checkpoint's genomes")
+    parser.add_argument('--json', help="Write the report to this file")
+    args = parser.parse_args()
+
+    config = neat.Config(neat.DefaultGenome, neat.DefaultReproduction,
+                         neat.DefaultSpeciesSet, neat.DefaultStagnation, args.config)
+    args.integrator = args.integrator or batch_sim.integrator_from_config(args.config)
+    report = {'integrator': args.integrator, 'step_cost_us': step_cost_report()}
+    if args.genome:
+        genome = load_genome(args.genome, config)
+        report['open_loop'] = open_loop_report(CompiledNetwork.create(genome, config), args.integrator)
+    if args.checkpoint:
+        population = neat.Checkpointer.restore_checkpoint(args.checkpoint)
+        report['closed_loop'] = closed_loop_report(list(population.population.values()), config, args.integrator)
+        timing = pymunk_model.SimulationTiming.from_config(args.config)
+        if args.timing:
+            report['timing'] = timing_report(list(population.population.values()), config, timing)
+        if args.termination:
+            params = read_section(args.config, 'Termination')
+            params['enabled'] = 'true'
+            policy = TerminationPolicy.from_params(params)
+            report['termination'] = termination_report(list(population.population.values()), config, policy,
+                                                       timing)
+    elif args.timing or args.termination:
+        parser.error("--timing and --termination need --checkpoint")
+
+    print(json.dumps(report, indent=2))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,350 @@
+"""
+Append-only, incremental checkpoint log.
+
+Instead of pickling the whole population every few hundred generations, ``CheckpointLog`` appends
+a small record after every generation:
+
+    * the genomes that were not logged yet (new children; elites are only referenced by key),
+    * the population keys and the fitness of every member,
+    * species membership and bookkeeping (representative, created, last_improved, fitness history),
+    * the state of ``random`` and the fitness cache entries added during the generation.
+
+The log is split into segments; every segment starts with a full snapshot (compaction), so a
+restore reads one snapshot plus at most ``snapshot_interval`` small deltas. Segments are named
+``<prefix><generation>-<sequence>.ckptlog`` after the generation of their snapshot and a sequence
+number counting the segments written under the prefix. A run resumed from an older generation starts
+new segments instead of overwriting the ones of the abandoned branch, and "newest" is the most
+recently written segment, not the one with the highest generation.
+
+Every record is framed with its length and CRC32 and flushed (and optionally fsync'ed) on write; a
+record torn by a crash is ignored on restore.
+"""
+import copy
+import glob
+import os
+import pickle
+import random
+import re
+import struct
+import time
+import zlib
+from itertools import count
+
+import neat
+from neat.reporting import BaseReporter, ReporterSet
+from neat.species import Species
+
+from fitness_cache import FitnessCache
+from settings import DEFAULT_CONFIG_PATH, read_section, get_bool, get_int
+
+LOG_SUFFIX = '.ckptlog'
+MAGIC = b'NEATLOG1'
+_FRAME = struct.Struct('<II')   # Payload length, CRC32 of the payload
+
+
+def _write_record(f, record):
+    payload = zlib.compress(pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL), 1)
+    f.write(_FRAME.pack(len(payload), zlib.crc32(payload)) + payload)
+
+
+def _read_records(filename):
+    """Yield the records of a segment, stopping at the first incomplete or corrupted one."""
+    with open(filename, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError("{0} is not a checkpoint log".format(filename))
+        while True:
+            header = f.read(_FRAME.size)
+            if len(header) < _FRAME.size:
+                return
+            length, crc = _FRAME.unpack(header)
+            payload = f.read(length)
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                print("Ignoring a damaged record at the end of {0}".format(filename))
+                return
+            yield pickle.loads(zlib.decompress(payload))
+
+
+def _next_node_key(config, genomes):
+    """
+    Start of the node indexer on restore: one past the largest node key of the logged genomes
+    (None while neat has not created the indexer, it then starts from a genome's keys itself).
+    """
+    if config.genome_config.node_indexer is None:
+        return None
+    keys = [max(genome.nodes) for genome in genomes if genome.nodes]
+    return max(keys) + 1 if keys else None
+
+
+def is_checkpoint_log(filename):
+    """True if the file is a checkpoint log segment (and not a neat.Checkpointer pickle)."""
+    with open(filename, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def list_segments(filename_prefix):
+    """
+    Find the segments of a log.
+
+    Segments named without a sequence number (``<prefix><generation>.ckptlog``, written before
+    sequence numbers were added) sort first, by generation.
+
+    Returns:
+        List of (sequence, snapshot generation, filename) tuples in the order they were written.
+    """
+    pattern = re.compile(re.escape(os.path.basename(filename_prefix)) + r'(\d+)(?:-(\d+))?' +
+                         re.escape(LOG_SUFFIX) + '$')
+    segments = []
+    for filename in glob.glob(glob.escape(filename_prefix) + '*' + LOG_SUFFIX):
+        match = pattern.match(os.path.basename(filename))
+        if match:
+            segments.append((int(match.group(2) or 0), int(match.group(1)), filename))
+    return sorted(segments)
+
+
+def _prefix_of(filename):
+    """Log prefix of a segment file name, e.g. 'neat-log-' for 'neat-log-150-3.ckptlog'."""
+    return re.sub(r'\d+(-\d+)?' + re.escape(LOG_SUFFIX) + '$', '', filename)
+
+
+class CheckpointLog(BaseReporter):
+    """
+    Reporter writing the checkpoint log; use instead of neat.Checkpointer.
+
+        cache = FitnessCache()
+        p.add_reporter(CheckpointLog(cache))
+    """
+
+    def __init__(self, cache=None, filename_prefix='neat-log-', snapshot_interval=50, keep_segments=None,
+                 fsync=True):
+        """
+        Args:
+            cache: Optional fitness_cache.FitnessCache stored with the population.
+            filename_prefix: Prefix of the segment files.
+            snapshot_interval: Generations between full snapshots (start of a new segment).
+            keep_segments: Number of newest segments kept on disk, None keeps all of them.
+            fsync: Force every record to disk (durable against power loss, not only process crashes).
+        """
+        self.cache = cache
+        self.filename_prefix = filename_prefix
+        self.snapshot_interval = snapshot_interval
+        self.keep_segments = keep_segments
+        self.fsync = fsync
+
+        self.current_generation = None
+        self.file = None
+        self.segment_generation = None
+        self.logged = set()             # Genome keys stored in the current segment
+        self.next_genome_key = 1
+        self.next_species_key = 1
+        self.last_write_seconds = None
+
+    @classmethod
+    def from_config(cls, cache=None, filename=DEFAULT_CONFIG_PATH):
+        """Build the reporter from the [CheckpointLog] section of a NEAT configuration file."""
+        params = read_section(filename, 'CheckpointLog')
+        return cls(cache,
+                   filename_prefix=params.get('filename_prefix', 'neat-log-').strip(),
+                   snapshot_interval=get_int(params, 'snapshot_interval', 50),
+                   keep_segments=get_int(params, 'keep_segments', None),
+                   fsync=get_bool(params, 'fsync', True))
+
+    def __getstate__(self):
+        # The species set keeps a reference to all reporters, do not pickle the open segment
+        state = dict(self.__dict__)
+        state['file'] = None
+        return state
+
+    def start_generation(self, generation):
+        self.current_generation = generation
+
+    def end_generation(self, config, population, species_set):
+        start = time.perf_counter()
+        generation = self.current_generation
+        self.next_genome_key = max(self.next_genome_key, max(population) + 1)
+        self.next_species_key = max([self.next_species_key] + [k + 1 for k in species_set.species])
+
+        if self.file is None or generation - self.segment_generation >= self.snapshot_interval:
+            self.write_snapshot(config, population, species_set, generation)
+        else:
+            self.write_delta(config, population, species_set, generation)
+        self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
+        self.last_write_seconds = time.perf_counter() - start
+
+    def write_snapshot(self, config, population, species_set, generation):
+        """Start a new segment with the full state (same content as a neat.Checkpointer pickle)."""
+        self.close()
+        sequence = max([s[0] for s in list_segments(self.filename_prefix)], default=0) + 1
+        filename = '{0}{1}-{2}{3}'.format(self.filename_prefix, generation, sequence, LOG_SUFFIX)
+        print("Saving checkpoint snapshot to {0}".format(filename))
+        # Exclusive create: an existing segment is never truncated
+        self.file = open(filename, 'xb')
+        self.file.write(MAGIC)
+        self.segment_generation = generation
+        # The reporters may hold unpicklable objects (files, worker pools) and the species indexer
+        # is stored as a number, so a stripped copy of the species set is pickled
+        species_set = copy.copy(species_set)
+        species_set.reporters = ReporterSet()
+        species_set.indexer = None
+        cache_entries = None
+        if self.cache is not None:
+            self.cache.drain_journal()
+            cache_entries = (self.cache.maxsize, list(self.cache.entries.items()))
+        _write_record(self.file, {
+            'type': 'snapshot', 'generation': generation, 'config': config, 'population': population,
+            'species_set': species_set, 'random_state': random.getstate(), 'cache': cache_entries,
+            'next_genome_key': self.next_genome_key, 'next_species_key': self.next_species_key,
+        })
+        self.logged = set(population) | {s.representative.key for s in species_set.species.values()}
+        self.remove_old_segments()
+
+    def write_delta(self, config, population, species_set, generation):
+        """Append the changes since the previous record."""
+        species = []
+        referenced = set(population)
+        for s in species_set.species.values():
+            referenced.add(s.representative.key)
+            species.append((s.key, s.created, s.last_improved, s.representative.key, list(s.members),
+                            s.fitness, s.adjusted_fitness, s.fitness_history))
+        genomes = {}
+        for key in referenced - self.logged:
+            genomes[key] = population[key] if key in population else self._representative(species_set, key)
+
+        _write_record(self.file, {
+            'type': 'delta', 'generation': generation, 'genomes': genomes,
+            'fitness': {key: genome.fitness for key, genome in population.items()},
+            'species': species, 'random_state': random.getstate(),
+            'cache': self.cache.drain_journal() if self.cache is not None else None,
+            'next_genome_key': self.next_genome_key, 'next_species_key': self.next_species_key,
+            'next_node_key': _next_node_key(config, list(population.values()) +
+                                            [s.representative for s in species_set.species.values()]),
+        })
+        self.logged = referenced
+
+    @staticmethod
+    def _representative(species_set, key):
+        for s in species_set.species.values():
+            if s.representative.key == key:
+                return s.representative
+
+    def remove_old_segments(self):
+        if self.keep_segments is None:
+            return
+        segments = list_segments(self.filename_prefix)
+        for _, _, filename in segments[:-self.keep_segments]:
+            os.remove(filename)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    @staticmethod
+    def generations(filename_prefix):
+        """All generations that can be restored from a log, sorted."""
+        found = set()
+        for _, _, filename in list_segments(filename_prefix):
+            found.update(record['generation'] for record in _read_records(filename))
+        return sorted(found)
+
+    @staticmethod
+    def restore(filename, generation=None):
+        """
+        Restore a population from a log.
+
+        Args:
+            filename: A segment file or the log's filename prefix.
+            generation: Generation to restore, None for the last generation of the most recently
+                written segment. A generation logged by several branches (after a resume from an
+                older generation) is restored from the most recently written one.
+
+        Returns:
+            Tuple (neat.Population, FitnessCache).
+        """
+        prefix = _prefix_of(filename) if filename.endswith(LOG_SUFFIX) else filename
+        segments = list_segments(prefix)
+        if generation is not None:
+            segments = [s for s in segments if s[1] <= generation]
+        if not segments:
+            raise ValueError("No checkpoint log segment for {0} (generation {1})".format(prefix, generation))
+
+        for _, _, segment in reversed(segments):
+            state = None
+            for record in _read_records(segment):
+                if generation is not None and record['generation'] > generation:
+                    break
+                state = _apply(state, record)
+            if state is not None and (generation is None or state['generation'] == generation):
+                break
+        else:
+            raise ValueError("Generation {0} is not in the checkpoint log".format(generation))
+
+        random.setstate(state['random_state'])
+        population = neat.Population(state['config'], (state['population'], state['species_set'],
+                                                       state['generation']))
+        population.species.reporters = population.reporters
+        population.reproduction.genome_indexer = count(state['next_genome_key'])
+        return population, state['cache']
+
+
+def _apply(state, record):
+    """Apply one log record to the restore state (a dict, None before the snapshot)."""
+    if record['type'] == 'snapshot':
+        maxsize, items = record['cache'] or (10000, [])
+        cache = FitnessCache(maxsize)
+        cache.entries.update(items)
+        record['species_set'].indexer = count(record['next_species_key'])
+        return {'generation': record['generation'], 'config': record['config'],
+                'population': record['population'], 'species_set': record['species_set'],
+                'random_state': record['random_state'], 'cache': cache,
+                'next_genome_key': record['next_genome_key']}
+
+    known = dict(state['population'])
+    for s in state['species_set'].species.values():
+        known[s.representative.key] = s.representative
+    known.update(record['genomes'])
+
+    population = {}
+    for key, fitness in record['fitness'].items():
+        genome = known[key]
+        genome.fitness = fitness
+        population[key] = genome
+
+    species_set = state['species_set']
+    species_set.species = {}
+    species_set.genome_to_species = {}
+    for key, created, last_improved, representative, members, fitness, adjusted, history in record['species']:
+        s = Species(key, created)
+        s.last_improved = last_improved
+        s.update(known[representative], {k: population[k] for k in members})
+        s.fitness, s.adjusted_fitness, s.fitness_history = fitness, adjusted, history
+        species_set.species[key] = s
+        species_set.genome_to_species.update((k, key) for k in members)
+    species_set.indexer = count(record['next_species_key'])
+    if record['next_node_key'] is not None:
+        state['config'].genome_config.node_indexer = count(record['next_node_key'])
+
+    for key, fitness in record['cache'] or ():
+        state['cache'].put(key, fitness)
+
+    state.update(generation=record['generation'], population=population, random_state=record['random_state'],
+                 next_genome_key=record['next_genome_key'])
+    return state
+
+
+def restore(filename, generation=None):
+    """
+    Restore a population from a checkpoint log or a neat.Checkpointer file.
+
+    Args:
+        filename: Log segment / log prefix, or a neat-checkpoint-* file (restored with an empty
+            fitness cache).
+        generation: Generation to restore from a log, None for the newest one.
+
+    Returns:
+        Tuple (neat.Population, FitnessCache).
+    """
+    if os.path.isfile(filename) and not is_checkpoint_log(filename):
+        return neat.Checkpointer.restore_checkpoint(filename), FitnessCache()
+    return CheckpointLog.restore(filename, generation)
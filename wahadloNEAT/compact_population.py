@@ -0,0 +1,255 @@
+"""
+Large-population scaling mode: memory-compact genome storage.
+
+A neat.DefaultGenome keeps its genes as DefaultNodeGene/DefaultConnectionGene instances with an
+attribute ``__dict__`` each and is pickled with the attribute names of every gene; at 5,000-50,000
+genomes this object overhead adds up in the memory of the population and in every checkpoint.
+With ``genome_storage = compact`` in the [Evolution] section:
+
+    * the genes are ``CompactNodeGene``/``CompactConnectionGene``, ``__slots__`` classes with
+      neat's gene methods (same attributes, mutation, crossover and random number draws, so a
+      seeded run evolves the same genomes as with the default genes);
+    * the genomes are ``CompactGenome``, a DefaultGenome pickled in the array encoding of
+      genome_codec (checkpoints, deep copies) with the function names interned on load;
+    * ``CompactPopulation`` is a neat.Population creating its genomes with these classes;
+      ``compact_population`` converts an existing (e.g. restored) population in place;
+    * the reproduction's ``ancestors`` map, which neat never shrinks, is cut down to the living
+      population after every generation (``AncestryTrimmer``).
+
+``memory_per_genome`` (``python compact_population.py``, also part of benchmark.py) reports the
+traced and pickled bytes per genome of both storages at several population sizes.
+
+    python compact_population.py --pop-sizes 5000 50000
+"""
+import argparse
+import gc
+import glob
+import os
+import pickle
+import sys
+import tracemalloc
+
+import neat
+from neat.genes import BaseGene, DefaultNodeGene, DefaultConnectionGene
+from neat.genome import DefaultGenome
+from neat.reporting import BaseReporter
+
+from genome_codec import encode, decode, decode_view
+from settings import DEFAULT_CONFIG_PATH, read_section
+
+GENOME_STORAGE = ('default', 'compact')
+DEFAULT_POP_SIZES = (5000, 50000)
+
+
+def genome_storage_from_config(filename=DEFAULT_CONFIG_PATH):
+    """
+    The ``genome_storage`` option of the [Evolution] section.
+
+    Returns:
+        str: 'default' (neat's gene classes, the default) or 'compact'.
+    """
+    storage = read_section(filename, 'Evolution').get('genome_storage', 'default').strip().lower()
+    if storage not in GENOME_STORAGE:
+        raise ValueError("Unknown genome_storage {0!r}, expected one of {1}".format(storage, ', '.join(GENOME_STORAGE)))
+    return storage
+
+
+def population_type_from_config(filename=DEFAULT_CONFIG_PATH):
+    """Population class for ``genome_storage``: CompactPopulation or neat.Population."""
+    if genome_storage_from_config(filename) == 'compact':
+        return CompactPopulation
+    return neat.Population
+
+
+class CompactGene(object):
+    """Base of the ``__slots__`` genes; the methods are neat's BaseGene ones."""
+
+    __slots__ = ('key',)
+
+    __str__ = BaseGene.__str__
+    __lt__ = BaseGene.__lt__
+    parse_config = BaseGene.__dict__['parse_config']
+    get_config_params = BaseGene.__dict__['get_config_params']
+    init_attributes = BaseGene.init_attributes
+    mutate = BaseGene.mutate
+    copy = BaseGene.copy
+    crossover = BaseGene.crossover
+
+    def __reduce__(self):
+        # Key and attribute values only, no attribute names per gene
+        return _restore_gene, (self.__class__, self.key) + tuple(getattr(self, name) for name in self.__slots__)
+
+
+class CompactNodeGene(CompactGene):
+    """DefaultNodeGene with slots (bias, response, activation, aggregation)."""
+
+    __slots__ = ('bias', 'response', 'activation', 'aggregation')
+    _gene_attributes = DefaultNodeGene._gene_attributes
+    distance = DefaultNodeGene.distance
+
+    def __init__(self, key):
+        assert isinstance(key, int), "CompactNodeGene key must be an int, not {!r}".format(key)
+        self.key = key
+
+
+class CompactConnectionGene(CompactGene):
+    """DefaultConnectionGene with slots (weight, enabled)."""
+
+    __slots__ = ('weight', 'enabled')
+    _gene_attributes = DefaultConnectionGene._gene_attributes
+    distance = DefaultConnectionGene.distance
+
+    def __init__(self, key):
+        assert isinstance(key, tuple), "CompactConnectionGene key must be a tuple, not {!r}".format(key)
+        self.key = key
+
+
+def _restore_gene(gene_type, key, *values):
+    gene = gene_type(key)
+    for name, value in zip(gene_type.__slots__, values):
+        setattr(gene, name, value)
+    return gene
+
+
+class CompactGenome(DefaultGenome):
+    """DefaultGenome pickled as its genome_codec encoding (plus any extra attributes, e.g. ``errors``)."""
+
+    def __reduce__(self):
+        state = {name: value for name, value in self.__dict__.items()
+                 if name not in ('key', 'fitness', 'nodes', 'connections')}
+        return _restore_genome, (encode(self), state)
+
+
+def _restore_genome(data, state):
+    view = decode_view(data)
+    genome = CompactGenome(view.key)
+    genome.fitness = view.fitness
+    for key, node in view.nodes.items():
+        genome.nodes[key] = _restore_gene(CompactNodeGene, key, node.bias, node.response,
+                                          sys.intern(node.activation), sys.intern(node.aggregation))
+    for key, connection in view.connections.items():
+        genome.connections[key] = _restore_gene(CompactConnectionGene, key, connection.weight, connection.enabled)
+    genome.__dict__.update(state)
+    return genome
+
+
+def use_compact_storage(config):
+    """Make a neat.Config create compact genomes and genes (in place, the genome options are the same)."""
+    config.genome_type = CompactGenome
+    config.genome_config.node_gene_type = CompactNodeGene
+    config.genome_config.connection_gene_type = CompactConnectionGene
+
+
+def compact_genome(genome):
+    """Turn a DefaultGenome into a CompactGenome with compact genes (in place, keeps its identity)."""
+    if type(genome) is DefaultGenome:
+        # CompactGenome only adds methods, the instance layout is the same
+        genome.__class__ = CompactGenome
+    for genes, gene_type in ((genome.nodes, CompactNodeGene), (genome.connections, CompactConnectionGene)):
+        for key, gene in genes.items():
+            if not isinstance(gene, CompactGene):
+                genes[key] = _restore_gene(gene_type, key, *[getattr(gene, name) for name in gene_type.__slots__])
+
+
+class AncestryTrimmer(BaseReporter):
+    """Keeps the ancestors map of the reproduction to the members of the current population."""
+
+    def __init__(self, reproduction):
+        self.reproduction = reproduction
+
+    def end_generation(self, config, population, species_set):
+        ancestors = self.reproduction.ancestors
+        # A new dict: deleting keys would not give the memory of a large dict back
+        self.reproduction.ancestors = {key: ancestors[key] for key in population if key in ancestors}
+
+
+def compact_population(population):
+    """
+    Switch a neat.Population to compact genome storage: its config creates compact genomes from
+    now on, the genomes of the population, the species and the best genome are converted in
+    place and an AncestryTrimmer is added.
+
+    Returns:
+        The same population.
+    """
+    use_compact_storage(population.config)
+    genomes = list(population.population.values())
+    for s in population.species.species.values():
+        genomes.extend(s.members.values())
+        if s.representative is not None:
+            genomes.append(s.representative)
+    if population.best_genome is not None:
+        genomes.append(population.best_genome)
+    for genome in genomes:
+        compact_genome(genome)
+    if not any(isinstance(r, AncestryTrimmer) for r in population.reporters.reporters):
+        population.add_reporter(AncestryTrimmer(population.reproduction))
+    return population
+
+
+class CompactPopulation(neat.Population):
+    """neat.Population with compact genome storage (see the module docstring); same constructor and API."""
+
+    def __init__(self, config, initial_state=None):
+        use_compact_storage(config)
+        super(CompactPopulation, self).__init__(config, initial_state)
+        compact_population(self)
+
+
+def memory_per_genome(templates, config, pop_sizes=DEFAULT_POP_SIZES):
+    """
+    Memory of populations built from template genomes, in both storages.
+
+    Every population holds ``pop_size`` independent copies of the templates (round robin, fresh
+    gene and value objects as after decoding or mutation).
+
+    Args:
+        templates: Genomes to copy.
+        config: neat.Config with neat's default gene types.
+        pop_sizes: Population sizes to measure.
+
+    Returns:
+        List of (storage, pop_size, traced bytes per genome, pickled bytes per genome).
+    """
+    encoded = [encode(genome) for genome in templates]
+    compact_config = pickle.loads(pickle.dumps(config))
+    use_compact_storage(compact_config)
+    rows = []
+    for storage, storage_config in (('default', config), ('compact', compact_config)):
+        for pop_size in pop_sizes:
+            gc.collect()
+            tracemalloc.start()
+            start = tracemalloc.get_traced_memory()[0]
+            population = {key: decode(encoded[key % len(encoded)], storage_config) for key in range(pop_size)}
+            traced = tracemalloc.get_traced_memory()[0] - start
+            tracemalloc.stop()
+            pickled = len(pickle.dumps(population, protocol=pickle.HIGHEST_PROTOCOL))
+            rows.append((storage, pop_size, traced / pop_size, pickled / pop_size))
+            del population
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bytes per genome of the default and the compact genome storage.")
+    parser.add_argument('--pop-sizes', type=int, nargs='*', default=list(DEFAULT_POP_SIZES))
+    parser.add_argument('--checkpoint', help="neat-checkpoint-* whose genomes are copied (default: the newest "
+                                             "bundled one)")
+    parser.add_argument('--config', default=DEFAULT_CONFIG_PATH, help="NEAT configuration file.")
+    args = parser.parse_args()
+
+    checkpoint = args.checkpoint
+    if checkpoint is None:
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        checkpoint = max(glob.glob(os.path.join(root, 'neat-checkpoint-*[0-9]')),
+                         key=lambda name: int(name.rsplit('-', 1)[1]))
+    config = neat.Config(neat.DefaultGenome, neat.DefaultReproduction,
+                         neat.DefaultSpeciesSet, neat.DefaultStagnation, args.config)
+    templates = list(neat.Checkpointer.restore_checkpoint(checkpoint).population.values())
+
+    print("{0:<8} {1:>9} {2:>15} {3:>15}".format('storage', 'genomes', 'bytes/genome', 'pickled/genome'))
+    for storage, pop_size, traced, pickled in memory_per_genome(templates, config, args.pop_sizes):
+        print("{0:<8} {1:>9} {2:>15.0f} {3:>15.0f}".format(storage, pop_size, traced, pickled))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,284 @@
+"""
+Feed-forward NEAT networks compiled into layered NumPy weight matrices.
+
+CompiledNetwork is a drop-in replacement for neat.nn.FeedForwardNetwork (same ``activate``),
+BatchNetwork packs many genomes into padded tensors so the whole population is activated
+with one call per control step.
+"""
+from collections import namedtuple
+
+import numpy as np
+from neat.graphs import feed_forward_layers
+
+# Everything a network is built from, independent of the genome object (see compile_plan)
+NetworkPlan = namedtuple('NetworkPlan', 'slots layers')
+
+
+def _sigmoid(z):
+    return 1.0 / (1.0 + np.exp(-np.clip(5.0 * z, -60.0, 60.0)))
+
+
+def _tanh(z):
+    return np.tanh(np.clip(2.5 * z, -60.0, 60.0))
+
+
+def _relu(z):
+    return np.where(z > 0.0, z, 0.0)
+
+
+def _cube(z):
+    return z ** 3
+
+
+def _identity(z):
+    return z
+
+
+def _clamped(z):
+    return np.clip(z, -1.0, 1.0)
+
+
+def _sin(z):
+    return np.sin(np.clip(5.0 * z, -60.0, 60.0))
+
+
+def _gauss(z):
+    return np.exp(-5.0 * np.clip(z, -3.4, 3.4) ** 2)
+
+
+def _abs(z):
+    return np.abs(z)
+
+
+def _square(z):
+    return z ** 2
+
+
+# Vectorized counterparts of neat.activations, indexed by activation id
+ACTIVATIONS = {
+    'sigmoid': _sigmoid,
+    'tanh': _tanh,
+    'relu': _relu,
+    'cube': _cube,
+    'identity': _identity,
+    'clamped': _clamped,
+    'sin': _sin,
+    'gauss': _gauss,
+    'abs': _abs,
+    'square': _square,
+}
+ACTIVATION_NAMES = list(ACTIVATIONS)
+ACTIVATION_IDS = {name: i for i, name in enumerate(ACTIVATION_NAMES)}
+_ACTIVATION_FUNCS = [ACTIVATIONS[name] for name in ACTIVATION_NAMES]
+
+
+def compile_plan(genome, config):
+    """
+    Analyse a genome and lay its expressed nodes out in evaluation order.
+
+    Returns:
+        NetworkPlan (slots, layers): ``slots`` maps node keys to value-vector indices (inputs
+        first, then outputs, then hidden nodes), ``layers`` is a list of lists of
+        (node_key, [(input_key, weight), ...], bias, response, activation) in the same order
+        FeedForwardNetwork uses.
+    """
+    genome_config = config.genome_config
+    connections = [cg.key for cg in genome.connections.values() if cg.enabled]
+    layers = feed_forward_layers(genome_config.input_keys, genome_config.output_keys, connections)
+
+    slots = {key: i for i, key in enumerate(genome_config.input_keys + genome_config.output_keys)}
+    compiled = []
+    for layer in layers:
+        nodes = []
+        for node in layer:
+            ng = genome.nodes[node]
+            if ng.aggregation != 'sum':
+                raise ValueError("Unsupported aggregation function: {0!r}".format(ng.aggregation))
+            if ng.activation not in ACTIVATION_IDS:
+                raise ValueError("Unsupported activation function: {0!r}".format(ng.activation))
+            slots.setdefault(node, len(slots))
+            links = [(i, genome.connections[(i, o)].weight) for (i, o) in connections if o == node]
+            nodes.append((node, links, ng.bias, ng.response, ng.activation))
+        compiled.append(nodes)
+    return NetworkPlan(slots, compiled)
+
+
+def _generate_activate(config, plan):
+    """
+    Generate a straight-line Python function evaluating one input vector.
+
+    The expressions use neat's own activation functions and sum the links in the same order
+    as FeedForwardNetwork, so the results are bit-for-bit identical to it.
+    """
+    genome_config = config.genome_config
+    slots = plan.slots
+    namespace = {'_activation_{0}'.format(name): genome_config.activation_defs.get(name)
+                 for name in ACTIVATION_NAMES if genome_config.activation_defs.is_valid(name)}
+    num_inputs = len(genome_config.input_keys)
+
+    lines = ['def activate(inputs):',
+             '    if len(inputs) != {0}:'.format(num_inputs),
+             '        raise RuntimeError("Expected {0:n} inputs, got {1:n}".format(%d, len(inputs)))' % num_inputs,
+             '    v = [0.0] * {0}'.format(len(slots)),
+             '    v[:{0}] = inputs'.format(num_inputs)]
+    for nodes in plan.layers:
+        for node, links, bias, response, activation in nodes:
+            s = ' + '.join('v[{0}] * {1!r}'.format(slots[i], w) for i, w in links) or '0.0'
+            lines.append('    v[{0}] = _activation_{1}({2!r} + {3!r} * ({4}))'.format(
+                slots[node], activation, bias, response, s))
+    lines.append('    return [{0}]'.format(', '.join('v[{0}]'.format(slots[k]) for k in genome_config.output_keys)))
+
+    exec(compile('\n'.join(lines), '<compiled network>', 'exec'), namespace)
+    return namespace['activate']
+
+
+class CompiledNetwork(object):
+    """Single feed-forward network: generated scalar code for ``activate``, layer matrices for ``activate_batch``."""
+
+    def __init__(self, num_inputs, output_slots, num_slots, layers, activate):
+        self.num_inputs = num_inputs
+        self.output_slots = np.asarray(output_slots, dtype=int)
+        self.num_slots = num_slots
+        # layers: list of (target slots, weights (k, num_slots), bias, response, [(activation, mask)])
+        self.layers = layers
+        # Same interface as neat.nn.FeedForwardNetwork.activate: list in, list out
+        self.activate = activate
+
+    def activate_batch(self, inputs):
+        """
+        Activate the network for many input vectors at once.
+
+        Args:
+            inputs: Array of shape (B, num_inputs).
+
+        Returns:
+            np.ndarray: Array of shape (B, num_outputs).
+        """
+        values = np.zeros((inputs.shape[0], self.num_slots))
+        values[:, :self.num_inputs] = inputs
+        for slots, weights, bias, response, groups in self.layers:
+            z = bias + response * (values @ weights.T)
+            for func, mask in groups:
+                z[:, mask] = func(z[:, mask])
+            values[:, slots] = z
+        return values[:, self.output_slots]
+
+    @staticmethod
+    def create(genome, config):
+        """Receives a genome and returns its compiled phenotype."""
+        return CompiledNetwork.from_plan(compile_plan(genome, config), config)
+
+    @staticmethod
+    def from_plan(plan, config):
+        """Build the network of a NetworkPlan (see compile_plan)."""
+        genome_config = config.genome_config
+        slots = plan.slots
+        num_slots = len(slots)
+
+        layers = []
+        for nodes in plan.layers:
+            weights = np.zeros((len(nodes), num_slots))
+            bias = np.empty(len(nodes))
+            response = np.empty(len(nodes))
+            act_ids = np.empty(len(nodes), dtype=int)
+            for k, (node, links, node_bias, node_response, activation) in enumerate(nodes):
+                for i, w in links:
+                    weights[k, slots[i]] += w
+                bias[k] = node_bias
+                response[k] = node_response
+                act_ids[k] = ACTIVATION_IDS[activation]
+            groups = [(_ACTIVATION_FUNCS[a], act_ids == a) for a in np.unique(act_ids)]
+            target = np.array([slots[node] for node, _, _, _, _ in nodes], dtype=int)
+            layers.append((target, weights, bias, response, groups))
+
+        output_slots = [slots[k] for k in genome_config.output_keys]
+        activate = _generate_activate(config, plan)
+        return CompiledNetwork(len(genome_config.input_keys), output_slots, num_slots, layers, activate)
+
+
+class BatchNetwork(object):
+    """
+    Many feed-forward networks packed into padded tensors.
+
+    Layer ``l`` of genome ``n`` is stored in ``weights[l, n]`` (K x T); missing nodes and layers are
+    padding that writes into a scratch slot (index T) which no weight ever reads.
+    """
+
+    def __init__(self, num_inputs, num_outputs, weights, bias, response, act_ids, targets):
+        self.num_inputs = num_inputs
+        self.num_outputs = num_outputs
+        self.weights = weights      # (L, N, K, T + 1)
+        self.bias = bias            # (L, N, K)
+        self.response = response    # (L, N, K)
+        self.act_ids = act_ids      # (L, N, K)
+        self.targets = targets      # (L, N, K)
+        self.num_slots = weights.shape[-1]
+        # Flat indices of the nodes using each activation function, per layer
+        self.groups = [[(_ACTIVATION_FUNCS[a], np.flatnonzero(ids == a)) for a in np.unique(ids)]
+                       for ids in act_ids]
+
+    def __len__(self):
+        return self.weights.shape[1]
+
+    def take(self, rows):
+        """Return a BatchNetwork with only the selected genomes (index array or boolean mask)."""
+        return BatchNetwork(self.num_inputs, self.num_outputs, self.weights[:, rows], self.bias[:, rows],
+                            self.response[:, rows], self.act_ids[:, rows], self.targets[:, rows])
+
+    def activate_batch(self, inputs):
+        """
+        Activate every network on its own input vector.
+
+        Args:
+            inputs: Array of shape (N, num_inputs), row n is fed to network n.
+
+        Returns:
+            np.ndarray: Array of shape (N, num_outputs).
+        """
+        n = inputs.shape[0]
+        rows = np.arange(n)[:, None]
+        values = np.zeros((n, self.num_slots))
+        values[:, :self.num_inputs] = inputs
+        for weights, bias, response, targets, groups in zip(self.weights, self.bias, self.response,
+                                                             self.targets, self.groups):
+            z = bias + response * np.matmul(weights, values[:, :, None])[:, :, 0]
+            flat = z.reshape(-1)
+            for func, index in groups:
+                flat[index] = func(flat[index])
+            values[rows, targets] = z
+        return values[:, self.num_inputs:self.num_inputs + self.num_outputs]
+
+    @staticmethod
+    def create(genomes, config):
+        """Receives a sequence of genomes and packs all their phenotypes into one BatchNetwork."""
+        return BatchNetwork.from_plans([compile_plan(genome, config) for genome in genomes], config)
+
+    @staticmethod
+    def from_plans(plans, config):
+        """Pack the networks of a sequence of NetworkPlans (see compile_plan)."""
+        genome_config = config.genome_config
+        num_inputs = len(genome_config.input_keys)
+        num_outputs = len(genome_config.output_keys)
+
+        num_layers = max([len(layers) for _, layers in plans] + [1])
+        width = max([len(nodes) for _, layers in plans for nodes in layers] + [1])
+        scratch = max(len(slots) for slots, _ in plans)
+
+        shape = (num_layers, len(plans), width)
+        weights = np.zeros(shape + (scratch + 1,))
+        bias = np.zeros(shape)
+        response = np.zeros(shape)
+        act_ids = np.full(shape, ACTIVATION_IDS['identity'], dtype=int)
+        targets = np.full(shape, scratch, dtype=int)
+
+        for n, (slots, layers) in enumerate(plans):
+            for l, nodes in enumerate(layers):
+                for k, (node, links, node_bias, node_response, activation) in enumerate(nodes):
+                    for i, w in links:
+                        weights[l, n, k, slots[i]] += w
+                    bias[l, n, k] = node_bias
+                    response[l, n, k] = node_response
+                    act_ids[l, n, k] = ACTIVATION_IDS[activation]
+                    targets[l, n, k] = slots[node]
+
+        return BatchNetwork(num_inputs, num_outputs, weights, bias, response, act_ids, targets)
@@ -0,0 +1,533 @@
+"""
+Evaluation service: simulation workers as separate local processes.
+
+EvaluationExecutor ties the simulation to a multiprocessing.Pool owned by the process running the
+evolution. ``EvaluationService`` is a drop-in executor that listens on a TCP socket (localhost by
+default) instead, and streams genome batches to any number of workers started separately:
+
+    python eval_service.py worker --count 4
+
+Workers can be started before the run or at any point during it, and may leave again:
+
+    * every worker holds at most ``max_in_flight`` batches; more are sent only as results come
+      back and after the socket has drained (backpressure);
+    * a batch not answered within ``task_timeout`` seconds, or held by a worker that disconnects,
+      is queued again; after ``max_attempts`` dispatches its genomes count as failed evaluations;
+    * the throughput of every worker is kept in ``service.workers`` and printed after each batch.
+
+Wire format: a 4-byte little-endian length and a pickle per message. A connecting worker and the
+service first answer each other's HMAC challenge over the ``authkey``, so neither side unpickles
+anything from a peer that does not know the key; the worker then gets the NEAT config, the
+simulator with its options and the scenario set once. There is no default key: it comes from the
+``authkey`` option or the ``WAHADLO_AUTHKEY`` environment variable. A batch is the same
+list of (genome_id, encoded genome) payloads the pool workers get, evaluated by the same
+functions of ``evaluation``.
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import os
+import pickle
+import socket
+import struct
+import threading
+import time
+from itertools import count
+from multiprocessing import Process
+
+from evaluation import (EvaluationExecutor, DEFAULT_SIMULATOR, _init_worker, _evaluate_errors, _evaluate_profiled,
+                        _evaluate_scenarios)
+from genome_codec import encode
+from profiling import payload_cost
+from settings import DEFAULT_CONFIG_PATH, read_section, get_bool, get_int, get_float
+
+_LENGTH = struct.Struct('<I')
+_NONCE_SIZE = 16
+AUTHKEY_ENV = 'WAHADLO_AUTHKEY'
+# Timings of a genome whose batch was given up (same keys as the worker timings)
+_NO_TIMINGS = {'create_net': 0.0, 'episode': 0.0, 'activate': 0.0, 'steps': 0, 'physics': None,
+               'network_hits': 0}
+
+
+def executor_from_config(config, filename=DEFAULT_CONFIG_PATH, **kwargs):
+    """
+    EvaluationService if the [EvaluationService] section enables it, an EvaluationExecutor otherwise.
+
+    Args:
+        config: NEAT configuration object.
+        filename: Configuration file with the [EvaluationService] section.
+        **kwargs: Options of EvaluationExecutor (simulator, termination, cache, ...).
+    """
+    params = read_section(filename, 'EvaluationService')
+    if not get_bool(params, 'enabled', False):
+        return EvaluationExecutor(config, **kwargs)
+    kwargs.pop('processes', None)
+    kwargs.pop('chunksize', None)
+    return EvaluationService(config, **dict(service_options(params), **kwargs))
+
+
+def service_options(params):
+    """Keyword arguments of EvaluationService from the items of an [EvaluationService] section."""
+    return {
+        'host': params.get('host', '127.0.0.1').strip(),
+        'port': get_int(params, 'port', 8765),
+        'authkey': params.get('authkey', '').strip() or None,
+        'chunksize': get_int(params, 'chunksize', 10),
+        'max_in_flight': get_int(params, 'max_in_flight', 2),
+        'task_timeout': get_float(params, 'task_timeout', 120.0),
+        'max_attempts': get_int(params, 'max_attempts', 3),
+    }
+
+
+def resolve_authkey(authkey=None):
+    """
+    The shared secret as bytes: ``authkey`` if given, else the WAHADLO_AUTHKEY environment variable.
+
+    Raises:
+        ValueError: If neither is set.
+    """
+    authkey = authkey or os.environ.get(AUTHKEY_ENV)
+    if not authkey:
+        raise ValueError("The evaluation service needs an authkey: set authkey in the [EvaluationService] "
+                         "section or the {0} environment variable".format(AUTHKEY_ENV))
+    return authkey.encode('utf-8') if isinstance(authkey, str) else authkey
+
+
+def _digest(authkey, role, nonce):
+    # The role keeps an answer of one side from being replayed as the answer of the other
+    return hmac.new(authkey, role + nonce, hashlib.sha256).digest()
+
+
+async def send_message(writer, message):
+    """Write one message and wait until the transport has room again; returns the bytes sent."""
+    data = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+    writer.write(_LENGTH.pack(len(data)) + data)
+    await writer.drain()
+    return _LENGTH.size + len(data)
+
+
+async def receive_message(reader):
+    """Read one message; returns (message, bytes received)."""
+    size, = _LENGTH.unpack(await reader.readexactly(_LENGTH.size))
+    return pickle.loads(await reader.readexactly(size)), _LENGTH.size + size
+
+
+class WorkerStats(object):
+    """Counters of one connected (or departed) worker."""
+
+    def __init__(self, name):
+        self.name = name
+        self.connected = True
+        self.joined = time.time()
+        self.batches = 0
+        self.genomes = 0
+        self.seconds = 0.0          # Evaluation time reported by the worker
+        self.requeued = 0           # Batches taken away from it (timeout or disconnect)
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    @property
+    def throughput(self):
+        """Genomes per second of evaluation time."""
+        return self.genomes / self.seconds if self.seconds > 0 else 0.0
+
+    def __repr__(self):
+        return '{0}: {1} genomes in {2} batches, {3:.1f} genomes/s, {4} requeued{5}'.format(
+            self.name, self.genomes, self.batches, self.throughput, self.requeued,
+            '' if self.connected else ' (left)')
+
+
+class _Task(object):
+    """One batch of payloads and the bookkeeping of its dispatches."""
+
+    def __init__(self, task_id, batch, payloads):
+        self.task_id = task_id
+        self.batch = batch
+        self.payloads = payloads
+        self.attempts = 0
+        self.done = False
+
+
+class _Batch(object):
+    """All tasks of one ``map_errors`` call."""
+
+    def __init__(self, termination, duration, mode, remaining, future):
+        self.termination = termination
+        self.duration = duration
+        self.mode = mode
+        self.remaining = remaining
+        self.results = []
+        self.future = future
+
+
+class EvaluationService(EvaluationExecutor):
+    """
+    EvaluationExecutor whose simulations run on remote workers (see the module docstring).
+
+        with EvaluationService(config, port=8765) as service:
+            winner = p.run(service.eval_genomes, generations)
+
+    Genome lookups, caching, termination budgets and profiling are those of EvaluationExecutor;
+    only ``map_errors`` goes over the network. Trajectory recording runs in this process.
+    """
+
+    def __init__(self, config, simulator=DEFAULT_SIMULATOR, host='127.0.0.1', port=8765, authkey=None,
+                 chunksize=10, max_in_flight=2, task_timeout=120.0, max_attempts=3, termination=None, cache=None,
+                 profiler=None, scenarios=None, keep_errors=False, simulation_options=None, pruner=None):
+        """
+        Args:
+            config: NEAT configuration object, sent to every worker when it joins.
+            simulator: Name of the module providing ``odwroconeWahadloModelKx``.
+            host, port: Address to listen on (port 0 picks a free port, see ``address``).
+            authkey: Shared secret the service and the workers prove to each other, None to read it
+                from the WAHADLO_AUTHKEY environment variable (ValueError if that is unset too).
+            chunksize: Genomes per batch.
+            max_in_flight: Batches a worker may hold at once.
+            task_timeout: Seconds before an unanswered batch is given to another worker, None to wait forever.
+            max_attempts: Dispatches of a batch before its genomes are counted as failed.
+            termination, cache, profiler, scenarios, keep_errors, simulation_options, pruner: As
+                for EvaluationExecutor.
+        """
+        super(EvaluationService, self).__init__(config, simulator, processes=0, chunksize=chunksize,
+                                                termination=termination, cache=cache, profiler=profiler,
+                                                scenarios=scenarios, keep_errors=keep_errors,
+                                                simulation_options=simulation_options, pruner=pruner)
+        self.host = host
+        self.port = port
+        self.authkey = resolve_authkey(authkey)
+        self.max_in_flight = max_in_flight
+        self.task_timeout = task_timeout
+        self.max_attempts = max_attempts
+        self.address = None
+        self.workers = {}           # Worker name -> WorkerStats, departed workers included
+        self._loop = None
+        self._thread = None
+        self._server = None
+        self._queue = None
+        self._sessions = {}         # Worker name -> {task id: [task, deadline or None once requeued]}
+        self._connections = {}      # Session task -> stream writer of every open connection
+        self._task_ids = count()
+
+    def start(self):
+        if self._loop is None:
+            # Trajectories are still recorded in this process
+            _init_worker(self.config, self.simulator, self.scenarios, self.simulation_options, self.pruner)
+            self._loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self._loop.run_forever, name='evaluation-service', daemon=True)
+            self._thread.start()
+            asyncio.run_coroutine_threadsafe(self._listen(), self._loop).result()
+            print("Evaluation service listening on {0}:{1}".format(*self.address))
+        return self
+
+    def close(self):
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._loop = None
+
+    async def _listen(self):
+        self._queue = asyncio.Queue()
+        self._server = await asyncio.start_server(self._serve_worker, self.host, self.port)
+        self.address = self._server.sockets[0].getsockname()[:2]
+        if self.task_timeout is not None:
+            asyncio.ensure_future(self._watch())
+
+    async def _shutdown(self):
+        self._server.close()
+        # Closing the connections ends the sessions and the workers
+        sessions = list(self._connections)
+        for writer in self._connections.values():
+            writer.close()
+        await asyncio.gather(*sessions, return_exceptions=True)
+        tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self._server.wait_closed()
+
+    def connected(self):
+        """Names of the workers connected now."""
+        return [name for name, stats in self.workers.items() if stats.connected]
+
+    def _unique_name(self, name):
+        if name not in self.workers:
+            return name
+        for i in count(2):
+            candidate = '{0}#{1}'.format(name, i)
+            if candidate not in self.workers:
+                return candidate
+
+    async def _serve_worker(self, reader, writer):
+        """Connection of one worker: handshake, then results in, batches out (``_feed``)."""
+        connection = asyncio.current_task()
+        self._connections[connection] = writer
+        try:
+            stats = await self._handshake(reader, writer)
+            if stats is not None:
+                await self._session(stats, reader, writer)
+        finally:
+            del self._connections[connection]
+            writer.close()
+
+    async def _handshake(self, reader, writer):
+        """
+        Check the worker's authkey, prove ours and send it the evaluation setup; returns its
+        WorkerStats or None.
+        """
+        nonce = os.urandom(_NONCE_SIZE)
+        try:
+            writer.write(nonce)
+            await writer.drain()
+            answer = await asyncio.wait_for(reader.readexactly(hashlib.sha256().digest_size + _NONCE_SIZE), 10.0)
+            answer, worker_nonce = answer[:-_NONCE_SIZE], answer[-_NONCE_SIZE:]
+            if not hmac.compare_digest(answer, _digest(self.authkey, b'worker', nonce)):
+                print("Evaluation worker at {0} rejected: wrong authkey".format(writer.get_extra_info('peername')))
+                return None
+            writer.write(_digest(self.authkey, b'service', worker_nonce))
+            hello, _ = await receive_message(reader)
+            stats = WorkerStats(self._unique_name(hello.get('name') or str(writer.get_extra_info('peername'))))
+            stats.bytes_sent += await send_message(writer, {'config': self.config, 'simulator': self.simulator,
+                                                            'scenarios': self.scenarios,
+                                                            'simulation_options': self.simulation_options,
+                                                            'pruner': self.pruner})
+            return stats
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+            return None
+
+    async def _session(self, stats, reader, writer):
+        self.workers[stats.name] = stats
+        in_flight = self._sessions[stats.name] = {}
+        credits = asyncio.Semaphore(self.max_in_flight)
+        print("Evaluation worker {0} joined ({1} connected)".format(stats.name, len(self.connected())))
+        feeder = asyncio.ensure_future(self._feed(writer, credits, in_flight, stats))
+        try:
+            while True:
+                message, size = await receive_message(reader)
+                stats.bytes_received += size
+                entry = in_flight.pop(message['task'], None)
+                if entry is not None:
+                    credits.release()
+                    self._complete(entry[0], message['results'])
+                stats.batches += 1
+                stats.genomes += len(message['results'])
+                stats.seconds += message['seconds']
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            feeder.cancel()
+            stats.connected = False
+            del self._sessions[stats.name]
+            for task, deadline in in_flight.values():
+                if deadline is not None:
+                    stats.requeued += 1
+                    self._retry(task)
+            print("Evaluation worker {0} left ({1} connected)".format(stats.name, len(self.connected())))
+
+    async def _feed(self, writer, credits, in_flight, stats):
+        """Send queued batches to one worker while it has credit."""
+        try:
+            while True:
+                await credits.acquire()
+                task = await self._queue.get()
+                if task.done:
+                    credits.release()
+                    continue
+                task.attempts += 1
+                deadline = None if self.task_timeout is None else self._loop.time() + self.task_timeout
+                in_flight[task.task_id] = [task, deadline]
+                batch = task.batch
+                stats.bytes_sent += await send_message(writer, {
+                    'task': task.task_id, 'payloads': task.payloads, 'mode': batch.mode,
+                    'termination': batch.termination, 'duration': batch.duration})
+        except ConnectionError:
+            writer.close()
+
+    async def _watch(self):
+        """Requeue batches whose worker did not answer in time (the worker keeps its credit)."""
+        while True:
+            await asyncio.sleep(min(1.0, self.task_timeout / 4))
+            now = self._loop.time()
+            for name, in_flight in list(self._sessions.items()):
+                for entry in in_flight.values():
+                    task, deadline = entry
+                    if deadline is not None and now > deadline and not task.done:
+                        entry[1] = None
+                        self.workers[name].requeued += 1
+                        self._retry(task)
+
+    def _retry(self, task):
+        if task.done:
+            return
+        if task.attempts >= self.max_attempts:
+            print("Giving up on a batch of {0} genomes after {1} attempts".format(len(task.payloads), task.attempts))
+            self._complete(task, [(genome_id, None, _NO_TIMINGS) for genome_id, _ in task.payloads])
+        else:
+            self._queue.put_nowait(task)
+
+    def _complete(self, task, results):
+        """Take the first result of a task (a late duplicate from a requeue is dropped)."""
+        if task.done:
+            return
+        task.done = True
+        batch = task.batch
+        batch.results.extend(results)
+        batch.remaining -= 1
+        if batch.remaining == 0 and not batch.future.done():
+            batch.future.set_result(batch.results)
+
+    async def _evaluate(self, chunks, termination, duration, mode):
+        batch = _Batch(termination, duration, mode, len(chunks), self._loop.create_future())
+        for chunk in chunks:
+            self._queue.put_nowait(_Task(next(self._task_ids), batch, chunk))
+        if not self.connected():
+            print("Waiting for evaluation workers on {0}:{1}".format(*self.address))
+        return await batch.future
+
+    def map_errors(self, genomes, termination=None, duration=None):
+        """
+        Simulate genomes on the connected workers (waits for one if there is none).
+
+        Same arguments and result as EvaluationExecutor.map_errors.
+        """
+        self.start()
+        if not genomes:
+            return {}
+        if self.scenarios is not None:
+            mode = 'scenarios'
+        else:
+            mode = 'errors' if self.profiler is None else 'profiled'
+        start = time.perf_counter()
+        payloads = [(genome_id, encode(genome)) for genome_id, genome in genomes]
+        encoding = time.perf_counter() - start
+        chunks = [payloads[i:i + self.chunksize] for i in range(0, len(payloads), self.chunksize)]
+
+        start = time.perf_counter()
+        results = asyncio.run_coroutine_threadsafe(self._evaluate(chunks, termination, duration, mode),
+                                                   self._loop).result()
+        if self.profiler is not None:
+            pickling_seconds, payload_bytes = payload_cost(payloads)
+            self.profiler.record_evaluation([timings for _, _, timings in results], time.perf_counter() - start,
+                                            max(1, len(self.connected())), encoding + pickling_seconds, payload_bytes)
+        print("Workers: {0}".format('; '.join(repr(self.workers[name]) for name in self.connected()) or 'none'))
+        return {genome_id: sE for genome_id, sE, _ in results}
+
+
+def _run_task(message):
+    """Evaluate one batch in a worker; returns (genome ID, error vector or None, timings or None) triples."""
+    payloads, termination, duration = message['payloads'], message['termination'], message['duration']
+    if message['mode'] == 'scenarios':
+        return _evaluate_scenarios(payloads, termination, duration)
+    if message['mode'] == 'profiled':
+        return [_evaluate_profiled(payload, termination, duration) for payload in payloads]
+    return [_evaluate_errors(payload, termination, duration) + (None,) for payload in payloads]
+
+
+async def run_worker(host, port, authkey=None, name=None):
+    """
+    Connect to an EvaluationService and evaluate its batches until it closes the connection.
+
+    Args:
+        authkey: Shared secret, None to read it from the WAHADLO_AUTHKEY environment variable.
+
+    Returns:
+        int: Number of batches evaluated.
+
+    Raises:
+        PermissionError: If the service rejects our authkey or cannot prove its own.
+    """
+    authkey = resolve_authkey(authkey)
+    reader, writer = await asyncio.open_connection(host, port)
+    batches = 0
+    try:
+        nonce = await reader.readexactly(_NONCE_SIZE)
+        own_nonce = os.urandom(_NONCE_SIZE)
+        writer.write(_digest(authkey, b'worker', nonce) + own_nonce)
+        try:
+            answer = await reader.readexactly(hashlib.sha256().digest_size)
+        except asyncio.IncompleteReadError:
+            raise PermissionError("Connection closed by the evaluation service (wrong authkey?)")
+        # Nothing from the service is unpickled before it has proven the key
+        if not hmac.compare_digest(answer, _digest(authkey, b'service', own_nonce)):
+            raise PermissionError("The evaluation service at {0}:{1} did not prove the authkey".format(host, port))
+        await send_message(writer, {'name': name or '{0}-{1}'.format(socket.gethostname(), os.getpid())})
+        setup, _ = await receive_message(reader)
+        _init_worker(setup['config'], setup['simulator'], setup['scenarios'], setup['simulation_options'],
+                     setup['pruner'])
+        while True:
+            try:
+                message, _ = await receive_message(reader)
+            except asyncio.IncompleteReadError:
+                return batches
+            start = time.perf_counter()
+            results = _run_task(message)
+            await send_message(writer, {'task': message['task'], 'results': results,
+                                        'seconds': time.perf_counter() - start})
+            batches += 1
+    finally:
+        writer.close()
+
+
+def worker_main(host, port, authkey=None, name=None, retry=None):
+    """
+    Run one worker process; with ``retry`` (seconds) keep reconnecting when the service is not
+    reachable or goes away, so workers can be started before the evolution.
+    """
+    while True:
+        try:
+            batches = asyncio.run(run_worker(host, port, authkey, name))
+            print("Evaluation service closed the connection after {0} batches".format(batches))
+        except PermissionError:
+            raise
+        except OSError as e:
+            if retry is None:
+                raise
+            print("Evaluation service at {0}:{1} not reachable ({2})".format(host, port, e))
+        if retry is None:
+            return
+        time.sleep(retry)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluation workers for an EvaluationService.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    worker = subparsers.add_parser('worker', help="Start workers connecting to the service.")
+    worker.add_argument('--config', default=DEFAULT_CONFIG_PATH,
+                        help="NEAT configuration file with the [EvaluationService] section.")
+    worker.add_argument('--host', help="Address of the service (default from the configuration).")
+    worker.add_argument('--port', type=int, help="Port of the service (default from the configuration).")
+    worker.add_argument('--count', type=int, default=1, help="Number of worker processes.")
+    worker.add_argument('--name', help="Worker name prefix (default host name and process ID).")
+    worker.add_argument('--retry', type=float, default=None,
+                        help="Seconds between reconnection attempts; without it workers exit with the service.")
+    args = parser.parse_args()
+
+    options = service_options(read_section(args.config, 'EvaluationService'))
+    # Fail before starting any process if no key is set
+    resolve_authkey(options['authkey'])
+    host = args.host or options['host']
+    port = args.port or options['port']
+    if args.name is None or args.count == 1:
+        names = [args.name] * args.count
+    else:
+        names = ['{0}-{1}'.format(args.name, i) for i in range(args.count)]
+    if args.count == 1:
+        worker_main(host, port, options['authkey'], names[0], args.retry)
+        return
+    processes = [Process(target=worker_main, args=(host, port, options['authkey'], name, args.retry))
+                 for name in names]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,478 @@
+"""
+Long-lived multiprocessing executor for genome evaluation.
+
+The pool is created once for the whole ``Population.run``; every worker receives the NEAT config
+and imports the simulator module a single time in its initializer, after that only
+``(genome_id, data)`` pairs are sent over the pipe, ``data`` being the genome in the compact
+genome_codec encoding (the workers decode it into a GenomeView, never into neat gene objects).
+Networks are built by the worker's network_cache.NetworkFactory, so genomes a worker has seen
+before (elites, re-evaluated genomes) are not compiled again.
+"""
+import importlib
+import os
+import sys
+import time
+from functools import partial
+from multiprocessing import Pool
+
+from fitness import FAILED_FITNESS, fitness_from_errors
+from fitness_cache import genome_hash, context_hash
+from genome_codec import encode, decode_view
+from network_cache import shared_factory
+from profiling import TimedNetwork, step_timer, payload_cost
+from settings import DEFAULT_CONFIG_PATH, read_section
+
+DEFAULT_SIMULATOR = 'odwroconeWahadloModelNN_modul_old'
+# Simulator module of every physics backend selectable in the [Simulation] section
+BACKENDS = {
+    'pymunk': DEFAULT_SIMULATOR,
+    'analytic': 'batch_sim',
+}
+
+# Per-worker state, filled in once by _init_worker
+_config = None
+_simulator = None
+_simulation_options = {}
+_scenarios = None
+_networks = None
+
+
+def simulator_from_config(filename=DEFAULT_CONFIG_PATH):
+    """
+    Name of the simulator module selected by ``backend`` in the [Simulation] section.
+
+    Returns:
+        str: Module name for EvaluationExecutor, DEFAULT_SIMULATOR if nothing is configured.
+    """
+    backend = read_section(filename, 'Simulation').get('backend', 'pymunk').strip()
+    if backend not in BACKENDS:
+        raise ValueError("Unknown simulation backend {0!r}, expected one of {1}".format(backend, sorted(BACKENDS)))
+    return BACKENDS[backend]
+
+
+def simulation_options_from_config(filename=DEFAULT_CONFIG_PATH):
+    """
+    Keyword arguments of the configured simulator's ``odwroconeWahadloModelKx`` taken from the
+    [Simulation] section (the timing of the pymunk model, the integrator of the analytic model).
+
+    Returns:
+        dict: Options for EvaluationExecutor(simulation_options=...).
+    """
+    if simulator_from_config(filename) == BACKENDS['analytic']:
+        import batch_sim
+        return {'integrator': batch_sim.integrator_from_config(filename)}
+    if simulator_from_config(filename) == BACKENDS['pymunk']:
+        from odwroconeWahadloModelNN_modul_old import SimulationTiming
+        return {'timing': SimulationTiming.from_config(filename)}
+    return {}
+
+
+def _init_worker(config, simulator_name, scenarios=None, simulation_options=None, pruner=None):
+    """
+    Pool initializer: keep the config, the simulator module and its options, the scenario set and
+    a network factory (pruning with ``pruner``) for the life of the worker.
+    """
+    global _config, _simulator, _simulation_options, _scenarios, _networks
+    _config = config
+    _simulator = importlib.import_module(simulator_name)
+    _simulation_options = simulation_options or {}
+    _scenarios = scenarios
+    _networks = shared_factory(config, pruner)
+
+
+def _genome(data):
+    """Genome of a payload: encoded when it came through the pool, the genome itself in-process."""
+    return decode_view(data) if isinstance(data, bytes) else data
+
+
+def _simulate(net, termination, duration):
+    if duration is None:
+        return _simulator.odwroconeWahadloModelKx(net, False, termination, **_simulation_options)
+    return _simulator.odwroconeWahadloModelKx(net, False, termination, duration=duration, **_simulation_options)
+
+
+def _evaluate_errors(payload, termination=None, duration=None):
+    """
+    Simulate a single genome inside a worker.
+
+    Args:
+        payload: Tuple (genome_id, encoded genome or genome).
+        termination: Optional termination.TerminationPolicy for this generation.
+        duration: Episode length in seconds, None for the simulator's default.
+
+    Returns:
+        Tuple containing genome ID and the cumulative error vector (None if the evaluation failed).
+    """
+    genome_id, data = payload
+    try:
+        net = _networks.create(_genome(data))
+        return genome_id, _simulate(net, termination, duration)
+    except Exception as e:
+        print(f"Error evaluating genome {genome_id}: {e}")
+        return genome_id, None
+
+
+def _evaluate_profiled(payload, termination=None, duration=None):
+    """
+    ``_evaluate_errors`` with timings for profiling.ProfilingReporter.
+
+    Returns:
+        Tuple (genome ID, cumulative error vector or None, timings dict).
+    """
+    genome_id, data = payload
+    timer = step_timer(_simulator)
+    physics = timer.total if timer is not None else None
+    start = time.perf_counter()
+    hits = _networks.hits
+    net, created, sE = None, None, None
+    try:
+        net = TimedNetwork(_networks.create(_genome(data)))
+        created = time.perf_counter()
+        sE = _simulate(net, termination, duration)
+    except Exception as e:
+        print(f"Error evaluating genome {genome_id}: {e}")
+    end = time.perf_counter()
+    created = created or end
+    return genome_id, sE, {
+        'create_net': created - start,
+        'episode': end - created,
+        'activate': net.timer.total if net is not None else 0.0,
+        'steps': net.timer.calls if net is not None else 0,
+        'physics': timer.total - physics if timer is not None else None,
+        'network_hits': _networks.hits - hits,
+    }
+
+
+def _record_trajectory(payload, duration=None):
+    """
+    Simulate a single genome without early termination and record every step.
+
+    Returns:
+        Tuple (genome ID, array of trajectory.COLUMNS rows, None if the evaluation failed).
+    """
+    from trajectory import TrajectoryRecorder
+
+    genome_id, data = payload
+    try:
+        net = _networks.create(_genome(data))
+        timing = _simulation_options.get('timing')
+        recorder = TrajectoryRecorder() if timing is None else TrajectoryRecorder(dt=timing.control_dt)
+        if duration is None:
+            _simulator.odwroconeWahadloModelKx(net, False, observer=recorder, **_simulation_options)
+        else:
+            _simulator.odwroconeWahadloModelKx(net, False, observer=recorder, duration=duration,
+                                               **_simulation_options)
+        return genome_id, recorder.array()
+    except Exception as e:
+        print(f"Error recording genome {genome_id}: {e}")
+        return genome_id, None
+
+
+def _evaluate_scenarios(payloads, termination=None, duration=None):
+    """
+    Run a chunk of genomes over the worker's scenario set in one lockstep batch.
+
+    Args:
+        payloads: List of (genome_id, encoded genome or genome) pairs.
+        termination: Optional termination.TerminationPolicy for this generation.
+        duration: Episode length in seconds, None for the default.
+
+    Returns:
+        List of (genome ID, reduced error vector or None, timings dict); the chunk's time and
+        network cache hits are split evenly over its genomes, activation and physics are not
+        timed separately.
+    """
+    genome_ids = [genome_id for genome_id, _ in payloads]
+    start = time.perf_counter()
+    hits = _networks.hits
+    try:
+        nets = _networks.batch([_genome(data) for _, data in payloads])
+        created = time.perf_counter()
+        errors = _scenarios.evaluate(nets, termination, duration)
+    except Exception:
+        if len(payloads) == 1:
+            print(f"Error evaluating genome {genome_ids[0]}: {sys.exc_info()[1]}")
+            return [(genome_ids[0], None, {'create_net': 0.0, 'episode': 0.0, 'activate': 0.0, 'steps': 0,
+                                           'physics': None, 'network_hits': 0})]
+        # Find the genome that breaks the batch, evaluate the others normally
+        return [result for payload in payloads for result in _evaluate_scenarios([payload], termination, duration)]
+    end = time.perf_counter()
+    timings = {'create_net': (created - start) / len(payloads), 'episode': (end - created) / len(payloads),
+               'activate': 0.0, 'steps': 0, 'physics': None,
+               'network_hits': (_networks.hits - hits) / len(payloads)}
+    return [(genome_id, sE, timings) for genome_id, sE in zip(genome_ids, errors)]
+
+
+def score_failures(genomes, simulated):
+    """
+    Rank genomes whose evaluation failed (worker error, abandoned batch) behind the generation.
+
+    They get a fitness just below the worst simulated one (FAILED_FITNESS if none was
+    simulated), so a failure never outranks a real result and does not enter ``best_fitness``.
+
+    Args:
+        genomes: The failed genomes.
+        simulated: Fitness values of the generation's simulated (or cached) genomes.
+    """
+    if not genomes:
+        return
+    fitness = min(simulated) - 1.0 if simulated else FAILED_FITNESS
+    for genome in genomes:
+        genome.fitness = fitness
+    print("{0} genomes failed to evaluate, ranked last".format(len(genomes)))
+
+
+class EvaluationExecutor(object):
+    """
+    Worker pool that outlives a single generation.
+
+    Use as a context manager around ``Population.run`` and pass ``executor.eval_genomes``
+    as the fitness function:
+
+        with EvaluationExecutor(config) as executor:
+            winner = p.run(executor.eval_genomes, generations)
+    """
+
+    def __init__(self, config, simulator=DEFAULT_SIMULATOR, processes=None, chunksize=None, termination=None,
+                 cache=None, profiler=None, scenarios=None, keep_errors=False, simulation_options=None,
+                 pruner=None):
+        """
+        Args:
+            config: NEAT configuration object, shipped to every worker once.
+            simulator: Name of the module providing ``odwroconeWahadloModelKx``.
+            processes: Number of worker processes (defaults to the CPU count); 0 evaluates in the
+                       calling process without a pool.
+            chunksize: Genomes per task; by default about four chunks per worker, so workers that
+                       draw short episodes pick up more work.
+            termination: Optional termination.TerminationPolicy; its error budget follows the best
+                         fitness seen by this executor.
+            cache: Optional fitness_cache.FitnessCache; genomes found in it are not simulated.
+            profiler: Optional profiling.ProfilingReporter receiving the worker timings.
+            scenarios: Optional scenarios.ScenarioSet; every genome is then run over all scenarios
+                       with the analytic model, so ``simulator`` must be batch_sim (a ValueError
+                       is raised otherwise rather than silently switching backends).
+            keep_errors: Also store the error vector on every genome (``genome.errors``, for
+                         multiobjective.ParetoReproduction); the cache then keeps it too.
+            simulation_options: Keyword arguments of the simulator's ``odwroconeWahadloModelKx``
+                                (see simulation_options_from_config), shipped with the config.
+            pruner: Optional pruning.Pruner of the workers' networks (``Pruner.from_config`` of
+                    the run's configuration file), None evaluates unpruned networks.
+        """
+        if scenarios is not None and simulator != BACKENDS['analytic']:
+            raise ValueError("Scenarios are simulated with the analytic model, set backend = analytic in the "
+                             "[Simulation] section (simulator {0!r})".format(simulator))
+        self.config = config
+        self.simulator = simulator
+        self.simulation_options = dict(simulation_options or {})
+        self.processes = (os.cpu_count() or 1) if processes is None else processes
+        self.chunksize = chunksize
+        self.termination = termination
+        self.cache = cache
+        self.profiler = profiler
+        self.scenarios = scenarios
+        self.keep_errors = keep_errors
+        self.pruner = pruner
+        self.best_fitness = None
+        self.pool = None
+
+    def start(self):
+        if self.processes == 0:
+            _init_worker(self.config, self.simulator, self.scenarios, self.simulation_options, self.pruner)
+        elif self.pool is None:
+            self.pool = Pool(self.processes, initializer=_init_worker,
+                             initargs=(self.config, self.simulator, self.scenarios, self.simulation_options,
+                                       self.pruner))
+        return self
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None and self.pool is not None:
+            self.pool.terminate()
+        self.close()
+
+    def _map(self, task, genomes):
+        if self.pool is None:
+            return map(task, genomes)
+        chunksize = self.chunksize or max(1, len(genomes) // (4 * self.processes))
+        return self.pool.imap_unordered(task, genomes, chunksize)
+
+    def _payloads(self, genomes):
+        """Encode the genomes for the pool; in-process evaluation uses them as they are."""
+        if self.pool is None:
+            return genomes
+        return [(genome_id, encode(genome)) for genome_id, genome in genomes]
+
+    def _payload_cost(self, genomes):
+        """Time of encoding plus pickling the payloads and their size, zero without a pool."""
+        if self.pool is None:
+            return genomes, 0.0, 0
+        start = time.perf_counter()
+        payloads = self._payloads(genomes)
+        encoding = time.perf_counter() - start
+        pickling_seconds, payload_bytes = payload_cost(payloads)
+        return payloads, encoding + pickling_seconds, payload_bytes
+
+    def map_errors(self, genomes, termination=None, duration=None):
+        """
+        Simulate genomes on the pool without touching their fitness or the cache.
+
+        Args:
+            genomes: List of (genome_id, genome) pairs.
+            termination: Optional termination.TerminationPolicy used as is (no budget update).
+            duration: Episode length in seconds, None for the simulator's default.
+
+        Returns:
+            dict: genome ID -> cumulative error vector (None if the evaluation failed).
+        """
+        self.start()
+        if self.scenarios is not None:
+            return self._map_scenarios(genomes, termination, duration)
+        if self.profiler is None:
+            task = partial(_evaluate_errors, termination=termination, duration=duration)
+            return dict(self._map(task, self._payloads(genomes)))
+
+        payloads, pickling_seconds, payload_bytes = self._payload_cost(genomes)
+        start = time.perf_counter()
+        task = partial(_evaluate_profiled, termination=termination, duration=duration)
+        results = list(self._map(task, payloads))
+        self.profiler.record_evaluation([timings for _, _, timings in results], time.perf_counter() - start,
+                                        max(1, self.processes), pickling_seconds, payload_bytes)
+        return {genome_id: sE for genome_id, sE, _ in results}
+
+    def _map_scenarios(self, genomes, termination, duration):
+        """map_errors for a scenario set: one lockstep batch (genomes x scenarios) per chunk."""
+        if self.profiler is not None:
+            payloads, pickling_seconds, payload_bytes = self._payload_cost(genomes)
+        else:
+            payloads = self._payloads(genomes)
+        size = self.chunksize or max(1, -(-len(payloads) // max(1, self.processes)))
+        chunks = [payloads[i:i + size] for i in range(0, len(payloads), size)]
+        start = time.perf_counter()
+        task = partial(_evaluate_scenarios, termination=termination, duration=duration)
+        if self.pool is None:
+            results = [result for chunk in chunks for result in task(chunk)]
+        else:
+            results = [result for batch in self.pool.imap_unordered(task, chunks) for result in batch]
+        if self.profiler is not None:
+            self.profiler.record_evaluation([timings for _, _, timings in results], time.perf_counter() - start,
+                                            max(1, self.processes), pickling_seconds, payload_bytes)
+        return {genome_id: sE for genome_id, sE, _ in results}
+
+    def record_trajectories(self, genomes, duration=None):
+        """
+        Simulate genomes once more with a trajectory.TrajectoryRecorder attached.
+
+        Episodes run on ``simulator`` (the default scenario) without early termination; fitness
+        and cache are not touched.
+
+        Args:
+            genomes: List of (genome_id, genome) pairs.
+            duration: Episode length in seconds, None for the simulator's default.
+
+        Returns:
+            dict: genome ID -> array of shape (steps, len(trajectory.COLUMNS)), failed genomes are left out.
+        """
+        self.start()
+        task = partial(_record_trajectory, duration=duration)
+        return {genome_id: rows for genome_id, rows in self._map(task, self._payloads(genomes)) if rows is not None}
+
+    def evaluation_context(self, termination=None, duration=None):
+        """
+        Everything besides the genome that its fitness depends on, for the cache keys.
+
+        Args:
+            termination: termination.TerminationPolicy of the episodes (with its error budget).
+            duration: Episode length in seconds, None for the simulator's default.
+
+        Returns:
+            tuple: Simulator, its options, scenario set, pruning settings, termination policy and duration.
+        """
+        return (self.simulator, sorted(self.simulation_options.items()), self.scenarios,
+                self.pruner and self.pruner.settings, termination, duration)
+
+    def lookup(self, genome, termination=None, duration=None):
+        """
+        Take a genome's fitness (and error vector) from the cache if it is there.
+
+        Args:
+            genome: Genome to look up.
+            termination: termination.TerminationPolicy the genome would be simulated with.
+            duration: Episode length in seconds, None for the simulator's default.
+
+        Returns:
+            Tuple (found, cache key for ``assign``; None without a cache).
+        """
+        if self.cache is None:
+            return False, None
+        key = '{0}:{1}'.format(genome_hash(genome), context_hash(self.evaluation_context(termination, duration)))
+        cached = self.cache.get(key)
+        if self.keep_errors and not isinstance(cached, tuple):
+            cached = None       # Entry of a run without error vectors, simulate again
+        if cached is None:
+            return False, key
+        if self.keep_errors:
+            genome.fitness, genome.errors = cached
+        else:
+            genome.fitness = cached
+        return True, key
+
+    def assign(self, genome, sE, key=None):
+        """
+        Set the fitness (and error vector) of a simulated genome and cache it under ``key``.
+
+        A failed evaluation (``sE`` None) leaves the fitness None and is not cached, so the
+        genome is simulated again when it next appears; the caller ranks it with
+        ``score_failures`` once the generation is complete.
+
+        Returns:
+            The fitness, None if the evaluation failed.
+        """
+        fitness = fitness_from_errors(sE) if sE is not None else None
+        genome.fitness = fitness
+        if self.keep_errors:
+            genome.errors = tuple(float(e) for e in sE) if sE is not None else None
+        if key is not None and sE is not None:
+            self.cache.put(key, (fitness, genome.errors) if self.keep_errors else fitness)
+        return fitness
+
+    def eval_genomes(self, genomes, config):
+        """
+        NEAT fitness function evaluating all genomes on the persistent pool.
+
+        Args:
+            genomes: List of (genome_id, genome) pairs to evaluate.
+            config: NEAT configuration object (the workers use the one given to the constructor).
+        """
+        if self.pool is not None or self.processes:
+            print("Evaluating genomes with multiprocessing...")
+        self.start()
+        genome_map = dict(genomes)
+
+        # Genomes already simulated in an earlier generation (in the same context, including the
+        # error budget) take their fitness from the cache
+        termination = self.termination and self.termination.with_budget(self.best_fitness)
+        pending = []
+        hashes = {}
+        for genome_id, genome in genomes:
+            found, key = self.lookup(genome, termination)
+            if not found:
+                hashes[genome_id] = key
+                pending.append((genome_id, genome))
+
+        failed = []
+        for genome_id, sE in self.map_errors(pending, termination).items():
+            if self.assign(genome_map[genome_id], sE, hashes[genome_id]) is None:
+                failed.append(genome_map[genome_id])
+
+        simulated = [genome.fitness for _, genome in genomes if genome.fitness is not None]
+        score_failures(failed, simulated)
+        if simulated and (self.best_fitness is None or max(simulated) > self.best_fitness):
+            self.best_fitness = max(simulated)
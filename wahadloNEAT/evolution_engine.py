@@ -0,0 +1,182 @@
+"""
+Evolution runner that keeps the caller responsive.
+
+``EvolutionEngine`` runs ``run``/``resume_from_checkpoint`` of odwWahNN_Neat on a background
+thread (the genomes are simulated by the worker pool, so the thread itself mostly waits) and
+reports progress through a queue that the GUI drains with ``root.after``. Pause and cancel take
+effect at the next generation boundary; a cancelled run can be resumed from its checkpoint log.
+
+The module is also the headless command line entry point for batch servers:
+
+    python evolution_engine.py run --generations 500
+    python evolution_engine.py resume neat-log-450-10.ckptlog --generations 100 [--generation 470]
+"""
+import argparse
+import queue
+import threading
+import time
+
+from neat.reporting import BaseReporter
+
+
+class EvolutionCancelled(Exception):
+    """Raised inside Population.run when the engine was cancelled."""
+
+
+class ProgressReporter(BaseReporter):
+    """
+    Reporter posting one progress event per generation and honouring pause/cancel requests.
+
+    Events are dicts with ``type`` 'generation' (generation, best_fitness, mean_fitness, species,
+    genomes_per_second) or 'finished' (winner, error, cancelled).
+    """
+
+    def __init__(self, events, pause_event, cancel_event):
+        self.events = events
+        self.pause_event = pause_event
+        self.cancel_event = cancel_event
+        self.generation = None
+        self.generation_start = None
+
+    def start_generation(self, generation):
+        self.wait_if_paused()
+        self.generation = generation
+        self.generation_start = time.perf_counter()
+
+    def post_evaluate(self, config, population, species, best_genome):
+        fitnesses = [genome.fitness for genome in population.values()]
+        elapsed = time.perf_counter() - self.generation_start
+        self.events.put({
+            'type': 'generation', 'generation': self.generation,
+            'best_fitness': max(fitnesses), 'mean_fitness': sum(fitnesses) / len(fitnesses),
+            'species': len(species.species), 'genomes_per_second': len(fitnesses) / elapsed if elapsed else None,
+        })
+
+    def end_generation(self, config, population, species_set):
+        self.wait_if_paused()
+
+    def wait_if_paused(self):
+        while self.pause_event.is_set() and not self.cancel_event.is_set():
+            time.sleep(0.1)
+        if self.cancel_event.is_set():
+            raise EvolutionCancelled()
+
+
+class EvolutionEngine(object):
+    """
+    Runs an evolution function on a background thread.
+
+        engine = EvolutionEngine(run, config_path, 100, show_winner=False)
+        engine.start()
+        ...
+        for event in engine.poll():
+            ...
+
+    The function must accept a ``progress`` keyword argument (a neat reporter to add to the
+    population) and return the winner.
+    """
+
+    def __init__(self, function, *args, **kwargs):
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.events = queue.Queue()
+        self.pause_event = threading.Event()
+        self.cancel_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        progress = ProgressReporter(self.events, self.pause_event, self.cancel_event)
+        self.thread = threading.Thread(target=self._run, args=(progress,), daemon=True)
+        self.thread.start()
+        return self
+
+    def _run(self, progress):
+        winner, error, cancelled = None, None, False
+        try:
+            winner = self.function(*self.args, progress=progress, **self.kwargs)
+        except EvolutionCancelled:
+            cancelled = True
+        except Exception as e:
+            error = e
+        self.events.put({'type': 'finished', 'winner': winner, 'error': error, 'cancelled': cancelled})
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    @property
+    def paused(self):
+        return self.pause_event.is_set()
+
+    def pause(self):
+        self.pause_event.set()
+
+    def resume(self):
+        self.pause_event.clear()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def poll(self):
+        """Return the events posted since the last call (never blocks)."""
+        events = []
+        while True:
+            try:
+                events.append(self.events.get_nowait())
+            except queue.Empty:
+                return events
+
+    def join(self, timeout=None):
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+
+def format_progress(event):
+    """One-line description of a 'generation' event."""
+    rate = event['genomes_per_second']
+    return "Generation {0}: best {1:.3f}, mean {2:.3f}, {3} species, {4} genomes/s".format(
+        event['generation'], event['best_fitness'], event['mean_fitness'], event['species'],
+        '-' if rate is None else '{0:.1f}'.format(rate))
+
+
+def main():
+    import odwWahNN_Neat
+    from settings import DEFAULT_CONFIG_PATH
+
+    parser = argparse.ArgumentParser(description="Run the NEAT evolution without the GUI.")
+    parser.add_argument('--config', default=DEFAULT_CONFIG_PATH, help="NEAT configuration file")
+    commands = parser.add_subparsers(dest='command', required=True)
+    run_parser = commands.add_parser('run', help="Start a new evolution")
+    run_parser.add_argument('--generations', type=int, required=True)
+    resume_parser = commands.add_parser('resume', help="Resume from a checkpoint log or neat-checkpoint-* file")
+    resume_parser.add_argument('checkpoint')
+    resume_parser.add_argument('--generations', type=int, required=True)
+    resume_parser.add_argument('--generation', type=int, default=None, help="Generation to restore from a log")
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        engine = EvolutionEngine(odwWahNN_Neat.run, args.config, args.generations, show_winner=False)
+    else:
+        engine = EvolutionEngine(odwWahNN_Neat.resume_from_checkpoint, args.checkpoint, args.generations,
+                                 args.generation, config_file=args.config)
+    engine.start()
+    try:
+        while True:
+            for event in engine.poll():
+                if event['type'] == 'generation':
+                    print(format_progress(event))
+                elif event['error'] is not None:
+                    raise SystemExit("Evolution failed: {0}".format(event['error']))
+                else:
+                    print("Evolution cancelled." if event['cancelled'] else "Evolution finished.")
+                    return
+            time.sleep(0.2)
+    except KeyboardInterrupt:
+        print("Cancelling at the end of the generation...")
+        engine.cancel()
+        engine.join()
+
+
+if __name__ == '__main__':
+    main()
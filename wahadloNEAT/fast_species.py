@@ -0,0 +1,387 @@
+"""
+Vectorized speciation for large populations.
+
+neat.DefaultSpeciesSet computes every genome-to-representative distance with
+``DefaultGenome.distance``, a Python loop over the genes of both genomes, so speciation is
+quadratic in Python at the population sizes fast evaluation makes possible. ``VectorizedSpeciesSet``
+is a drop-in replacement producing the same species:
+
+    * every genome is encoded once into gene id/value arrays (kept while the genome lives, so
+      elites are not re-encoded) and the population is packed into one table sorted by
+      (genome, gene id);
+    * the distances from a representative to many genomes are computed in one batch, homologous
+      genes being found with ``searchsorted``; the per-gene terms are summed in the
+      representative's gene order, so the distances are bit-identical to ``DefaultGenome.distance``;
+    * distances between representatives and surviving genomes are kept for the next generation;
+    * large batches are split over the evaluation workers if an executor is attached
+      (``species_set.attach(executor)``).
+
+The assignment loop is the one of DefaultSpeciesSet (same iteration order, tie breaking and
+distance cache semantics), only its distance lookups are served from the precomputed batches.
+
+Encoding costs about as much as one distance, so batching only pays off when every genome is
+compared with several representatives. With fewer than ``min_species`` species in the previous
+generation ``speciate`` runs DefaultSpeciesSet's loop instead: with the shipped threshold there
+is one species and the batched path took twice as long (0.08 s against 0.04 s per generation).
+"""
+from collections import namedtuple
+
+import numpy as np
+from neat.config import ConfigParameter, DefaultClassConfig
+from neat.six_util import iterkeys
+from neat.species import DefaultSpeciesSet, Species
+
+from settings import DEFAULT_CONFIG_PATH, read_section
+
+SPECIATION = ('default', 'vectorized')
+
+# Genes of one genome in its dict order (the summation order of DefaultGenome.distance)
+EncodedGenome = namedtuple('EncodedGenome', 'node_ids bias response activation aggregation '
+                                            'connection_ids weight enabled')
+# Genes of the whole population sorted by genome index * stride + gene id
+GenomeTable = namedtuple('GenomeTable', 'node_stride node_keys bias response activation aggregation node_counts '
+                                        'connection_stride connection_keys weight enabled connection_counts')
+
+
+def species_set_from_config(filename=DEFAULT_CONFIG_PATH):
+    """
+    Species set class for neat.Config from ``speciation`` in the [Evolution] section.
+
+    Returns:
+        VectorizedSpeciesSet (the default) or neat.DefaultSpeciesSet.
+    """
+    speciation = read_section(filename, 'Evolution').get('speciation', 'vectorized').strip().lower()
+    if speciation not in SPECIATION:
+        raise ValueError("Unknown speciation {0!r}, expected one of {1}".format(speciation, ', '.join(SPECIATION)))
+    return VectorizedSpeciesSet if speciation == 'vectorized' else DefaultSpeciesSet
+
+
+def build_table(encoded):
+    """Pack a list of EncodedGenome into a GenomeTable (row i of the table is ``encoded[i]``)."""
+    def pack(ids, columns):
+        counts = np.array([len(i) for i in ids], dtype=np.int64)
+        flat_ids = np.concatenate(ids) if len(ids) else np.zeros(0, dtype=np.int64)
+        stride = int(flat_ids.max()) + 1 if len(flat_ids) else 1
+        keys = np.repeat(np.arange(len(ids), dtype=np.int64), counts) * stride + flat_ids
+        order = np.argsort(keys, kind='stable')
+        values = [np.concatenate(c)[order] if len(c) else np.zeros(0) for c in columns]
+        return [stride, keys[order]] + values + [counts]
+
+    nodes = pack([e.node_ids for e in encoded],
+                 [[e.bias for e in encoded], [e.response for e in encoded],
+                  [e.activation for e in encoded], [e.aggregation for e in encoded]])
+    connections = pack([e.connection_ids for e in encoded],
+                       [[e.weight for e in encoded], [e.enabled for e in encoded]])
+    return GenomeTable(*(nodes + connections))
+
+
+def _homologous(keys, stride, rows, ids):
+    """Positions in ``keys`` of every (row, gene id) pair and whether the gene exists there."""
+    # Gene ids beyond the stride belong to no genome of the table (e.g. an old representative's)
+    query = np.where(ids[None, :] < stride, rows[:, None] * stride + ids[None, :], -1)
+    if not len(keys):
+        return np.zeros(query.shape, dtype=np.int64), np.zeros(query.shape, dtype=bool)
+    position = np.minimum(np.searchsorted(keys, query), len(keys) - 1)
+    return position, keys[position] == query
+
+
+def _component(gene_distance, found, own_count, other_counts, disjoint_coefficient):
+    """Node or connection part of DefaultGenome.distance for a batch (same operation order)."""
+    gene_distance[~found] = 0.0
+    total = np.cumsum(gene_distance, axis=1)[:, -1] if gene_distance.shape[1] else np.zeros(len(other_counts))
+    matches = found.sum(axis=1)
+    disjoint = other_counts + own_count - 2 * matches
+    largest = np.maximum(other_counts, own_count)
+    return np.divide(total + disjoint_coefficient * disjoint, largest,
+                     out=np.zeros(len(other_counts)), where=largest > 0)
+
+
+def genome_distances(genome, table, rows, disjoint_coefficient, weight_coefficient):
+    """
+    ``DefaultGenome.distance(genome, other)`` for many ``other`` genomes at once.
+
+    Args:
+        genome: EncodedGenome of the representative.
+        table: GenomeTable of the population.
+        rows: Table rows of the other genomes.
+        disjoint_coefficient, weight_coefficient: The genome config's compatibility coefficients.
+
+    Returns:
+        np.ndarray: Distances, one per row.
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    position, found = _homologous(table.node_keys, table.node_stride, rows, genome.node_ids)
+    d = np.abs(genome.bias - table.bias[position]) + np.abs(genome.response - table.response[position])
+    d = d + (genome.activation != table.activation[position])
+    d = d + (genome.aggregation != table.aggregation[position])
+    d = d * weight_coefficient
+    node_distance = _component(d, found, len(genome.node_ids), table.node_counts[rows], disjoint_coefficient)
+
+    position, found = _homologous(table.connection_keys, table.connection_stride, rows, genome.connection_ids)
+    d = np.abs(genome.weight - table.weight[position])
+    d = d + (genome.enabled != table.enabled[position])
+    d = d * weight_coefficient
+    connection_distance = _component(d, found, len(genome.connection_ids), table.connection_counts[rows],
+                                     disjoint_coefficient)
+    return node_distance + connection_distance
+
+
+def _distance_rows(genomes, table, rows, disjoint_coefficient, weight_coefficient):
+    """Pool task: ``genome_distances`` for several genomes, each with its own rows."""
+    return [genome_distances(g, table, r, disjoint_coefficient, weight_coefficient) for g, r in zip(genomes, rows)]
+
+
+class VectorizedSpeciesSet(DefaultSpeciesSet):
+    """
+    neat.DefaultSpeciesSet with batched distance computation.
+
+    Configured by the [VectorizedSpeciesSet] section: ``compatibility_threshold`` as for the
+    default species set, ``min_species``, the number of species of the previous generation below
+    which DefaultSpeciesSet's loop is used, and ``parallel_min_pairs``, the number of distances
+    from which a batch is split over the worker pool given to ``attach`` (without one everything
+    is computed in this process).
+    """
+
+    def __init__(self, config, reporters):
+        super(VectorizedSpeciesSet, self).__init__(config, reporters)
+        self.executor = None
+        self._node_ids = {}         # Node key -> dense gene id
+        self._connection_ids = {}   # Connection key -> dense gene id
+        self._names = {}            # Activation / aggregation name -> code
+        self._encoded = {}          # Genome key -> EncodedGenome
+        self._distances = {}        # (representative key, genome key) -> distance, kept between generations
+
+    @classmethod
+    def parse_config(cls, param_dict):
+        return DefaultClassConfig(param_dict,
+                                  [ConfigParameter('compatibility_threshold', float),
+                                   ConfigParameter('min_species', int, 4),
+                                   ConfigParameter('parallel_min_pairs', int, 200000)])
+
+    def __getstate__(self):
+        # Checkpoints keep the species only; the executor cannot be pickled and the caches are rebuilt
+        state = dict(self.__dict__)
+        state.update(executor=None, _node_ids={}, _connection_ids={}, _names={}, _encoded={},
+                     _distances={})
+        return state
+
+    def attach(self, executor):
+        """Use the worker pool of an evaluation.EvaluationExecutor (while it is open) for large batches."""
+        self.executor = executor
+
+    def _code(self, table, key):
+        code = table.get(key)
+        if code is None:
+            code = table[key] = len(table)
+        return code
+
+    def encode(self, genome):
+        """EncodedGenome of a genome, cached by genome key (genomes do not change after creation)."""
+        encoded = self._encoded.get(genome.key)
+        if encoded is None:
+            nodes = list(genome.nodes.values())
+            connections = list(genome.connections.values())
+            encoded = EncodedGenome(
+                np.array([self._code(self._node_ids, n.key) for n in nodes], dtype=np.int64),
+                np.array([n.bias for n in nodes], dtype=float),
+                np.array([n.response for n in nodes], dtype=float),
+                np.array([self._code(self._names, n.activation) for n in nodes], dtype=np.int64),
+                np.array([self._code(self._names, n.aggregation) for n in nodes], dtype=np.int64),
+                np.array([self._code(self._connection_ids, c.key) for c in connections], dtype=np.int64),
+                np.array([c.weight for c in connections], dtype=float),
+                np.array([c.enabled for c in connections], dtype=bool))
+            self._encoded[genome.key] = encoded
+        return encoded
+
+    def _raw_distances(self, representatives, genome_keys, table, rows, genome_config):
+        """
+        ``representative.distance(genome)`` for every representative and every table row in ``rows``.
+
+        Distances kept from the previous generation are reused, the others are computed and kept.
+
+        Returns:
+            List of arrays, one per representative, aligned with ``rows``.
+        """
+        tasks = []
+        results = []
+        for rep in representatives:
+            cached = np.full(len(rows), np.nan)
+            if rep.key in self._distances:
+                known_keys, known = self._distances[rep.key]
+                if len(known_keys):
+                    position = np.minimum(np.searchsorted(known_keys, genome_keys[rows]), len(known_keys) - 1)
+                    hit = known_keys[position] == genome_keys[rows]
+                    cached[hit] = known[position[hit]]
+            missing = np.flatnonzero(np.isnan(cached))
+            results.append(cached)
+            if len(missing):
+                tasks.append((len(results) - 1, self.encode(rep), missing))
+
+        coefficients = (genome_config.compatibility_disjoint_coefficient,
+                        genome_config.compatibility_weight_coefficient)
+        pairs = sum(len(missing) for _, _, missing in tasks)
+        pool = self.executor.pool if self.executor is not None else None
+        if pool is not None and len(tasks) > 1 and pairs >= self.species_set_config.parallel_min_pairs:
+            processes = self.executor.processes
+            chunks = [chunk for chunk in (tasks[i::processes] for i in range(processes)) if chunk]
+            batches = pool.starmap(_distance_rows, [
+                ([g for _, g, _ in chunk], table, [rows[m] for _, _, m in chunk]) + coefficients for chunk in chunks])
+            computed = [d for batch in batches for d in batch]
+            tasks = [task for chunk in chunks for task in chunk]
+        else:
+            computed = [genome_distances(g, table, rows[m], *coefficients) for _, g, m in tasks]
+
+        for (i, _, missing), distances in zip(tasks, computed):
+            results[i][missing] = distances
+            rep_key = representatives[i].key
+            known_keys, known = self._distances.get(rep_key, (np.zeros(0, dtype=np.int64), np.zeros(0)))
+            merged_keys, first = np.unique(np.concatenate([genome_keys[rows[missing]], known_keys]),
+                                           return_index=True)
+            self._distances[rep_key] = (merged_keys, np.concatenate([distances, known])[first])
+        return results
+
+    def speciate(self, config, population, generation):
+        """
+        Place genomes into species by genetic similarity (same result as DefaultSpeciesSet.speciate).
+        """
+        assert isinstance(population, dict)
+
+        # Configs restored from checkpoints written before min_species existed do not have it
+        min_species = getattr(self.species_set_config, 'min_species', 4)
+        if self.species and len(self.species) < min_species:
+            # Few representatives: the per-genome loop is cheaper than encoding the population.
+            # The representatives change, so nothing cached is of use afterwards
+            self._encoded = {}
+            self._distances = {}
+            return super(VectorizedSpeciesSet, self).speciate(config, population, generation)
+
+        compatibility_threshold = self.species_set_config.compatibility_threshold
+        genome_config = config.genome_config
+
+        # Table rows follow the iteration order of the unspeciated set, which is also its pop order.
+        # The set is built from an iterator as in DefaultSpeciesSet: set(dict) sizes its hash table
+        # differently, which changes that order and so the species the genomes end up in
+        unspeciated = set(iterkeys(population))
+        keys = list(unspeciated)
+        genome_keys = np.array(keys, dtype=np.int64)
+        row_of = dict(zip(keys, range(len(keys))))
+        table = build_table([self.encode(population[gid]) for gid in keys])
+        free = np.ones(len(keys), dtype=bool)
+
+        # What DefaultSpeciesSet's GenomeDistanceCache would hold: the distances looked up from
+        # every representative (full rows, NaN = not looked up; the first ``count`` rows of
+        # ``looked_up`` belong to the representatives in ``looked_up_rows``) and how many cache
+        # entries each batch adds
+        looked_up_index = {}
+        looked_up = np.empty((max(1, 2 * len(self.species)), len(keys)))
+        looked_up_rows = np.empty(len(looked_up), dtype=np.int64)
+        entries = []
+
+        def lookup(rep, rows, raw):
+            """Distances from rep to rows (ascending) as DefaultSpeciesSet sees them."""
+            nonlocal looked_up, looked_up_rows
+            d = raw.copy()
+            weight = np.where(genome_keys[rows] == rep.key, 1, 2)
+            # Pairs already in the cache keep their distance and add no entry
+            index = looked_up_index.get(rep.key)
+            if index is not None:
+                seen = ~np.isnan(looked_up[index, rows])
+                d[seen] = looked_up[index, rows][seen]
+                weight[seen] = 0
+            # The cache stores both orders of a pair: representatives among the rows that looked
+            # this one up earlier
+            rep_row = row_of.get(rep.key, -1)
+            count = len(looked_up_index)
+            if rep_row >= 0 and count and len(rows):
+                earlier = looked_up[:count, rep_row]
+                earlier_rows = looked_up_rows[:count]
+                i = np.minimum(np.searchsorted(rows, earlier_rows), len(rows) - 1)
+                hit = ~np.isnan(earlier) & (rows[i] == earlier_rows) & (earlier_rows != rep_row)
+                d[i[hit]] = earlier[hit]
+                weight[i[hit]] = 0
+            if index is None:
+                index = looked_up_index[rep.key] = count
+                if count == len(looked_up):
+                    looked_up = np.vstack([looked_up, np.empty_like(looked_up)])
+                    looked_up_rows = np.concatenate([looked_up_rows, np.empty_like(looked_up_rows)])
+                looked_up[index] = np.nan
+                looked_up_rows[index] = rep_row
+            looked_up[index, rows] = d
+            entries.append((d, weight))
+            return d
+
+        # Find the best representatives for each existing species.
+        old_representatives = [s.representative for s in self.species.values()]
+        all_rows = np.arange(len(keys))
+        raw = dict(zip(self.species, self._raw_distances(old_representatives, genome_keys, table, all_rows,
+                                                         genome_config)))
+        new_representatives = {}
+        new_members = {}
+        for sid, s in self.species.items():
+            rows = np.flatnonzero(free)
+            d = lookup(s.representative, rows, raw[sid][rows])
+            new_rid = keys[rows[int(np.argmin(d))]]
+            new_representatives[sid] = new_rid
+            new_members[sid] = [new_rid]
+            unspeciated.remove(new_rid)
+            free[row_of[new_rid]] = False
+
+        # Partition population into species based on genetic similarity. Column j of ``matrix``
+        # holds the distances from the j-th representative to the genomes still unspeciated.
+        species_ids = list(new_representatives)
+        matrix = np.empty((len(keys), max(1, 2 * len(species_ids))))
+        rows = np.flatnonzero(free)
+        reps = [population[rid] for rid in new_representatives.values()]
+        for j, (rep, d) in enumerate(zip(reps, self._raw_distances(reps, genome_keys, table, rows, genome_config))):
+            matrix[rows, j] = lookup(rep, rows, d)
+
+        while unspeciated:
+            gid = unspeciated.pop()
+            free[row_of[gid]] = False
+            row = matrix[row_of[gid], :len(species_ids)]
+            close = row < compatibility_threshold
+            if close.any():
+                sid = species_ids[int(np.argmin(np.where(close, row, np.inf)))]
+                new_members[sid].append(gid)
+            else:
+                # No species is similar enough, create a new species, using
+                # this genome as its representative.
+                sid = next(self.indexer)
+                new_representatives[sid] = gid
+                new_members[sid] = [gid]
+                species_ids.append(sid)
+                if len(species_ids) > matrix.shape[1]:
+                    matrix = np.hstack([matrix, np.empty_like(matrix)])
+                rows = np.flatnonzero(free)
+                if len(rows):
+                    rep = population[gid]
+                    d, = self._raw_distances([rep], genome_keys, table, rows, genome_config)
+                    matrix[rows, len(species_ids) - 1] = lookup(rep, rows, d)
+
+        # Update species collection based on new speciation.
+        self.genome_to_species = {}
+        for sid, rid in new_representatives.items():
+            s = self.species.get(sid)
+            if s is None:
+                s = Species(sid, generation)
+                self.species[sid] = s
+
+            members = new_members[sid]
+            for gid in members:
+                self.genome_to_species[gid] = sid
+
+            member_dict = dict((gid, population[gid]) for gid in members)
+            s.update(population[rid], member_dict)
+
+        # Keep what the next generation can reuse: encodings of this population, distances from
+        # the new representatives
+        self._encoded = {key: self._encoded[key] for key in keys}
+        self._distances = {key: self._distances[key] for key in new_representatives.values()
+                           if key in self._distances}
+
+        values = np.repeat(np.concatenate([d for d, _ in entries] or [np.zeros(0)]),
+                           np.concatenate([w for _, w in entries] or [np.zeros(0, dtype=int)]))
+        gdmean = float(values.mean()) if len(values) else 0.0
+        gdstdev = float(values.std()) if len(values) else 0.0
+        self.reporters.info(
+            'Mean genetic distance {0:.3f}, standard deviation {1:.3f}'.format(gdmean, gdstdev))
@@ -0,0 +1,40 @@
+import numpy as np
+
+# Fitness of a genome with zero cumulative error
+BASE_FITNESS = -10000
+# Fitness of a failed evaluation in a generation where no genome was simulated (see
+# evaluation.score_failures); finite, so neat's fitness statistics stay defined
+FAILED_FITNESS = -1e12
+# Weights of the six cumulative error components:
+#   [ cart_x -- cart_vx -- arm1_angle -- arm1_angular_velocity -- arm2_angle -- arm2_angular_velocity ]
+ERROR_WEIGHTS = (0.05, 0.05, 1.0, 0.05, 0.2, 0.2)
+
+
+def weighted_error(sE):
+    """
+    Collapse a six-element cumulative error vector into a single weighted error.
+
+    Args:
+        sE: Cumulative error vector returned by a simulator, or an (N, 6) array of them.
+
+    Returns:
+        The weighted error (float), or an (N,) array for batched input.
+    """
+    if np.ndim(sE) == 1:
+        # Same summation order as the original scalar formula
+        return sum(w * abs(e) for w, e in zip(ERROR_WEIGHTS, sE))
+    return np.abs(np.asarray(sE, dtype=float)) @ np.asarray(ERROR_WEIGHTS)
+
+
+def fitness_from_errors(sE):
+    """
+    Compute the fitness used by NEAT from a cumulative error vector.
+
+    Args:
+        sE: Cumulative error vector returned by a simulator, or an (N, 6) array of them.
+
+    Returns:
+        The fitness (float), or an (N,) array for batched input.
+    """
+    fitness = BASE_FITNESS - weighted_error(sE)
+    return float(fitness) if np.ndim(fitness) == 0 else fitness
@@ -0,0 +1,89 @@
+"""
+Memo of evaluated fitness keyed by a canonical hash of the genome's phenotype.
+
+The simulation is deterministic, so elites and unmutated children that reappear with identical
+connections, biases, responses and activations do not have to be simulated again. The same
+genome has a different fitness under another simulator, timing, integrator, scenario set, episode
+length or termination policy, so the keys also carry a hash of that evaluation context
+(``context_hash``). The error budget of a termination policy follows the best fitness, hence with
+budget termination the entries only hit while the best fitness has not improved.
+"""
+import hashlib
+from collections import OrderedDict
+
+
+def genome_hash(genome):
+    """
+    Canonical content hash of a genome.
+
+    Covers the node genes (bias, response, activation, aggregation) and the enabled connections
+    (weight); genome keys, fitness and disabled connections are ignored.
+
+    Returns:
+        str: Hex digest.
+    """
+    h = hashlib.sha1()
+    for key in sorted(genome.nodes):
+        ng = genome.nodes[key]
+        h.update(repr((key, ng.bias, ng.response, ng.activation, ng.aggregation)).encode())
+    h.update(b'|')
+    for key in sorted(k for k, cg in genome.connections.items() if cg.enabled):
+        h.update(repr((key, genome.connections[key].weight)).encode())
+    return h.hexdigest()
+
+
+def context_hash(context):
+    """
+    Short hash of an evaluation context.
+
+    Args:
+        context: Any value with a deterministic repr (e.g. a tuple of the simulator name, its
+                 options, the scenario set and the termination policy).
+
+    Returns:
+        str: Hex digest.
+    """
+    return hashlib.sha1(repr(context).encode()).hexdigest()[:16]
+
+
+class FitnessCache(object):
+    """LRU map from genome_hash plus context_hash to fitness, with hit/miss counters."""
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.journal = None     # Entries put since the last drain_journal, None = not recording
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        """Return the cached fitness for a genome hash, or None (counted as a miss)."""
+        fitness = self.entries.get(key)
+        if fitness is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return fitness
+
+    def put(self, key, fitness):
+        self.entries[key] = fitness
+        self.entries.move_to_end(key)
+        if self.journal is not None:
+            self.journal.append((key, fitness))
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def drain_journal(self):
+        """Return the (key, fitness) pairs put since the last call and start recording new ones."""
+        journal, self.journal = self.journal or [], []
+        return journal
+
+    def stats(self):
+        """Return a dict with size, hits, misses and hit rate."""
+        lookups = self.hits + self.misses
+        return {'size': len(self.entries), 'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0}
@@ -0,0 +1,345 @@
+"""
+Island-model evolution: several independent populations with periodic migration.
+
+A single neat.Population only parallelises the fitness evaluation; reproduction and speciation
+stay serial and a population of 30 cannot keep many cores busy. ``run_islands`` starts one process
+per island, each running its own neat.Population from neat-config.txt and evaluating its genomes
+in-process. Every ``migration_interval`` generations each island sends copies of its
+``migration_count`` best genomes to its neighbours ([Islands] section), in the genome_codec encoding:
+
+    ring    island i sends to island i + 1
+    full    every island sends to all others
+    random  every island sends to one random other island per migration
+
+Immigrants get a fresh genome key and fresh hidden node keys from the receiving island, so they
+neither clash with its genomes nor look homologous to its unrelated nodes, and replace random
+children of the new generation (elites are kept). Each island writes its own checkpoint log
+(``<filename_prefix>island<i>-<generation>-<sequence>.ckptlog``) and can be resumed from it; a generation that
+received immigrants is logged again after they arrived, so a resume continues with them.
+
+    python islands.py --generations 300 [--resume]
+"""
+import argparse
+import multiprocessing
+import queue
+import random
+import traceback
+from itertools import count
+
+import neat
+from neat.reporting import BaseReporter
+
+import checkpoint_log
+from checkpoint_log import CheckpointLog
+from compact_population import population_type_from_config, genome_storage_from_config, compact_population
+from evaluation import EvaluationExecutor, simulator_from_config, simulation_options_from_config
+from fast_species import species_set_from_config
+from fitness_cache import FitnessCache
+from genome_codec import encode, decode
+from multiobjective import ParetoReproduction, reproduction_from_config
+from pruning import Pruner
+from scenarios import ScenarioSet
+from settings import DEFAULT_CONFIG_PATH, read_section, get_int
+from termination import TerminationPolicy
+
+TOPOLOGIES = ('ring', 'full', 'random')
+
+
+def read_island_settings(filename=DEFAULT_CONFIG_PATH):
+    """
+    Read the [Islands] section of a NEAT configuration file.
+
+    Returns:
+        dict with islands, migration_interval, migration_count, topology and seed.
+    """
+    params = read_section(filename, 'Islands')
+    settings = {
+        'islands': get_int(params, 'islands', 4),
+        'migration_interval': get_int(params, 'migration_interval', 10),
+        'migration_count': get_int(params, 'migration_count', 2),
+        'topology': params.get('topology', 'ring').strip().lower(),
+        'seed': get_int(params, 'seed', 1),
+    }
+    if settings['topology'] not in TOPOLOGIES:
+        raise ValueError("Unknown island topology {0!r}, expected one of {1}".format(
+            settings['topology'], ', '.join(TOPOLOGIES)))
+    return settings
+
+
+def migration_targets(topology, island, islands, rng):
+    """
+    Islands receiving the emigrants of ``island``.
+
+    Args:
+        topology: 'ring', 'full' or 'random'.
+        island: Index of the sending island.
+        islands: Number of islands.
+        rng: random.Random of the sending island (used by 'random').
+    """
+    others = [i for i in range(islands) if i != island]
+    if not others:
+        return []
+    if topology == 'ring':
+        return [(island + 1) % islands]
+    if topology == 'full':
+        return others
+    return [rng.choice(others)]
+
+
+def remap_genome(genome, config, genome_key):
+    """
+    Copy of a genome from another island with keys from this island's key space.
+
+    Input and output node keys are shared by all islands and kept; hidden nodes get new keys from
+    the island's node indexer and the connections are rekeyed accordingly.
+
+    Args:
+        genome: The immigrant genome.
+        config: neat.Config of the receiving island.
+        genome_key: New genome key.
+
+    Returns:
+        The remapped genome with fitness None.
+    """
+    genome_config = config.genome_config
+    fixed = set(genome_config.input_keys) | set(genome_config.output_keys)
+    node_map = {key: key if key in fixed else next(genome_config.node_indexer) for key in genome.nodes}
+    node_map.update((key, key) for key in genome_config.input_keys)
+
+    remapped = config.genome_type(genome_key)
+    for key, node in genome.nodes.items():
+        gene = node.copy()
+        gene.key = node_map[key]
+        remapped.nodes[gene.key] = gene
+    for (i, o), connection in genome.connections.items():
+        gene = connection.copy()
+        gene.key = (node_map[i], node_map[o])
+        remapped.connections[gene.key] = gene
+    remapped.fitness = None
+    return remapped
+
+
+class MigrationReporter(BaseReporter):
+    """Keeps the encoded best genomes of the latest generation and posts progress."""
+
+    def __init__(self, island, count, results):
+        self.island = island
+        self.count = count
+        self.results = results
+        self.generation = None
+        self.emigrants = []
+        self.solved = False
+
+    def start_generation(self, generation):
+        self.generation = generation
+
+    def post_evaluate(self, config, population, species, best_genome):
+        ranked = sorted(population.values(), key=lambda g: g.fitness, reverse=True)
+        self.emigrants = [encode(g) for g in ranked[:self.count]]
+        fitnesses = [g.fitness for g in ranked]
+        self.results.put(('generation', self.island, self.generation, best_genome.fitness,
+                          sum(fitnesses) / len(fitnesses), len(species.species)))
+
+    def found_solution(self, config, generation, best):
+        self.solved = True
+
+
+def immigrate(population, immigrants):
+    """
+    Put immigrants into a freshly reproduced population and re-speciate it.
+
+    Every immigrant replaces a random child that has not been evaluated yet; elites are kept.
+
+    Args:
+        population: The receiving neat.Population.
+        immigrants: Encoded genomes (genome_codec.encode) from other islands.
+
+    Returns:
+        Number of immigrants accepted.
+    """
+    config = population.config
+    if config.genome_config.node_indexer is None:
+        keys = [key for genome in population.population.values() for key in genome.nodes]
+        config.genome_config.node_indexer = count(max(keys) + 1)
+    children = [key for key, genome in population.population.items() if genome.fitness is None]
+    random.shuffle(children)
+    accepted = 0
+    for data, replaced in zip(immigrants, children):
+        new_key = next(population.reproduction.genome_indexer)
+        del population.population[replaced]
+        population.population[new_key] = remap_genome(decode(data, config), config, new_key)
+        accepted += 1
+    if accepted:
+        population.species.speciate(config, population.population, population.generation)
+    return accepted
+
+
+def _receive(inbox, epoch, waiting, pending):
+    """
+    Collect the epoch's messages from the islands in ``waiting``.
+
+    Messages of later epochs stay in ``pending``; an island that finished (epoch None) is removed
+    from ``waiting``.
+
+    Returns:
+        List of immigrant genomes.
+    """
+    immigrants = []
+    expected = set(waiting)
+    while expected:
+        for message in list(pending):
+            sender, message_epoch, genomes = message
+            if sender in expected and message_epoch == epoch:
+                pending.remove(message)
+                expected.discard(sender)
+                immigrants.extend(genomes)
+        if not expected:
+            break
+        sender, message_epoch, genomes = inbox.get()
+        if message_epoch is None:
+            waiting.discard(sender)
+            expected.discard(sender)
+        else:
+            pending.append((sender, message_epoch, genomes))
+    return immigrants
+
+
+def _island_main(island, config_file, generations, settings, inboxes, results, resume):
+    """Process body of one island."""
+    islands = settings['islands']
+    log = None
+    try:
+        random.seed(settings['seed'] * 1000 + island)
+        rng = random.Random(settings['seed'] * 1000 + islands + island)
+        log_params = read_section(config_file, 'CheckpointLog')
+        prefix = '{0}island{1}-'.format(log_params.get('filename_prefix', 'neat-log-').strip(), island)
+
+        if resume and checkpoint_log.list_segments(prefix):
+            population, cache = checkpoint_log.restore(prefix)
+            if genome_storage_from_config(config_file) == 'compact':
+                compact_population(population)
+        else:
+            config = neat.Config(neat.DefaultGenome, reproduction_from_config(config_file),
+                                 species_set_from_config(config_file), neat.DefaultStagnation, config_file)
+            population, cache = population_type_from_config(config_file)(config), FitnessCache()
+        config = population.config
+        log = CheckpointLog.from_config(cache, config_file)
+        log.filename_prefix = prefix
+        population.add_reporter(log)
+        migration = MigrationReporter(island, settings['migration_count'], results)
+        population.add_reporter(migration)
+
+        waiting = set(range(islands)) - {island}
+        pending = []
+        interval = max(1, settings['migration_interval'])
+        # Islands are processes already, nested worker pools are not allowed (and not needed)
+        with EvaluationExecutor(config, simulator=simulator_from_config(config_file), processes=0,
+                                simulation_options=simulation_options_from_config(config_file),
+                                pruner=Pruner.from_config(config_file),
+                                termination=TerminationPolicy.from_config(config_file), cache=cache,
+                                scenarios=ScenarioSet.from_config(config_file),
+                                keep_errors=isinstance(population.reproduction, ParetoReproduction)) as executor:
+            done, epoch = 0, 0
+            while done < generations and not migration.solved:
+                n = min(interval, generations - done)
+                population.run(executor.eval_genomes, n)
+                done += n
+                if done >= generations or migration.solved:
+                    break
+                targets = migration_targets(settings['topology'], island, islands, rng)
+                for other in range(islands):
+                    if other != island:
+                        inboxes[other].put((island, epoch, migration.emigrants if other in targets else []))
+                accepted = immigrate(population, _receive(inboxes[island], epoch, waiting, pending))
+                if accepted:
+                    # The generation's record was written before the immigrants arrived; the newer
+                    # record of the same generation is the one restore uses
+                    log.end_generation(config, population.population, population.species)
+                results.put(('migration', island, population.generation, accepted))
+                epoch += 1
+        results.put(('finished', island, population.best_genome, None))
+    except Exception:
+        results.put(('finished', island, None, traceback.format_exc()))
+    finally:
+        if log is not None:
+            log.close()
+        for other in range(islands):
+            if other != island:
+                inboxes[other].put((island, None, None))
+
+
+def run_islands(config_file=DEFAULT_CONFIG_PATH, generations=100, settings=None, resume=False):
+    """
+    Run the island model.
+
+    Args:
+        config_file: Path to the NEAT configuration file.
+        generations: Generations per island.
+        settings: Island settings, None reads the [Islands] section.
+        resume: Continue every island from the newest generation of its checkpoint log.
+
+    Returns:
+        The best genome over all islands.
+    """
+    settings = settings or read_island_settings(config_file)
+    islands = settings['islands']
+    inboxes = [multiprocessing.Queue() for _ in range(islands)]
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=_island_main, name='island{0}'.format(i),
+                                         args=(i, config_file, generations, settings, inboxes, results, resume))
+                 for i in range(islands)]
+    print("Starting {0} islands ({1} topology, {2} genomes every {3} generations)...".format(
+        islands, settings['topology'], settings['migration_count'], settings['migration_interval']))
+    for process in processes:
+        process.start()
+
+    best, errors, running = None, [], islands
+    while running:
+        try:
+            message = results.get(timeout=1.0)
+        except queue.Empty:
+            if not any(process.is_alive() for process in processes):
+                break
+            continue
+        if message[0] == 'generation':
+            _, island, generation, best_fitness, mean_fitness, species = message
+            print("Island {0} generation {1}: best {2:.3f}, mean {3:.3f}, {4} species".format(
+                island, generation, best_fitness, mean_fitness, species))
+        elif message[0] == 'migration':
+            print("Island {0}: {1} immigrants before generation {2}".format(message[1], message[3], message[2]))
+        else:
+            _, island, genome, error = message
+            running -= 1
+            if error is not None:
+                errors.append((island, error))
+            elif genome is not None and (best is None or genome.fitness > best.fitness):
+                best = genome
+    for process in processes:
+        process.join()
+    for island, error in errors:
+        print("Island {0} failed:\n{1}".format(island, error))
+    if best is None:
+        raise RuntimeError("No island finished")
+    return best
+
+
+def main():
+    from odwWahNN_Neat import save_winner
+
+    parser = argparse.ArgumentParser(description="Run the NEAT evolution as an island model.")
+    parser.add_argument('--config', default=DEFAULT_CONFIG_PATH, help="NEAT configuration file")
+    parser.add_argument('--generations', type=int, required=True, help="Generations per island")
+    parser.add_argument('--islands', type=int, default=None, help="Override the number of islands")
+    parser.add_argument('--resume', action='store_true', help="Continue the islands from their checkpoint logs")
+    args = parser.parse_args()
+
+    settings = read_island_settings(args.config)
+    if args.islands is not None:
+        settings['islands'] = args.islands
+    winner = run_islands(args.config, args.generations, settings, args.resume)
+    print('\nBest genome:\n{!s}'.format(winner))
+    save_winner(winner, 'best_genome.genome')
+
+
+if __name__ == '__main__':
+    main()
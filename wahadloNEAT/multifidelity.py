@@ -0,0 +1,230 @@
+"""
+Two-stage (multi-fidelity) genome evaluation.
+
+Stage 1 screens every genome with a short episode, either on the pymunk pool or with the analytic
+batch model. Stage 2 runs the full-length episode (on the executor's simulator, pymunk by
+default) only for the promoted genomes: the best ``promote_fraction`` of the population plus
+every genome whose screening fitness is within ``leader_margin`` of its species leader. The other genomes keep a conservatively extrapolated
+fitness that never ranks them above a promoted genome.
+
+After every generation the disagreement between the stage-1 and stage-2 rankings of the promoted
+genomes is logged, which shows whether the screening episode is long enough.
+"""
+import numpy as np
+from neat.reporting import BaseReporter
+
+import batch_sim
+from evaluation import score_failures
+from network_cache import shared_factory
+from fitness import fitness_from_errors
+from odwroconeWahadloModelNN_modul_old import DT, SIM_TIME
+from settings import DEFAULT_CONFIG_PATH, read_section, get_bool, get_float
+from termination import TerminationPolicy
+
+SCREEN_BACKENDS = ('pymunk', 'analytic')
+
+
+def episode_steps(duration):
+    """Number of control steps of an episode of ``duration`` seconds."""
+    return TerminationPolicy.remaining_steps(-DT, duration, DT)
+
+
+def rank_disagreement(first, second):
+    """
+    Fraction of pairs ordered differently by two score vectors (normalized Kendall distance).
+
+    Args:
+        first, second: Scores of the same items, arrays of shape (n,).
+
+    Returns:
+        float: 0.0 for identical rankings, 1.0 for reversed ones (0.0 for fewer than two items).
+    """
+    first, second = np.asarray(first, dtype=float), np.asarray(second, dtype=float)
+    if len(first) < 2:
+        return 0.0
+    upper = np.triu_indices(len(first), 1)
+    order1 = np.sign(first[:, None] - first[None, :])[upper]
+    order2 = np.sign(second[:, None] - second[None, :])[upper]
+    return float(np.mean(order1 != order2))
+
+
+class MultiFidelityEvaluator(BaseReporter):
+    """
+    Fitness function running a cheap screening pass before the full episode.
+
+    Wraps an evaluation.EvaluationExecutor (used for the pymunk episodes, its cache, termination
+    policy and best fitness). Add the evaluator as a reporter so it learns the species of the
+    next generation:
+
+        with EvaluationExecutor(config) as executor:
+            evaluator = MultiFidelityEvaluator.from_config(executor)
+            p.add_reporter(evaluator)
+            winner = p.run(evaluator.eval_genomes, generations)
+    """
+
+    def __init__(self, executor, screen_backend='pymunk', screen_time=5.0, full_time=SIM_TIME,
+                 promote_fraction=0.2, leader_margin=0.01, extrapolation_factor=1.5, species_set=None,
+                 integrator=None):
+        """
+        Args:
+            executor: evaluation.EvaluationExecutor running the pymunk episodes.
+            screen_backend: 'pymunk' (short episode on the pool) or 'analytic' (batch_sim in this process).
+            screen_time: Length of the screening episode in seconds.
+            full_time: Length of the full episode in seconds.
+            promote_fraction: Fraction of the population promoted by screening rank.
+            leader_margin: Genomes whose screening fitness is within this fraction of their
+                           species leader's are promoted too.
+            extrapolation_factor: Multiplier (>= 1) of the screening error scaled to the full episode.
+            species_set: Species of the first generation (e.g. ``population.species``); later
+                         generations are taken from ``end_generation``.
+            integrator: Integrator of the analytic screening model, default batch_sim.DEFAULT_INTEGRATOR.
+        """
+        if screen_backend not in SCREEN_BACKENDS:
+            raise ValueError("Unknown screening backend {0!r}, expected one of {1}".format(
+                screen_backend, SCREEN_BACKENDS))
+        self.executor = executor
+        self.screen_backend = screen_backend
+        self.screen_time = screen_time
+        self.full_time = full_time
+        self.promote_fraction = promote_fraction
+        self.leader_margin = leader_margin
+        self.extrapolation_factor = extrapolation_factor
+        self.species_set = species_set
+        self.integrator = integrator
+        self.history = []
+
+    @classmethod
+    def from_config(cls, executor, filename=DEFAULT_CONFIG_PATH, species_set=None):
+        """
+        Build the evaluator from the [MultiFidelity] section of a NEAT configuration file (the
+        analytic integrator from its [Simulation] section).
+
+        Returns:
+            MultiFidelityEvaluator, or None if the section is missing or disabled.
+        """
+        params = read_section(filename, 'MultiFidelity')
+        if not get_bool(params, 'enabled', False):
+            return None
+        return cls(executor,
+                   screen_backend=params.get('screen_backend', 'pymunk').strip(),
+                   screen_time=get_float(params, 'screen_time', 5.0),
+                   full_time=get_float(params, 'full_time', SIM_TIME),
+                   promote_fraction=get_float(params, 'promote_fraction', 0.2),
+                   leader_margin=get_float(params, 'leader_margin', 0.01),
+                   extrapolation_factor=get_float(params, 'extrapolation_factor', 1.5),
+                   species_set=species_set,
+                   integrator=batch_sim.integrator_from_config(filename))
+
+    def end_generation(self, config, population, species_set):
+        self.species_set = species_set
+
+    def screen(self, genomes, config):
+        """
+        Stage 1: short episode for every genome.
+
+        Returns:
+            dict: genome ID -> cumulative error vector of the screening episode (None if it failed).
+        """
+        termination = self.executor.termination and self.executor.termination.with_budget(None)
+        if self.screen_backend == 'analytic':
+            nets = shared_factory(config, self.executor.pruner).batch([genome for _, genome in genomes])
+            errors = batch_sim.simulate_batch(nets, duration=self.screen_time, termination=termination,
+                                              integrator=self.integrator)
+            return {genome_id: row for (genome_id, _), row in zip(genomes, errors)}
+        return self.executor.map_errors(genomes, termination, self.screen_time)
+
+    def select(self, genomes, screen_fitness):
+        """
+        Choose the genomes promoted to the full episode.
+
+        Args:
+            genomes: List of (genome_id, genome) pairs that were screened.
+            screen_fitness: dict genome ID -> screening fitness (genomes whose screening failed
+                            are left out and not promoted).
+
+        Returns:
+            set: IDs of the promoted genomes.
+        """
+        ranked = sorted(screen_fitness, key=screen_fitness.get, reverse=True)
+        promoted = set(ranked[:max(1, int(round(self.promote_fraction * len(ranked))))])
+
+        if self.species_set is not None:
+            members = {}
+            for genome_id, _ in genomes:
+                species_id = self.species_set.genome_to_species.get(genome_id)
+                if species_id is not None and genome_id in screen_fitness:
+                    members.setdefault(species_id, []).append(genome_id)
+            for ids in members.values():
+                leader = max(screen_fitness[i] for i in ids)
+                threshold = leader - self.leader_margin * abs(leader)
+                promoted.update(i for i in ids if screen_fitness[i] >= threshold)
+        return promoted
+
+    def eval_genomes(self, genomes, config):
+        """
+        NEAT fitness function: screening pass, then full episodes for the promoted genomes.
+
+        Args:
+            genomes: List of (genome_id, genome) pairs to evaluate.
+            config: NEAT configuration object.
+        """
+        executor = self.executor
+
+        # Genomes with a known full-episode fitness skip both stages
+        termination = executor.termination and executor.termination.with_budget(executor.best_fitness)
+        pending = []
+        hashes = {}
+        for genome_id, genome in genomes:
+            found, key = executor.lookup(genome, termination, self.full_time)
+            if not found:
+                hashes[genome_id] = key
+                pending.append((genome_id, genome))
+        if not pending:
+            return
+
+        print("Screening {0} genomes ({1}, {2:g} s)...".format(len(pending), self.screen_backend, self.screen_time))
+        screen_errors = self.screen(pending, config)
+        screen_fitness = {genome_id: fitness_from_errors(sE) for genome_id, sE in screen_errors.items()
+                          if sE is not None}
+        failed = [genome for genome_id, genome in pending if genome_id not in screen_fitness]
+        for genome in failed:
+            genome.fitness = None
+        promoted = self.select(pending, screen_fitness)
+
+        # Stage 2: full episode
+        promoted_genomes = [(genome_id, genome) for genome_id, genome in pending if genome_id in promoted]
+        full_errors = executor.map_errors(promoted_genomes, termination, self.full_time)
+        genome_map = dict(pending)
+        full_fitness = {}
+        for genome_id, sE in full_errors.items():
+            fitness = executor.assign(genome_map[genome_id], sE, hashes[genome_id])
+            if fitness is None:
+                failed.append(genome_map[genome_id])
+            else:
+                full_fitness[genome_id] = fitness
+
+        # Everybody else: screening error scaled to the full episode, never above a promoted genome
+        scale = self.extrapolation_factor * episode_steps(self.full_time) / episode_steps(self.screen_time)
+        floor = min(full_fitness.values(), default=None)
+        for genome_id, sE in screen_errors.items():
+            if genome_id in promoted or sE is None:
+                continue
+            fitness = float(fitness_from_errors(np.asarray(sE) * scale))
+            genome_map[genome_id].fitness = fitness if floor is None else min(fitness, floor)
+            if executor.keep_errors:
+                # Not simulated in full, ranked behind every promoted genome
+                genome_map[genome_id].errors = None
+
+        simulated = [genome.fitness for _, genome in genomes if genome.fitness is not None]
+        score_failures(failed, simulated)
+        if simulated and (executor.best_fitness is None or max(simulated) > executor.best_fitness):
+            executor.best_fitness = max(simulated)
+
+        ids = [genome_id for genome_id in full_fitness if genome_id in screen_fitness]
+        disagreement = rank_disagreement([screen_fitness[i] for i in ids], [full_fitness[i] for i in ids])
+        top_agrees = bool(ids) and max(ids, key=screen_fitness.get) == max(ids, key=full_fitness.get)
+        self.history.append({'screened': len(pending), 'promoted': len(ids),
+                             'rank_disagreement': disagreement, 'top_agrees': top_agrees})
+        print("Multi-fidelity: promoted {0}/{1}, stage-1/stage-2 rank disagreement {2:.1%}, "
+              "stage-1 best {3} stage-2 best".format(len(ids), len(pending), disagreement,
+                                                     'is' if top_agrees else 'is not'))
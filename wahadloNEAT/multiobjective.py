@@ -0,0 +1,247 @@
+"""
+Multi-objective selection over the six cumulative error components (NSGA-II style).
+
+With ``objectives = pareto`` in the [Evolution] section the executor keeps every genome's error
+vector (``genome.errors``) next to its weighted fitness, and ``ParetoReproduction`` replaces
+neat.DefaultReproduction:
+
+    * all genomes are ranked by non-dominated sorting of their absolute errors (front 0 is the
+      Pareto front) and ordered within a front by crowding distance;
+    * within a species, elites and parents are taken in that order instead of by fitness;
+    * offspring are shared between species by the mean front score of their members.
+
+The weighted fitness is still what stagnation, the reporters and the returned winner use, so a
+Pareto run is a drop-in for a weighted one and also yields the whole trade-off front
+(``ParetoReproduction.front``, written by ``save_front``).
+
+Sorting and crowding are vectorized over the population (an N x N dominance matrix and one
+lexsort per objective), which keeps reproduction cheap at a few thousand genomes.
+"""
+import json
+import math
+import os
+import random
+
+import numpy as np
+from neat.reproduction import DefaultReproduction
+
+from genome_codec import save_genome, GENOME_SUFFIX
+from settings import DEFAULT_CONFIG_PATH, read_section
+
+OBJECTIVES = ('weighted', 'pareto')
+
+
+def objectives_from_config(filename=DEFAULT_CONFIG_PATH):
+    """
+    The ``objectives`` option of the [Evolution] section.
+
+    Returns:
+        str: 'weighted' (one scalar fitness, the default) or 'pareto'.
+    """
+    objectives = read_section(filename, 'Evolution').get('objectives', 'weighted').strip().lower()
+    if objectives not in OBJECTIVES:
+        raise ValueError("Unknown objectives {0!r}, expected one of {1}".format(objectives, ', '.join(OBJECTIVES)))
+    return objectives
+
+
+def reproduction_from_config(filename=DEFAULT_CONFIG_PATH):
+    """Reproduction class for neat.Config: ParetoReproduction or neat.DefaultReproduction."""
+    if objectives_from_config(filename) == 'pareto':
+        return ParetoReproduction
+    return DefaultReproduction
+
+
+def dominance_matrix(objectives):
+    """
+    Pairwise Pareto dominance (all objectives minimized).
+
+    Args:
+        objectives: Array of shape (N, M).
+
+    Returns:
+        np.ndarray: Boolean (N, N) array, ``[i, j]`` is True if genome i dominates genome j.
+    """
+    objectives = np.asarray(objectives, dtype=float)
+    n = len(objectives)
+    no_worse = np.ones((n, n), dtype=bool)
+    better = np.zeros((n, n), dtype=bool)
+    for column in objectives.T:
+        no_worse &= column[:, None] <= column[None, :]
+        better |= column[:, None] < column[None, :]
+    return no_worse & better
+
+
+def non_dominated_sort(objectives):
+    """
+    Front index of every row (0 = not dominated by any other row).
+
+    Args:
+        objectives: Array of shape (N, M), minimized.
+
+    Returns:
+        np.ndarray: Integer ranks of shape (N,).
+    """
+    dominates = dominance_matrix(objectives)
+    dominated_by = dominates.sum(axis=0)
+    ranks = np.full(len(dominated_by), -1)
+    front = np.flatnonzero(dominated_by == 0)
+    rank = 0
+    while len(front):
+        ranks[front] = rank
+        # Peel the front off: its members no longer count against the rows they dominate
+        dominated_by -= dominates[front].sum(axis=0)
+        dominated_by[front] = -1
+        front = np.flatnonzero(dominated_by == 0)
+        rank += 1
+    return ranks
+
+
+def crowding_distance(objectives, ranks):
+    """
+    NSGA-II crowding distance of every row within its front.
+
+    The boundary rows of a front get infinity; the others the sum over the objectives of the gap
+    between their two neighbours, normalized by the front's range.
+
+    Args:
+        objectives: Array of shape (N, M).
+        ranks: Front index of every row (non_dominated_sort).
+
+    Returns:
+        np.ndarray: Distances of shape (N,).
+    """
+    objectives = np.asarray(objectives, dtype=float)
+    ranks = np.asarray(ranks)
+    distance = np.zeros(len(objectives))
+    if not len(objectives):
+        return distance
+    for column in objectives.T:
+        # Rows grouped by front, sorted by this objective within the front
+        order = np.lexsort((column, ranks))
+        values, fronts = column[order], ranks[order]
+        first = np.r_[True, fronts[1:] != fronts[:-1]]
+        last = np.r_[fronts[1:] != fronts[:-1], True]
+        span = (values[last] - values[first])[np.cumsum(first) - 1]
+        gap = np.zeros(len(values))
+        gap[1:-1] = values[2:] - values[:-2]
+        contribution = np.divide(gap, span, out=np.zeros_like(gap), where=span > 0)
+        contribution[first | last] = np.inf
+        distance[order] += contribution
+    return distance
+
+
+def pareto_ranks(genomes):
+    """
+    Front index and crowding distance of genomes carrying an ``errors`` vector.
+
+    Genomes without errors (failed or not simulated) are put in a front behind all others.
+
+    Args:
+        genomes: List of genomes.
+
+    Returns:
+        Tuple (ranks, crowding) of arrays in the order of ``genomes``.
+    """
+    errors = [getattr(g, 'errors', None) for g in genomes]
+    known = np.array([e is not None for e in errors], dtype=bool)
+    ranks = np.zeros(len(genomes), dtype=int)
+    crowding = np.zeros(len(genomes))
+    if known.any():
+        objectives = np.abs(np.array([e for e in errors if e is not None], dtype=float))
+        ranks[known] = non_dominated_sort(objectives)
+        crowding[known] = crowding_distance(objectives, ranks[known])
+    ranks[~known] = ranks[known].max() + 1 if known.any() else 0
+    return ranks, crowding
+
+
+class ParetoReproduction(DefaultReproduction):
+    """
+    neat.DefaultReproduction with NSGA-II selection.
+
+    Configured by the [ParetoReproduction] section (same options as [DefaultReproduction]).
+    """
+
+    def __init__(self, config, reporters, stagnation):
+        super(ParetoReproduction, self).__init__(config, reporters, stagnation)
+        self.front = []     # Genomes of the first front of the latest evaluated generation
+
+    def reproduce(self, config, species, pop_size, generation):
+        members = [g for s in species.species.values() for g in s.members.values()]
+        ranks, crowding = pareto_ranks(members)
+        order = {g.key: (int(r), -float(c)) for g, r, c in zip(members, ranks, crowding)}
+        self.front = [g for g, r in zip(members, ranks) if r == 0 and getattr(g, 'errors', None) is not None]
+        fronts = int(ranks.max()) + 1 if len(ranks) else 0
+        self.reporters.info("Pareto front: {0} genomes, {1} fronts".format(len(self.front), fronts))
+
+        # Stagnation still follows the weighted fitness
+        remaining_species = []
+        for stag_sid, stag_s, stagnant in self.stagnation.update(species, generation):
+            if stagnant:
+                self.reporters.species_stagnant(stag_sid, stag_s)
+            else:
+                remaining_species.append(stag_s)
+        if not remaining_species:
+            species.species = {}
+            return {}
+
+        # Species share the offspring by the mean front score of their members (1 = first front)
+        for s in remaining_species:
+            s.adjusted_fitness = float(np.mean([1.0 - order[key][0] / fronts for key in s.members]))
+        adjusted_fitnesses = [s.adjusted_fitness for s in remaining_species]
+        self.reporters.info("Average adjusted fitness: {:.3f}".format(float(np.mean(adjusted_fitnesses))))
+
+        previous_sizes = [len(s.members) for s in remaining_species]
+        min_species_size = max(self.reproduction_config.min_species_size, self.reproduction_config.elitism)
+        spawn_amounts = self.compute_spawn(adjusted_fitnesses, previous_sizes, pop_size, min_species_size)
+
+        new_population = {}
+        species.species = {}
+        for spawn, s in zip(spawn_amounts, remaining_species):
+            spawn = max(spawn, self.reproduction_config.elitism)
+            old_members = list(s.members.items())
+            s.members = {}
+            species.species[s.key] = s
+
+            # Crowded comparison: lower front first, then the less crowded genome
+            old_members.sort(key=lambda item: order[item[0]])
+            for i, m in old_members[:self.reproduction_config.elitism]:
+                new_population[i] = m
+                spawn -= 1
+            if spawn <= 0:
+                continue
+
+            repro_cutoff = int(math.ceil(self.reproduction_config.survival_threshold * len(old_members)))
+            old_members = old_members[:max(repro_cutoff, 2)]
+            while spawn > 0:
+                spawn -= 1
+                parent1_id, parent1 = random.choice(old_members)
+                parent2_id, parent2 = random.choice(old_members)
+                gid = next(self.genome_indexer)
+                child = config.genome_type(gid)
+                child.configure_crossover(parent1, parent2, config.genome_config)
+                child.mutate(config.genome_config)
+                new_population[gid] = child
+                self.ancestors[gid] = (parent1_id, parent2_id)
+
+        return new_population
+
+
+def save_front(front, directory='pareto_front'):
+    """
+    Write the genomes of a Pareto front and a summary of their errors.
+
+    Every genome goes to ``<directory>/genome-<key>.genome``; ``<directory>/front.json`` lists
+    key, weighted fitness and error vector of each, sorted by fitness.
+
+    Returns:
+        str: Path of the summary file.
+    """
+    os.makedirs(directory, exist_ok=True)
+    summary = []
+    for genome in sorted(front, key=lambda g: g.fitness, reverse=True):
+        save_genome(genome, os.path.join(directory, 'genome-{0}{1}'.format(genome.key, GENOME_SUFFIX)))
+        summary.append({'genome': genome.key, 'fitness': genome.fitness, 'errors': list(genome.errors)})
+    filename = os.path.join(directory, 'front.json')
+    with open(filename, 'w') as f:
+        json.dump(summary, f, indent=2)
+    return filename
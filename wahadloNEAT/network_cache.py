@@ -0,0 +1,110 @@
+"""
+Compiled networks cached by genome content.
+
+Building a CompiledNetwork means the feed-forward layer analysis, laying out the weight matrices
+and generating the scalar ``activate`` code; elites that survive unchanged, genomes evaluated
+twice by the multi-fidelity screen and replayed winners would pay for it again every time.
+``NetworkFactory`` keeps a bounded LRU of the compiled evaluation plan (node order, input slots,
+weights, see compiled_net.compile_plan) and of the network built from it, keyed by
+fitness_cache.genome_hash, so an unchanged phenotype is compiled once per process. Plans are
+pruned (pruning.Pruner) before they are cached.
+
+``shared_factory(config, pruner)`` is the factory of a NEAT config and pruning settings used by
+the evaluation workers, the in-process evaluators and the replay paths alike; callers pass the
+``Pruner.from_config`` of their run's configuration file.
+"""
+import weakref
+from collections import OrderedDict
+
+from compiled_net import CompiledNetwork, BatchNetwork, compile_plan
+from fitness_cache import genome_hash
+
+DEFAULT_MAXSIZE = 1000
+
+_factories = weakref.WeakKeyDictionary()
+
+
+def shared_factory(config, pruner=None):
+    """
+    The NetworkFactory of a NEAT config and pruning settings, created on first use (one per
+    process, config and settings).
+
+    Args:
+        config: NEAT configuration object.
+        pruner: pruning.Pruner of the run (``Pruner.from_config`` of its configuration file),
+                None builds unpruned networks.
+    """
+    factories = _factories.get(config)
+    if factories is None:
+        factories = _factories[config] = {}
+    settings = None if pruner is None else pruner.settings
+    factory = factories.get(settings)
+    if factory is None:
+        factory = factories[settings] = NetworkFactory(config, pruner=pruner)
+    return factory
+
+
+class NetworkFactory(object):
+    """LRU map from genome_hash to [NetworkPlan, CompiledNetwork or None], with hit/miss counters."""
+
+    def __init__(self, config, maxsize=DEFAULT_MAXSIZE, pruner=None):
+        """
+        Args:
+            config: NEAT configuration object.
+            maxsize: Number of phenotypes kept.
+            pruner: Optional pruning.Pruner applied to every compiled plan.
+        """
+        self.config = config
+        self.maxsize = maxsize
+        self.pruner = pruner
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _entry(self, genome):
+        key = genome_hash(genome)
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+        self.misses += 1
+        plan = compile_plan(genome, self.config)
+        if self.pruner is not None:
+            plan, _ = self.pruner.prune(plan, self.config)
+        entry = self.entries[key] = [plan, None]
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+        return entry
+
+    def plan(self, genome):
+        """NetworkPlan of a genome (DefaultGenome or genome_codec.GenomeView)."""
+        return self._entry(genome)[0]
+
+    def create(self, genome):
+        """
+        CompiledNetwork of a genome, same as ``CompiledNetwork.create(genome, config)`` (up to pruning).
+
+        The network is shared by all callers asking for the same phenotype; it holds no state
+        between ``activate`` calls.
+        """
+        entry = self._entry(genome)
+        if entry[1] is None:
+            entry[1] = CompiledNetwork.from_plan(entry[0], self.config)
+        return entry[1]
+
+    def batch(self, genomes):
+        """BatchNetwork of a sequence of genomes, same as ``BatchNetwork.create(genomes, config)`` (up to pruning)."""
+        return BatchNetwork.from_plans([self.plan(genome) for genome in genomes], self.config)
+
+    def stats(self):
+        """Return a dict with size, hits, misses, hit rate and the pruning statistics."""
+        lookups = self.hits + self.misses
+        stats = {'size': len(self.entries), 'hits': self.hits, 'misses': self.misses,
+                 'hit_rate': self.hits / lookups if lookups else 0.0}
+        if self.pruner is not None:
+            stats['pruning'] = self.pruner.stats()
+        return stats
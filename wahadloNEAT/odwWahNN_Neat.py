@@ -2,12 +2,34 @@ import os
 import neat
 import odwroconeWahadloModelNN_modul
 import odwroconeWahadloModelNN_modul_old
+import batch_sim
+from network_cache import shared_factory
+from pruning import Pruner
+from fitness import fitness_from_errors
+from evaluation import EvaluationExecutor, simulator_from_config, simulation_options_from_config
+from eval_service import executor_from_config
+from termination import TerminationPolicy
+from settings import DEFAULT_CONFIG_PATH
+from fitness_cache import FitnessCache
+import checkpoint_log
+from checkpoint_log import CheckpointLog
+from multifidelity import MultiFidelityEvaluator
+from profiling import ProfilingReporter
+from streaming_stats import StreamingStatistics
+from scenarios import ScenarioSet
+from trajectory import TrajectoryReporter
+from genome_codec import save_genome, load_genome
+from multiobjective import ParetoReproduction, reproduction_from_config, save_front
+from fast_species import VectorizedSpeciesSet, species_set_from_config
+from compact_population import population_type_from_config, genome_storage_from_config, compact_population
 import visualize
-import pickle
-from multiprocessing import Pool
+from evolution_engine import EvolutionEngine, format_progress
 import itertools
-import tkinter as tk
-from tkinter import filedialog, messagebox
+
+# Milliseconds between two polls of the background evolution's progress queue
+POLL_INTERVAL_MS = 200
+# EvolutionEngine of the evolution running in the background (GUI only)
+current_engine = None
 
 # Generate all input combinations for 6 inputs
 xor_inputs = list(itertools.product([0, 1], repeat=6))
@@ -15,93 +37,144 @@ xor_inputs = list(itertools.product([0, 1], repeat=6))
 # Generate XOR outputs based on input combinations
 xor_outputs = [(a ^ b ^ c ^ d, e ^ f) for (a, b, c, d, e, f) in xor_inputs]
 
-def evaluate_genome(genome_data):
+def eval_genomes(genomes, config, config_file=DEFAULT_CONFIG_PATH):
     """
-    Evaluate a single genome using the neural network and simulation.
+    Evaluate all genomes in a population using multiprocessing.
 
-    Args:
-        genome_data: Tuple containing genome ID, genome, and NEAT config.
+    Starts a pool for this call only; long runs should use an EvaluationExecutor
+    that lives for the whole Population.run (see run and resume_from_checkpoint).
 
-    Returns:
-        Tuple containing genome ID and fitness score.
+    Args:
+        genomes: List of genomes to evaluate.
+        config: NEAT configuration object.
+        config_file: Path to the NEAT configuration file with the [Simulation], [Termination]
+                     and [Scenarios] sections (bind it with functools.partial).
     """
-    genome_id, genome, config = genome_data
-    try:
-        net = neat.nn.FeedForwardNetwork.create(genome, config)
-        sE = odwroconeWahadloModelNN_modul_old.odwroconeWahadloModelKx(net, False)
-        fitness = -10000 - (0.05 * abs(sE[0]) + 0.05 * abs(sE[1]) + abs(sE[2]) + 0.05 * abs(sE[3]) + 0.2 * abs(sE[4]) + 0.2 * abs(sE[5]))
-        return genome_id, fitness
-    except Exception as e:
-        print(f"Error evaluating genome {genome_id}: {e}")
-        return genome_id, 0
-
-def eval_genomes(genomes, config):
+    with EvaluationExecutor(config, simulator=simulator_from_config(config_file),
+                            simulation_options=simulation_options_from_config(config_file),
+                            pruner=Pruner.from_config(config_file),
+                            termination=TerminationPolicy.from_config(config_file),
+                            scenarios=ScenarioSet.from_config(config_file)) as executor:
+        executor.eval_genomes(genomes, config)
+
+def eval_genomes_batch(genomes, config, config_file=DEFAULT_CONFIG_PATH):
     """
-    Evaluate all genomes in a population using multiprocessing.
+    Evaluate all genomes in a population in lockstep with the NumPy batch simulator
+    (analytic model, integrator from the [Simulation] section).
 
     Args:
         genomes: List of genomes to evaluate.
         config: NEAT configuration object.
+        config_file: Path to the NEAT configuration file with the [Simulation] and
+                     [Termination] sections (bind it with functools.partial).
+    """
+    print("Evaluating genomes with the batch simulator...")
+    nets = shared_factory(config, Pruner.from_config(config_file)).batch([genome for _, genome in genomes])
+    termination = TerminationPolicy.from_config(config_file)
+    fitnesses = fitness_from_errors(batch_sim.simulate_batch(
+        nets, termination=termination, integrator=batch_sim.integrator_from_config(config_file)))
+    for (genome_id, genome), fitness in zip(genomes, fitnesses):
+        genome.fitness = float(fitness)
+
+def fitness_function(population, executor, config_file=DEFAULT_CONFIG_PATH):
+    """
+    Pick the fitness function for a run: two-stage evaluation if [MultiFidelity] is enabled,
+    otherwise the executor's full evaluation.
+
+    Args:
+        population: The neat.Population about to run.
+        executor: The running EvaluationExecutor.
+        config_file: Path to the NEAT configuration file.
     """
-    print("Evaluating genomes with multiprocessing...")
-    genome_data = [(genome_id, genome, config) for genome_id, genome in genomes]
-    with Pool() as pool:
-        results = pool.map(evaluate_genome, genome_data)
-    for genome_id, fitness in results:
-        for gid, genome in genomes:
-            if gid == genome_id:
-                genome.fitness = fitness
-                break
+    evaluator = MultiFidelityEvaluator.from_config(executor, config_file, population.species)
+    if evaluator is None:
+        return executor.eval_genomes
+    population.add_reporter(evaluator)
+    return evaluator.eval_genomes
 
 def save_winner(winner, filename):
     """
-    Save the best genome to a file.
+    Save the best genome to a file (genome_codec encoding).
 
     Args:
         winner: The best genome.
         filename: File path to save the genome.
     """
-    with open(filename, 'wb') as f:
-        pickle.dump(winner, f)
+    save_genome(winner, filename)
     print(f"Best genome saved to {filename}.")
 
-def load_winner(filename):
+def load_winner(filename, config=None):
     """
     Load the best genome from a file.
 
     Args:
-        filename: File path of the saved genome.
+        filename: File path of the saved genome (``.genome``, or a pickled ``.pkl`` from older runs).
+        config: Optional NEAT configuration object providing the genome and gene types.
 
     Returns:
         The loaded genome.
     """
-    with open(filename, 'rb') as f:
-        return pickle.load(f)
+    return load_genome(filename, config)
 
-def run(config_file):
+def run(config_file, generations_to_run, progress=None, show_winner=True):
     """
     Run NEAT evolution.
 
     Args:
         config_file: Path to the NEAT configuration file.
+        generations_to_run: Number of generations to run.
+        progress: Optional reporter added to the population (see evolution_engine).
+        show_winner: Replay the winner in a pygame window at the end.
+
+    Returns:
+        The best genome.
     """
-    config = neat.Config(neat.DefaultGenome, neat.DefaultReproduction,
-                         neat.DefaultSpeciesSet, neat.DefaultStagnation,
+    config = neat.Config(neat.DefaultGenome, reproduction_from_config(config_file),
+                         species_set_from_config(config_file), neat.DefaultStagnation,
                          config_file)
-    p = neat.Population(config)
+    p = population_type_from_config(config_file)(config)
     p.add_reporter(neat.StdOutReporter(True))
-    stats = neat.StatisticsReporter()
+    stats = StreamingStatistics.from_config(config_file)
     p.add_reporter(stats)
-    p.add_reporter(neat.Checkpointer(200))
+    cache = FitnessCache()
+    log = CheckpointLog.from_config(cache, config_file)
+    p.add_reporter(log)
+    profiler = ProfilingReporter.from_config(config_file)
+    if profiler is not None:
+        profiler.attach(p)
+    if progress is not None:
+        p.add_reporter(progress)
 
     print("Starting NEAT evolution...")
-    winner = p.run(eval_genomes, generations)
+    try:
+        with executor_from_config(config, config_file, simulator=simulator_from_config(config_file),
+                                  simulation_options=simulation_options_from_config(config_file),
+                                  pruner=Pruner.from_config(config_file),
+                                  termination=TerminationPolicy.from_config(config_file), cache=cache,
+                                  profiler=profiler, scenarios=ScenarioSet.from_config(config_file),
+                                  keep_errors=isinstance(p.reproduction, ParetoReproduction)) as executor:
+            if isinstance(p.species, VectorizedSpeciesSet):
+                p.species.attach(executor)
+            recorder = TrajectoryReporter.from_config(executor, config_file)
+            if recorder is not None:
+                p.add_reporter(recorder)
+            winner = p.run(fitness_function(p, executor, config_file), generations_to_run)
+    finally:
+        log.close()
+        if profiler is not None:
+            profiler.close()
+    print("Fitness cache: {0}".format(cache.stats()))
 
     print('\nBest genome:\n{!s}'.format(winner))
-    save_winner(winner, 'best_genome.pkl')
-
-    net = neat.nn.FeedForwardNetwork.create(winner, config)
-    odwroconeWahadloModelNN_modul_old.odwroconeWahadloModelKx(net, True)
+    save_winner(winner, 'best_genome.genome')
+    if isinstance(p.reproduction, ParetoReproduction):
+        print("Pareto front saved to {0}.".format(save_front(p.reproduction.front)))
+
+    if show_winner:
+        net = shared_factory(config, Pruner.from_config(config_file)).create(winner)
+        odwroconeWahadloModelNN_modul_old.odwroconeWahadloModelKx(
+            net, True, timing=odwroconeWahadloModelNN_modul_old.SimulationTiming.from_config(config_file))
+    return winner
 
 def replay(config_file, winner_file):
     """
@@ -114,66 +187,171 @@ def replay(config_file, winner_file):
     config = neat.Config(neat.DefaultGenome, neat.DefaultReproduction,
                          neat.DefaultSpeciesSet, neat.DefaultStagnation,
                          config_file)
-    winner = load_winner(winner_file)
+    winner = load_winner(winner_file, config)
     print('\nLoaded genome:\n{!s}'.format(winner))
 
-    net = neat.nn.FeedForwardNetwork.create(winner, config)
-    odwroconeWahadloModelNN_modul_old.odwroconeWahadloModelKx(net, True)
+    net = shared_factory(config, Pruner.from_config(config_file)).create(winner)
+    odwroconeWahadloModelNN_modul_old.odwroconeWahadloModelKx(
+        net, True, timing=odwroconeWahadloModelNN_modul_old.SimulationTiming.from_config(config_file))
 
-def resume_from_checkpoint(checkpoint_file, generations_to_run):
+def resume_from_checkpoint(checkpoint_file, generations_to_run, generation=None, progress=None,
+                           config_file=DEFAULT_CONFIG_PATH):
     """
     Resume NEAT evolution from a checkpoint.
 
+    The NEAT parameters come from the checkpoint; the sections of this project (simulation,
+    termination, scenarios, logging, ...) are read from ``config_file`` as in ``run``.
+
     Args:
-        checkpoint_file: Path to the checkpoint file.
+        checkpoint_file: Path to a checkpoint log segment (*.ckptlog) or a neat-checkpoint-* file.
         generations_to_run: Number of generations to run.
+        generation: Generation to restore from a checkpoint log, None for the newest one.
+        progress: Optional reporter added to the population (see evolution_engine).
+        config_file: Path to the NEAT configuration file.
     """
     print(f"Restoring from checkpoint: {checkpoint_file}")
-    population = neat.Checkpointer.restore_checkpoint(checkpoint_file)
+    population, cache = checkpoint_log.restore(checkpoint_file, generation)
+    if genome_storage_from_config(config_file) == 'compact':
+        compact_population(population)
     population.add_reporter(neat.StdOutReporter(True))
-    stats = neat.StatisticsReporter()
+    stats = StreamingStatistics.from_config(config_file)
     population.add_reporter(stats)
-    population.add_reporter(neat.Checkpointer(200))
+    log = CheckpointLog.from_config(cache, config_file)
+    population.add_reporter(log)
+    profiler = ProfilingReporter.from_config(config_file)
+    if profiler is not None:
+        profiler.attach(population)
+    if progress is not None:
+        population.add_reporter(progress)
 
-    winner = population.run(eval_genomes, generations_to_run)
+    try:
+        with executor_from_config(population.config, config_file, simulator=simulator_from_config(config_file),
+                                  simulation_options=simulation_options_from_config(config_file),
+                                  pruner=Pruner.from_config(config_file),
+                                  termination=TerminationPolicy.from_config(config_file), cache=cache,
+                                  profiler=profiler, scenarios=ScenarioSet.from_config(config_file),
+                                  keep_errors=isinstance(population.reproduction, ParetoReproduction)) as executor:
+            if isinstance(population.species, VectorizedSpeciesSet):
+                population.species.attach(executor)
+            recorder = TrajectoryReporter.from_config(executor, config_file)
+            if recorder is not None:
+                population.add_reporter(recorder)
+            winner = population.run(fitness_function(population, executor, config_file), generations_to_run)
+    finally:
+        log.close()
+        if profiler is not None:
+            profiler.close()
+    print("Fitness cache: {0}".format(cache.stats()))
     print('\nBest genome after resuming:\n{!s}'.format(winner))
 
     # Save the best genome after resuming
-    save_winner(winner, 'best_genome_resumed.pkl')
+    save_winner(winner, 'best_genome_resumed.genome')
+    if isinstance(population.reproduction, ParetoReproduction):
+        print("Pareto front saved to {0}.".format(save_front(population.reproduction.front)))
 
     return winner
 
+def start_engine(engine):
+    """Start an evolution in the background and switch the buttons to the running state."""
+    global current_engine
+    current_engine = engine.start()
+    for button in (run_button, resume_button):
+        button.config(state=tk.DISABLED)
+    for button in (pause_button, cancel_button):
+        button.config(state=tk.NORMAL)
+    pause_button.config(text="Pause")
+    status_var.set("Running...")
+    root.after(POLL_INTERVAL_MS, poll_engine)
+
+def poll_engine():
+    """Show the progress events of the running evolution, called periodically from the Tk loop."""
+    global current_engine
+    finished = None
+    for event in current_engine.poll():
+        if event['type'] == 'generation':
+            progress_var.set(format_progress(event))
+        else:
+            finished = event
+    if finished is None:
+        root.after(POLL_INTERVAL_MS, poll_engine)
+        return
+
+    current_engine = None
+    for button in (run_button, resume_button):
+        button.config(state=tk.NORMAL)
+    for button in (pause_button, cancel_button):
+        button.config(state=tk.DISABLED)
+    if finished['error'] is not None:
+        status_var.set("Failed")
+        messagebox.showerror("Error", "Evolution failed: {0}".format(finished['error']))
+    elif finished['cancelled']:
+        status_var.set("Cancelled (resume from the checkpoint log)")
+    else:
+        status_var.set("Finished")
+        if finished['winner'] is not None:
+            # pygame must run on the main thread
+            net = shared_factory(neat.Config(
+                neat.DefaultGenome, neat.DefaultReproduction, neat.DefaultSpeciesSet, neat.DefaultStagnation,
+                config_path), Pruner.from_config(config_path)).create(finished['winner'])
+            odwroconeWahadloModelNN_modul_old.odwroconeWahadloModelKx(
+                net, True, timing=odwroconeWahadloModelNN_modul_old.SimulationTiming.from_config(config_path))
+
 def start_run():
     """Start the evolution process."""
     try:
         generations_to_run = int(generations_entry_run.get())
-        global generations
-        generations = generations_to_run
-        run(config_path)
     except ValueError:
         messagebox.showerror("Error", "Please enter a valid number of generations.")
+        return
+    start_engine(EvolutionEngine(run, config_path, generations_to_run, show_winner=False))
 
 def start_replay():
     """Replay the simulation using a saved genome."""
-    winner_file = filedialog.askopenfilename(title="Select Best Genome File", filetypes=[("Pickle Files", "*.pkl")])
+    winner_file = filedialog.askopenfilename(title="Select Best Genome File", filetypes=[("Genome Files", "*.genome *.pkl")])
     if winner_file:
         replay(config_path, winner_file)
 
 def start_resume():
     """Resume the evolution process from a checkpoint."""
-    checkpoint_file = filedialog.askopenfilename(title="Select Checkpoint File", filetypes=[("Checkpoint Files", "neat-checkpoint-*")])
+    checkpoint_file = filedialog.askopenfilename(title="Select Checkpoint File", filetypes=[("Checkpoint Files", "*.ckptlog neat-checkpoint-*")])
     if checkpoint_file:
         try:
             generations_to_run = int(generations_entry_resume.get())
-            resume_from_checkpoint(checkpoint_file, generations_to_run)
         except ValueError:
             messagebox.showerror("Error", "Please enter a valid number of generations.")
+            return
+        start_engine(EvolutionEngine(resume_from_checkpoint, checkpoint_file, generations_to_run,
+                                     config_file=config_path))
+
+def toggle_pause():
+    """Pause the running evolution after the current generation, or continue it."""
+    if current_engine is None:
+        return
+    if current_engine.paused:
+        current_engine.resume()
+        pause_button.config(text="Pause")
+        status_var.set("Running...")
+    else:
+        current_engine.pause()
+        pause_button.config(text="Continue")
+        status_var.set("Paused (after the current generation)")
+
+def cancel_run():
+    """Stop the running evolution after the current generation."""
+    if current_engine is not None:
+        current_engine.cancel()
+        status_var.set("Cancelling...")
 
 def exit_application():
     """Exit the application."""
+    if current_engine is not None:
+        current_engine.cancel()
     root.destroy()
 
 if __name__ == '__main__':
+    import tkinter as tk
+    from tkinter import filedialog, messagebox
+
     # Path to the configuration file
     local_dir = os.path.dirname(__file__)
     config_path = os.path.join(local_dir, 'neat-config.txt')
@@ -188,7 +366,8 @@ if __name__ == '__main__':
     generations_entry_run = tk.Entry(root)
     generations_entry_run.insert(0, "10")
     generations_entry_run.pack(pady=5)
-    tk.Button(root, text="Run Evolution", command=start_run, width=20).pack(pady=5)
+    run_button = tk.Button(root, text="Run Evolution", command=start_run, width=20)
+    run_button.pack(pady=5)
 
     tk.Button(root, text="Replay Best Genome", command=start_replay, width=20).pack(pady=5)
 
@@ -196,7 +375,18 @@ if __name__ == '__main__':
     generations_entry_resume = tk.Entry(root)
     generations_entry_resume.insert(0, "10")
     generations_entry_resume.pack(pady=5)
-    tk.Button(root, text="Resume", command=start_resume, width=20).pack(pady=5)
+    resume_button = tk.Button(root, text="Resume", command=start_resume, width=20)
+    resume_button.pack(pady=5)
+
+    # Live progress of the running evolution
+    status_var = tk.StringVar(value="Idle")
+    progress_var = tk.StringVar(value="")
+    tk.Label(root, textvariable=status_var, font=("Arial", 12)).pack(pady=5)
+    tk.Label(root, textvariable=progress_var).pack(pady=5)
+    pause_button = tk.Button(root, text="Pause", command=toggle_pause, width=20, state=tk.DISABLED)
+    pause_button.pack(pady=5)
+    cancel_button = tk.Button(root, text="Cancel", command=cancel_run, width=20, state=tk.DISABLED)
+    cancel_button.pack(pady=5)
 
     tk.Button(root, text="Exit", command=exit_application, width=20, bg="red", fg="white").pack(pady=10)
 
@@ -2,13 +2,11 @@ import sys
 import math
 from typing import List
 import numpy as np
-import pygame
 import time
 import pymunk
-import pymunk.pygame_util
 from pymunk.vec2d import Vec2d
 
-def odwroconeWahadloModelKx(net, isVis):
+def odwroconeWahadloModelKx(net, isVis, termination=None, observer=None):
     width, height = 690, 600
 
     # Physics constants
@@ -25,13 +23,7 @@ def odwroconeWahadloModelKx(net, isVis):
     COLLISION_GROUP_CART = 1
     COLLISION_GROUP_ARM = 2
 
-    # Initialize visualization and clock
     running = True
-    clock = pygame.time.Clock()
-    if isVis:
-        pygame.init()
-        screen = pygame.display.set_mode((width, height))
-        draw_options = pymunk.pygame_util.DrawOptions(screen)
 
     # Physics space
     space = pymunk.Space()
@@ -56,8 +48,13 @@ def odwroconeWahadloModelKx(net, isVis):
     arm1_joint = pymunk.constraints.PivotJoint(cart, arm1, cart.position)
     space.add(arm1, arm1_shape, arm1_joint)
 
-    # Simulation variables
+    # Visualization is an optional observer, pygame is loaded only when it is needed
     fps = 90
+    if isVis and observer is None:
+        import render
+        observer = render.PendulumRenderer(width, height, fps, cart, arm1)
+
+    # Simulation variables
     dt = 1.0 / fps
     eT = 0
     prev_cart_x = cart.position.x
@@ -65,12 +62,6 @@ def odwroconeWahadloModelKx(net, isVis):
     state_error = [0, 0, 0, 0]
 
     while running:
-        # Handle events
-        if isVis:
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    running = False
-
         # Get current state
         cart_x = cart.position.x
         cart_vx = (cart_x - prev_cart_x) / dt
@@ -86,6 +77,10 @@ def odwroconeWahadloModelKx(net, isVis):
         error = [(current_state[i] - DESIRED_STATE[i]) for i in range(len(current_state))]
         state_error = [state_error[i] + abs(error[i]) for i in range(len(error))]
 
+        # Early termination (angle/track limits; the error budget is defined for the double pendulum only)
+        if termination is not None and termination.should_stop(cart_x, (arm1_angle,), None):
+            return termination.charge_remaining(state_error, error, termination.remaining_steps(eT, 15, dt))
+
         # Apply control law
         control_signal = net.activate(error)
         cart_force = MAX_FORCE * control_signal[0]
@@ -97,48 +92,9 @@ def odwroconeWahadloModelKx(net, isVis):
         # Update physics
         space.step(dt)
 
-        # Visualization
-        if isVis:
-            screen.fill(pygame.Color("grey"))  # Set the background color
-            def pymunk_to_pygame(pos):
-                """Convert Pymunk coordinates to Pygame coordinates."""
-                return int(pos[0]), int(height - pos[1])
-            
-            # Draw the cart
-            cart_pos = pymunk_to_pygame((int(cart.position.x), int(height - cart.position.y)))
-            pygame.draw.rect(
-                screen,
-                (255, 165, 0),  # Blue color for the cart
-                pygame.Rect(cart_pos[0] - 25, cart_pos[1] - 5, 50, 10)  # Rectangle dimensions
-            )
-
-            # Draw the first arm (as an orange circle)
-            arm1_pos = pymunk_to_pygame((int(arm1.position.x), int(height - arm1.position.y)))
-            pygame.draw.circle(
-                screen,
-                (255, 165, 0),  # Orange color for the arm
-                arm1_pos,
-                10  # Radius of the circle
-            )
-
-            # Draw a line connecting the cart to the first arm
-            pygame.draw.line(
-                screen,
-                "white",  # Black color
-                cart_pos,
-                arm1_pos,
-                5  # Line width
-            )
-            pygame.draw.circle(
-                screen,
-                "purple",  # Orange color for the arm
-                cart_pos,
-                5  # Radius of the circle
-            )
-            # Add more custom drawing here if needed (e.g., second arm, ground)
-
-            pygame.display.flip()
-            clock.tick(fps)
+        # Visualization / recording (if an observer is attached)
+        if observer is not None and not observer.step(space, current_state, cart_force):
+            running = False
 
         # Check simulation end condition
         eT += dt
@@ -1,12 +1,262 @@
 # libraries
 from typing import List
-import pygame                   # Used for visualization and event handling
 import pymunk                   # Physics engine for simulating rigid body dynamics
-import pymunk.pygame_util       # Helper for drawing Pymunk objects using Pygame
 import pymunk.constraints       # Used for creating physical constraints
 from pymunk.vec2d import Vec2d  # Vector operations for 2D physics
 
-def odwroconeWahadloModelKx(net, isVis: bool):
+from settings import DEFAULT_CONFIG_PATH, read_section, get_float
+
+# Constants
+WIDTH, HEIGHT = 690, 600        # Dimensions of the simulation window (in pixels)
+FPS = 90                        # Frames per second for the simulation
+DT = 1.0 / FPS                  # Time step of the original loop (physics, control and rendering in lockstep), in seconds
+MAX_FORCE = 20000               # Maximum allowable force that can be applied to the cart (in arbitrary units)
+INIT_FORCE = 100                # Initial perturbation force applied to the cart at the start of the simulation (in arbitrary units)
+GRAVITY = 750.0                 # Gravitational force in arbitrary units
+L1 = 100                        # First arm length
+L2 = 75                         # Second arm length
+CART_MASS = 10                  # Mass of the cart
+ARM1_MASS = 1                   # Mass of the first arm
+ARM2_MASS = 1                   # Mass of the second arm
+SIM_TIME = 45                   # Duration of a single episode (in seconds)
+CART_START_X = 340              # Initial horizontal position of the cart
+TRACK_MIN_X, TRACK_MAX_X = 10, 670  # Ends of the groove the cart slides in
+# Target state
+DESIRED_STATES = [50, 0, 0, 0, 0, 0]
+"""
+DESIRED_STATES represents the ideal state of the system:
+    [ cart_x -- cart_vx -- arm1_angle -- arm1_angular_velocity -- arm2_angle -- arm2_angular_velocity ]
+cart_x                  --> Target horizontal position of the cart on the x-axis.
+cart_vx                 --> Target velocity of the cart along the x-axis (should ideally be 0).
+arm1_angle              --> Desired rotational angle of the first pendulum arm (upright position = 0).
+arm1_angular_velocity   --> Desired angular velocity of the first pendulum arm (should ideally be 0).
+arm2_angle              --> Desired rotational angle of the second pendulum arm (upright position = 0).
+arm2_angular_velocity   --> Desired angular velocity of the second pendulum arm (should ideally be 0).
+"""
+
+VELOCITY_SOURCES = ('difference', 'body')
+
+
+class SimulationTiming(object):
+    """
+    Physics step, control period and render rate of an episode.
+
+    The original loop runs physics, ``net.activate`` and rendering in lockstep at FPS and
+    differences the positions for the velocities. Here the physics can take several substeps per
+    control step and the velocities can be read from the pymunk bodies. The cumulative error is
+    weighted by ``control_dt / DT``, so fitness values stay on the scale of the original loop
+    whatever the control rate.
+    """
+
+    def __init__(self, physics_rate=FPS, control_rate=FPS, render_fps=FPS, velocities='difference'):
+        """
+        Args:
+            physics_rate: Physics steps per second.
+            control_rate: Network activations per second; must divide ``physics_rate``.
+            render_fps: Frame rate of the replay window (frames are skipped above the control rate).
+            velocities: 'difference' (finite differences of the positions between control steps)
+                        or 'body' (pymunk body velocities).
+        """
+        if velocities not in VELOCITY_SOURCES:
+            raise ValueError("Unknown velocity source {0!r}, expected one of {1}".format(
+                velocities, ', '.join(VELOCITY_SOURCES)))
+        substeps = int(round(physics_rate / control_rate))
+        if substeps < 1 or abs(substeps * control_rate - physics_rate) > 1e-9 * physics_rate:
+            raise ValueError("control_rate ({0:g}) must divide physics_rate ({1:g})".format(control_rate, physics_rate))
+        self.physics_rate = physics_rate
+        self.control_rate = control_rate
+        self.render_fps = render_fps
+        self.velocities = velocities
+        self.substeps = substeps
+        self.physics_dt = 1.0 / physics_rate
+        self.control_dt = 1.0 / control_rate
+
+    @classmethod
+    def from_config(cls, filename=DEFAULT_CONFIG_PATH):
+        """Timing from the [Simulation] section of a NEAT configuration file (the original loop by default)."""
+        params = read_section(filename, 'Simulation')
+        return cls(physics_rate=get_float(params, 'physics_rate', FPS),
+                   control_rate=get_float(params, 'control_rate', FPS),
+                   render_fps=get_float(params, 'render_fps', FPS),
+                   velocities=params.get('velocities', 'difference').strip().lower())
+
+    def __repr__(self):
+        return "SimulationTiming(physics_rate={0:g}, control_rate={1:g}, render_fps={2:g}, velocities={3!r})".format(
+            self.physics_rate, self.control_rate, self.render_fps, self.velocities)
+
+
+# Timing of the original lockstep loop, used when none is given explicitly
+LEGACY_TIMING = SimulationTiming()
+
+
+class SimulationContext(object):
+    """
+    Pymunk space of the cart + double pendulum, built once per process and reset between episodes.
+
+    ``reset`` restores the bodies to the initial state and replaces the three joints with fresh
+    ones, so an episode on a reused context is bit-for-bit identical to one on a freshly built
+    space (tests/test_simulation_context.py). The joints are rebuilt on purpose: pymunk cannot
+    clear the impulses a constraint accumulates for warm starting. Keeping them changed the weighted
+    cumulative error of all 140 (previous genome, genome) pairs measured from the checkpoints: by a
+    median of 3e-6 relative (the sixth significant digit), and by up to 57% where the pendulum's
+    motion diverges. Rebuilding costs about 0.1% of an episode.
+    """
+
+    def __init__(self):
+        # Physics Space setup
+        space = pymunk.Space()                  # Create a Pymunk physics space
+        space.gravity = Vec2d(0.0, GRAVITY)     # Set gravity to act downward
+
+        # Cart setup (platform on which the pendulum arms are mounted)
+        cart_body = pymunk.Body(CART_MASS, float("inf"))                            # Body with high mass (10 units) and infinite moment of inertia
+        cart_body.position = CART_START_X, 400                                      # Initial position of the cart
+        cart_shape = pymunk.Poly.create_box(cart_body, size=(50, 10), radius=1)     # Create a rectangular cart shape
+        cart_shape.filter = pymunk.ShapeFilter(group=1)                             # Assign a collision group to the cart
+
+        # First pendulum arm setup
+        arm1_body = pymunk.Body(ARM1_MASS, pymunk.moment_for_box(ARM1_MASS, (10, 100)))# Body with mass 1 unit and calculated moment of inertia
+        arm1_body.position = 340, 350                                               # Initial position of the first pendulum arm
+        arm1_shape = pymunk.Poly.create_box(arm1_body, size=(10, L1), radius=1)    # Create a rectangular shape for the arm
+        arm1_shape.filter = pymunk.ShapeFilter(group=1)                             # Assign a collision group to the arm
+
+        # Second pendulum arm setup
+        arm2_body = pymunk.Body(ARM2_MASS, pymunk.moment_for_box(ARM2_MASS, (10, 50)))# Body with mass 1 unit and calculated moment of inertia
+        arm2_body.position = 340, (400-L1) - L2/2                                              # Initial position of the second pendulum arm
+        arm2_shape = pymunk.Poly.create_box(arm2_body, size=(10, L2), radius=1)     # Create a rectangular shape for the arm
+        arm2_shape.filter = pymunk.ShapeFilter(group=1)                             # Assign a collision group to the arm
+
+        self.space = space
+        self.cart_body, self.arm1_body, self.arm2_body = cart_body, arm1_body, arm2_body
+        self.joints = self._create_joints()
+        # Initial (position, angle) of every body, restored by reset()
+        self.initial_state = [(body, body.position, body.angle) for body in (cart_body, arm1_body, arm2_body)]
+
+        # Add all physical elements to the simulation space
+        space.add(cart_body, cart_shape, self.joints[0], arm1_body, arm1_shape, self.joints[1],
+                  arm2_body, arm2_shape, self.joints[2])
+
+    def _create_joints(self):
+        move_joint = pymunk.GrooveJoint(
+            self.space.static_body, self.cart_body, (TRACK_MAX_X, 400), (TRACK_MIN_X, 400), (0, 0)
+        )  # Groove joint keeps the cart constrained to the horizontal axis
+        arm1_joint = pymunk.constraints.PivotJoint(self.cart_body, self.arm1_body, (340, 400))       # Pivot joint connects the arm to the cart
+        arm2_joint = pymunk.constraints.PivotJoint(self.arm1_body, self.arm2_body, (340, 400 - L1))  # Pivot joint connects the second arm to the first
+        return move_joint, arm1_joint, arm2_joint
+
+    def reset(self):
+        """Put the space back into the state of a freshly built one."""
+        for body, position, angle in self.initial_state:
+            body.angle = angle
+            body.position = position
+            body.velocity = (0, 0)
+            body.angular_velocity = 0
+            body.force = (0, 0)
+            body.torque = 0
+        self.space.remove(*self.joints)
+        self.joints = self._create_joints()
+        self.space.add(*self.joints)
+
+    def run(self, net, isVis: bool, termination=None, observer=None, duration=SIM_TIME, timing=None):
+        """Run one episode on this context, see odwroconeWahadloModelKx."""
+        self.reset()
+        space = self.space
+        cart_body, arm1_body, arm2_body = self.cart_body, self.arm1_body, self.arm2_body
+        timing = timing or LEGACY_TIMING
+        control_dt, physics_dt, substeps = timing.control_dt, timing.physics_dt, timing.substeps
+        body_velocities = timing.velocities == 'body'
+        weight = control_dt / DT        # Steps of the original loop covered by one control step
+
+        # Rendering is an optional observer, pygame is loaded only for visualization
+        if isVis and observer is None:
+            import render
+            observer = render.PymunkDebugRenderer(WIDTH, HEIGHT, timing.render_fps, frame_time=control_dt)
+
+        # Simulation variables
+        running = True                  # Control flag for the simulation loop
+        elapsed_time = 0                # Tracks the total simulation time
+        previous_state = {              # Stores the state of the system in the previous frame
+            "cart_x": CART_START_X,
+            "arm1_angle": 0,
+            "arm2_angle": 0
+        }
+        cumulative_error = [0, 0, 0, 0, 0, 0]  # Tracks cumulative errors for each state variable
+
+        # Main simulation loop
+        while running:
+            # Extract current state of the system
+            cart_x = cart_body.position[0]                                              # Horizontal position of the cart
+            arm1_angle = arm1_body.angle                                                # Angle of the first pendulum arm
+            arm2_angle = arm2_body.angle                                                # Angle of the second pendulum arm
+            if body_velocities:
+                cart_vx = cart_body.velocity[0]                                         # Velocity of the cart
+                arm1_angular_velocity = arm1_body.angular_velocity                      # Angular velocity of the first arm
+                arm2_angular_velocity = arm2_body.angular_velocity                      # Angular velocity of the second arm
+            else:
+                cart_vx = (cart_x - previous_state["cart_x"]) / control_dt
+                arm1_angular_velocity = (arm1_angle - previous_state["arm1_angle"]) / control_dt
+                arm2_angular_velocity = (arm2_angle - previous_state["arm2_angle"]) / control_dt
+
+            # Update previous state
+            previous_state.update({
+                "cart_x": cart_x,
+                "arm1_angle": arm1_angle,
+                "arm2_angle": arm2_angle
+            })
+
+            # Construct the state vector
+            state = (cart_x, cart_vx, arm1_angle, arm1_angular_velocity, arm2_angle, arm2_angular_velocity)
+
+            # Compute error between the current and desired states
+            error = [(state[i] - DESIRED_STATES[i]) / (100 if i < 2 else 1) for i in range(6)]
+            cumulative_error = [cumulative_error[i] + abs(error[i]) * weight for i in range(6)]
+
+            # Early termination: the episode cannot recover or cannot beat the best genome anymore
+            if termination is not None and termination.should_stop(cart_x, (arm1_angle, arm2_angle), cumulative_error):
+                remaining = termination.remaining_steps(elapsed_time, duration, control_dt)
+                return termination.charge_remaining(cumulative_error, error, remaining * weight)
+
+            # Neural network control: Calculate control signal based on error
+            control_signal = net.activate(error)
+            force = 2000 * control_signal[0]                # Scale the control signal to produce a force
+            force = max(min(force, MAX_FORCE), -MAX_FORCE)  # Limit the force within the allowable range
+
+            # Apply an initial perturbation force at the start of the simulation
+            if elapsed_time < 0.03:
+                force = INIT_FORCE
+
+            # Apply the computed force to the cart and update the physics simulation (pymunk
+            # clears the force after every step, so it is applied again before each substep)
+            for _ in range(substeps):
+                cart_body.apply_force_at_world_point((force, 0), cart_body.position)
+                space.step(physics_dt)
+
+            # Visualization / recording (if an observer is attached); False means the window was closed
+            if observer is not None and not observer.step(space, state, force):
+                running = False
+
+            # Increment elapsed simulation time
+            elapsed_time += control_dt
+
+            # Stop the simulation after duration (SIM_TIME by default) seconds
+            if elapsed_time > duration:
+                running = False
+
+        return cumulative_error
+
+
+# Simulation context of this process (each pool worker gets its own)
+_context = None
+
+
+def get_context():
+    """Return the simulation context of this process, building it on first use."""
+    global _context
+    if _context is None:
+        _context = SimulationContext()
+    return _context
+
+
+def odwroconeWahadloModelKx(net, isVis: bool, termination=None, observer=None, duration=SIM_TIME, timing=None):
     """
     Simulates an inverted pendulum system controlled by a neural network.
 
@@ -14,140 +264,17 @@ def odwroconeWahadloModelKx(net, isVis: bool):
         net: The neural network used to control the system. It takes the error vector as input
              and outputs the control signal to stabilize the pendulum.
         isVis (bool): Whether to visualize the simulation (True = visualization enabled).
+        termination: Optional termination.TerminationPolicy; when it fires the episode ends early
+                     and the skipped steps are charged as a penalty.
+        observer: Optional observer called after every control step (see render.py). With
+                  isVis=True and no observer, a pygame renderer is created (pygame is only
+                  imported in that case).
+        duration (float): Length of the episode in seconds, SIM_TIME by default.
+        timing: Optional SimulationTiming, LEGACY_TIMING by default; runs pass the timing of their
+                configuration file (``SimulationTiming.from_config``).
 
     Returns:
         List[float]: The cumulative error metrics of the system, where each value corresponds
                      to the sum of absolute errors for different state variables.
     """
-
-    # Constants
-    WIDTH, HEIGHT = 690, 600        # Dimensions of the simulation window (in pixels)
-    FPS = 90                        # Frames per second for the simulation
-    DT = 1.0 / FPS                  # Time step for the physics engine (in seconds)
-    MAX_FORCE = 20000               # Maximum allowable force that can be applied to the cart (in arbitrary units)
-    INIT_FORCE = 100                # Initial perturbation force applied to the cart at the start of the simulation (in arbitrary units)
-    GRAVITY = 750.0                 # Gravitational force in arbitrary units
-    L1 = 100                        # First arm length
-    L2 = 75                         # Second arm length
-    # Target state
-    DESIRED_STATES = [50, 0, 0, 0, 0, 0]
-    """
-    DESIRED_STATES represents the ideal state of the system:
-        [ cart_x -- cart_vx -- arm1_angle -- arm1_angular_velocity -- arm2_angle -- arm2_angular_velocity ]
-    cart_x                  --> Target horizontal position of the cart on the x-axis.
-    cart_vx                 --> Target velocity of the cart along the x-axis (should ideally be 0).
-    arm1_angle              --> Desired rotational angle of the first pendulum arm (upright position = 0).
-    arm1_angular_velocity   --> Desired angular velocity of the first pendulum arm (should ideally be 0).
-    arm2_angle              --> Desired rotational angle of the second pendulum arm (upright position = 0).
-    arm2_angular_velocity   --> Desired angular velocity of the second pendulum arm (should ideally be 0).
-    """
-
-    # Pygame and Pymunk initialization
-    if isVis:
-        pygame.init()
-        screen = pygame.display.set_mode((WIDTH, HEIGHT))       # Set up the simulation window
-        draw_options = pymunk.pygame_util.DrawOptions(screen)   # Helper for drawing Pymunk objects
-        font = pygame.font.SysFont("Arial", 16)                 # Font for optional on-screen text
-
-    # Physics Space setup
-    space = pymunk.Space()                  # Create a Pymunk physics space
-    space.gravity = Vec2d(0.0, GRAVITY)     # Set gravity to act downward
-
-    # Cart setup (platform on which the pendulum arms are mounted)
-    cart_body = pymunk.Body(10, float("inf"))                                   # Body with high mass (10 units) and infinite moment of inertia
-    cart_body.position = 340, 400                                               # Initial position of the cart
-    cart_shape = pymunk.Poly.create_box(cart_body, size=(50, 10), radius=1)     # Create a rectangular cart shape
-    cart_shape.filter = pymunk.ShapeFilter(group=1)                             # Assign a collision group to the cart
-
-    move_joint = pymunk.GrooveJoint(
-        space.static_body, cart_body, (670, 400), (10, 400), (0, 0)
-    )  # Groove joint keeps the cart constrained to the horizontal axis
-
-    # First pendulum arm setup
-    arm1_body = pymunk.Body(1, pymunk.moment_for_box(1, (10, 100)))             # Body with mass 1 unit and calculated moment of inertia
-    arm1_body.position = 340, 350                                               # Initial position of the first pendulum arm
-    arm1_shape = pymunk.Poly.create_box(arm1_body, size=(10, L1), radius=1)    # Create a rectangular shape for the arm
-    arm1_shape.filter = pymunk.ShapeFilter(group=1)                             # Assign a collision group to the arm
-    arm1_joint = pymunk.constraints.PivotJoint(cart_body, arm1_body, (340, 400))# Pivot joint connects the arm to the cart
-
-    # Second pendulum arm setup
-    arm2_body = pymunk.Body(1, pymunk.moment_for_box(1, (10, 50)))              # Body with mass 1 unit and calculated moment of inertia
-    arm2_body.position = 340, (400-L1) - L2/2                                              # Initial position of the second pendulum arm
-    arm2_shape = pymunk.Poly.create_box(arm2_body, size=(10, L2), radius=1)     # Create a rectangular shape for the arm
-    arm2_shape.filter = pymunk.ShapeFilter(group=1)                             # Assign a collision group to the arm
-    arm2_joint = pymunk.constraints.PivotJoint(arm1_body, arm2_body, (340, 400 - L1))# Pivot joint connects the second arm to the first
-
-    # Add all physical elements to the simulation space
-    space.add(cart_body, cart_shape, move_joint, arm1_body, arm1_shape, arm1_joint, arm2_body, arm2_shape, arm2_joint)
-
-    # Simulation variables
-    running = True                  # Control flag for the simulation loop
-    clock = pygame.time.Clock()     # Clock to control simulation speed
-    elapsed_time = 0                # Tracks the total simulation time
-    previous_state = {              # Stores the state of the system in the previous frame
-        "cart_x": 340,
-        "arm1_angle": 0,
-        "arm2_angle": 0
-    }
-    cumulative_error = [0, 0, 0, 0, 0, 0]  # Tracks cumulative errors for each state variable
-
-    # Main simulation loop
-    while running:
-        # Handle events (e.g., closing the window)
-        if isVis:
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    running = False
-
-        # Extract current state of the system
-        cart_x = cart_shape.body.position[0]                                        # Horizontal position of the cart
-        cart_vx = (cart_x - previous_state["cart_x"]) / DT                          # Velocity of the cart
-        arm1_angle = arm1_shape.body.angle                                          # Angle of the first pendulum arm
-        arm2_angle = arm2_shape.body.angle                                          # Angle of the second pendulum arm
-        arm1_angular_velocity = (arm1_angle - previous_state["arm1_angle"]) / DT    # Angular velocity of the first arm
-        arm2_angular_velocity = (arm2_angle - previous_state["arm2_angle"]) / DT    # Angular velocity of the second arm
-
-        # Update previous state
-        previous_state.update({
-            "cart_x": cart_x,
-            "arm1_angle": arm1_angle,
-            "arm2_angle": arm2_angle
-        })
-
-        # Construct the state vector
-        state = (cart_x, cart_vx, arm1_angle, arm1_angular_velocity, arm2_angle, arm2_angular_velocity)
-
-        # Compute error between the current and desired states
-        error = [(state[i] - DESIRED_STATES[i]) / (100 if i < 2 else 1) for i in range(6)]
-        cumulative_error = [cumulative_error[i] + abs(error[i]) for i in range(6)]
-
-        # Neural network control: Calculate control signal based on error
-        control_signal = net.activate(error)
-        force = 2000 * control_signal[0]                # Scale the control signal to produce a force
-        force = max(min(force, MAX_FORCE), -MAX_FORCE)  # Limit the force within the allowable range
-
-        # Apply an initial perturbation force at the start of the simulation
-        if elapsed_time < 0.03:
-            force = INIT_FORCE
-
-        # Apply the computed force to the cart
-        cart_body.apply_force_at_world_point((force, 0), cart_body.position)
-
-        # Update the physics simulation
-        space.step(DT)
-
-        # Visualization (if enabled)
-        if isVis:
-            screen.fill(pygame.Color("white"))  # Clear the screen
-            space.debug_draw(draw_options)      # Draw all elements in the space
-            pygame.display.flip()               # Update the display
-            clock.tick(FPS)                     # Maintain the desired FPS
-
-        # Increment elapsed simulation time
-        elapsed_time += DT
-
-        # Stop the simulation after 15 seconds
-        if elapsed_time > 45:
-            running = False
-
-    return cumulative_error
+    return get_context().run(net, isVis, termination, observer, duration, timing)
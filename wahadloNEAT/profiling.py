@@ -0,0 +1,245 @@
+"""
+Opt-in per-generation profiling of the evolution loop.
+
+``ProfilingReporter`` wraps the population's reproduction and speciation, collects the timings
+the EvaluationExecutor sends back from its workers (network creation, ``net.activate`` and
+``space.step`` totals, steps per episode) and writes one JSON line per generation:
+
+    generation, generation_seconds, evaluation_seconds, pickling_seconds, payload_bytes,
+    dispatch_seconds, create_net_seconds, activate_seconds, physics_seconds, episode_seconds,
+    reproduction_seconds, speciation_seconds, genomes, steps, steps_per_second (mean/min/max per
+    genome), worker_utilization, network_hit_rate (share of networks taken from the workers'
+    network_cache instead of being compiled)
+
+``dispatch_seconds`` is the evaluation wall time not covered by worker computation (pool
+scheduling, pickling, result transfer, idle workers at the end of the generation). Enabled with
+the [Profiling] section of neat-config.txt.
+"""
+import json
+import pickle
+import time
+
+import numpy as np
+from neat.reporting import BaseReporter
+
+from settings import DEFAULT_CONFIG_PATH, read_section, get_bool
+
+PHASES = ('evaluation', 'pickling', 'dispatch', 'create_net', 'activate', 'physics', 'reproduction', 'speciation')
+
+
+class CallTimer(object):
+    """Callable wrapper accumulating the time spent in the wrapped function."""
+
+    def __init__(self, function):
+        self.function = function
+        self.total = 0.0
+        self.calls = 0
+
+    def __call__(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self.function(*args, **kwargs)
+        finally:
+            self.total += time.perf_counter() - start
+            self.calls += 1
+
+
+class TimedNetwork(object):
+    """Network proxy timing ``activate``; one call per control step, so ``timer.calls`` counts the steps."""
+
+    def __init__(self, net):
+        self.net = net
+        self.timer = CallTimer(net.activate)
+
+    def activate(self, inputs):
+        return self.timer(inputs)
+
+
+def step_timer(simulator):
+    """
+    Time ``space.step`` of a simulator that keeps a per-process pymunk context.
+
+    The timer replaces the bound method on the space instance, the simulation loop is unchanged.
+
+    Returns:
+        CallTimer, or None if the simulator has no pymunk context.
+    """
+    if not hasattr(simulator, 'get_context'):
+        return None
+    space = simulator.get_context().space
+    if not isinstance(space.step, CallTimer):
+        space.step = CallTimer(space.step)
+    return space.step
+
+
+def payload_cost(genomes):
+    """Time and size of pickling the evaluation payloads (what the pool sends to the workers)."""
+    start = time.perf_counter()
+    size = len(pickle.dumps(genomes, protocol=pickle.HIGHEST_PROTOCOL))
+    return time.perf_counter() - start, size
+
+
+class ProfilingReporter(BaseReporter):
+    """
+    NEAT reporter producing the per-generation trace and a summary.
+
+        profiler = ProfilingReporter('profile-trace.jsonl')
+        profiler.attach(p)
+        with EvaluationExecutor(config, profiler=profiler) as executor:
+            p.run(executor.eval_genomes, generations)
+        profiler.close()
+    """
+
+    def __init__(self, trace_file=None, summary_file=None):
+        """
+        Args:
+            trace_file: JSONL file receiving one record per generation, None keeps them in memory only.
+            summary_file: JSON file for the summary written by ``close``.
+        """
+        self.trace_file = trace_file
+        self.summary_file = summary_file
+        self.trace = []
+        self.current = None
+        self.generation_start = None
+        self._file = open(trace_file, 'a') if trace_file else None
+
+    def __getstate__(self):
+        # The species set keeps a reference to all reporters, do not pickle the open trace
+        state = dict(self.__dict__)
+        state['_file'] = None
+        return state
+
+    @classmethod
+    def from_config(cls, filename=DEFAULT_CONFIG_PATH):
+        """
+        Build the reporter from the [Profiling] section of a NEAT configuration file.
+
+        Returns:
+            ProfilingReporter, or None if the section is missing or disabled.
+        """
+        params = read_section(filename, 'Profiling')
+        if not get_bool(params, 'enabled', False):
+            return None
+        return cls(trace_file=params.get('trace_file', 'profile-trace.jsonl').strip(),
+                   summary_file=params.get('summary_file', 'profile-summary.json').strip())
+
+    def attach(self, population):
+        """Add the reporter to a population and time its reproduction and speciation."""
+        population.add_reporter(self)
+        population.reproduction.reproduce = self._timed(population.reproduction.reproduce, 'reproduction')
+        population.species.speciate = self._timed(population.species.speciate, 'speciation')
+
+    def _timed(self, function, phase):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                if self.current is not None:
+                    self.current[phase + '_seconds'] += time.perf_counter() - start
+        return timed
+
+    def start_generation(self, generation):
+        self.current = {'generation': generation}
+        self.current.update((phase + '_seconds', 0.0) for phase in PHASES)
+        self.current.update(episode_seconds=0.0, payload_bytes=0, genomes=0, steps=0, busy_seconds=0.0,
+                            worker_seconds=0.0, network_hits=0.0)
+        self._steps_per_second = []
+        self.generation_start = time.perf_counter()
+
+    def record_evaluation(self, timings, wall_seconds, processes, pickling_seconds=0.0, payload_bytes=0):
+        """
+        Add one batch of worker results (called by EvaluationExecutor).
+
+        Args:
+            timings: Per-genome dicts with create_net, activate, physics, episode, steps and network_hits.
+            wall_seconds: Wall time of the batch in the main process.
+            processes: Number of pool workers.
+            pickling_seconds: Time to pickle the payloads.
+            payload_bytes: Size of the pickled payloads.
+        """
+        if self.current is None:
+            return
+        current = self.current
+        busy = 0.0
+        for t in timings:
+            current['create_net_seconds'] += t['create_net']
+            current['activate_seconds'] += t['activate']
+            current['physics_seconds'] += t['physics'] or 0.0
+            current['steps'] += t['steps']
+            current['episode_seconds'] += t['episode']
+            current['network_hits'] += t.get('network_hits', 0)
+            busy += t['create_net'] + t['episode']
+            if t['episode'] > 0:
+                self._steps_per_second.append(t['steps'] / t['episode'])
+        current['genomes'] += len(timings)
+        current['evaluation_seconds'] += wall_seconds
+        current['pickling_seconds'] += pickling_seconds
+        current['payload_bytes'] += payload_bytes
+        current['dispatch_seconds'] += max(0.0, wall_seconds - busy / processes)
+        current['busy_seconds'] += busy
+        current['worker_seconds'] += wall_seconds * processes
+
+    def end_generation(self, config, population, species_set):
+        self._finish_generation()
+
+    def found_solution(self, config, generation, best):
+        # Population.run stops before reproduction when the threshold is reached
+        if self.current is not None:
+            self._finish_generation()
+
+    def _finish_generation(self):
+        record = self.current
+        self.current = None
+        record['generation_seconds'] = time.perf_counter() - self.generation_start
+        worker_seconds = record.pop('worker_seconds')
+        record['worker_utilization'] = record.pop('busy_seconds') / worker_seconds if worker_seconds else None
+        network_hits = record.pop('network_hits')
+        record['network_hit_rate'] = network_hits / record['genomes'] if record['genomes'] else None
+        if self._steps_per_second:
+            rates = np.array(self._steps_per_second)
+            record['steps_per_second'] = {'mean': float(rates.mean()), 'min': float(rates.min()),
+                                          'max': float(rates.max())}
+        else:
+            record['steps_per_second'] = None
+        self.trace.append(record)
+        if self._file is not None:
+            self._file.write(json.dumps(record) + '\n')
+            self._file.flush()
+
+    def summary(self):
+        """
+        Aggregate the trace.
+
+        Returns:
+            dict: Generations, mean seconds per phase and generation, share of the generation time
+                  per phase, overall steps/s, mean worker utilization and network cache hit rate.
+        """
+        if not self.trace:
+            return {'generations': 0}
+        total = sum(r['generation_seconds'] for r in self.trace)
+        summary = {'generations': len(self.trace), 'mean_generation_seconds': total / len(self.trace)}
+        for phase in PHASES:
+            seconds = sum(r[phase + '_seconds'] for r in self.trace)
+            summary[phase] = {'mean_seconds': seconds / len(self.trace), 'share': seconds / total if total else 0.0}
+        steps = sum(r['steps'] for r in self.trace)
+        episode_seconds = sum(r['episode_seconds'] for r in self.trace)
+        summary['steps'] = steps
+        summary['steps_per_worker_second'] = steps / episode_seconds if episode_seconds else None
+        utilization = [r['worker_utilization'] for r in self.trace if r['worker_utilization'] is not None]
+        summary['mean_worker_utilization'] = float(np.mean(utilization)) if utilization else None
+        hit_rates = [r['network_hit_rate'] for r in self.trace if r.get('network_hit_rate') is not None]
+        summary['mean_network_hit_rate'] = float(np.mean(hit_rates)) if hit_rates else None
+        return summary
+
+    def close(self):
+        """Print the summary, write it to ``summary_file`` and close the trace."""
+        summary = self.summary()
+        print("Profiling summary:\n{0}".format(json.dumps(summary, indent=2)))
+        if self.summary_file:
+            with open(self.summary_file, 'w') as f:
+                json.dump(summary, f, indent=2)
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        return summary
@@ -0,0 +1,232 @@
+"""
+Structural pruning of compiled networks.
+
+neat's feed_forward_layers already leaves out nodes that never reach an output, but everything
+else a genome expresses is evaluated on every control step. ``prune_plan`` rewrites a
+compiled_net.NetworkPlan into a smaller equivalent one:
+
+    * links with a weight of (at most ``tolerance`` in magnitude) zero are dropped, a node with a
+      response of zero keeps no links (its value is the constant ``activation(bias)``);
+    * with ``fold_identity``, hidden nodes with the identity activation are substituted into
+      their consumers (weights multiplied through, the bias moved into the consumer's bias) and
+      constant hidden nodes are folded into their consumers' biases; links from the same source
+      are merged, so paths whose weights cancel disappear;
+    * nodes no output depends on any more are removed and the rest is laid out again in as few
+      layers as the longest path needs.
+
+Dropping zero links and dead nodes leaves every remaining sum unchanged; folding reorders
+floating point operations, so outputs may differ from the unpruned network at rounding level.
+
+``Pruner`` applies the [Pruning] section of neat-config.txt and counts the operations (one
+multiply-add per link, one activation per node) saved per genome; network_cache.NetworkFactory
+prunes every plan it compiles, ``pruned_genome`` gives visualize.draw_net the pruned structure.
+
+    python pruning.py best_genome.genome
+    python pruning.py --checkpoint neat-checkpoint-1799
+"""
+import argparse
+from collections import namedtuple, OrderedDict
+
+import neat
+
+from compiled_net import NetworkPlan, compile_plan
+from genome_codec import GenomeView, NodeView, ConnectionView, load_genome
+from settings import DEFAULT_CONFIG_PATH, read_section, get_bool, get_float
+
+
+class PruneReport(namedtuple('PruneReport', 'nodes_before nodes_after links_before links_after '
+                                            'layers_before layers_after')):
+    """Size of a network before and after pruning."""
+
+    __slots__ = ()
+
+    @property
+    def operations_before(self):
+        return self.nodes_before + self.links_before
+
+    @property
+    def operations_after(self):
+        return self.nodes_after + self.links_after
+
+    @property
+    def operations_saved(self):
+        """Multiply-adds and activations saved per ``activate`` call."""
+        return self.operations_before - self.operations_after
+
+
+def _size(plan):
+    nodes = [node for layer in plan.layers for node in layer]
+    return len(nodes), sum(len(links) for _, links, _, _, _ in nodes), len(plan.layers)
+
+
+def _merge(links, tolerance):
+    """Sum the weights of links from the same source (first position kept), drop the (near) zero ones."""
+    merged = OrderedDict()
+    for source, weight in links:
+        merged[source] = merged.get(source, 0.0) + weight
+    return [(source, weight) for source, weight in merged.items() if abs(weight) > tolerance]
+
+
+def prune_plan(plan, config, fold_identity=True, tolerance=0.0):
+    """
+    Minimal equivalent of a network plan (see the module docstring).
+
+    Args:
+        plan: NetworkPlan from compiled_net.compile_plan.
+        config: NEAT configuration object.
+        fold_identity: Substitute identity and constant hidden nodes into their consumers.
+        tolerance: Links whose weight magnitude does not exceed it count as zero.
+
+    Returns:
+        Tuple (pruned NetworkPlan, PruneReport).
+    """
+    genome_config = config.genome_config
+    input_keys, output_keys = genome_config.input_keys, genome_config.output_keys
+    outputs = set(output_keys)
+
+    # node -> [links, bias, response, activation] in evaluation order
+    nodes = OrderedDict()
+    for layer in plan.layers:
+        for node, links, bias, response, activation in layer:
+            links = [] if response == 0.0 else [(i, w) for i, w in links if abs(w) > tolerance]
+            nodes[node] = [links, bias, response, activation]
+
+    if fold_identity:
+        for node, (links, bias, response, activation) in list(nodes.items()):
+            if node in outputs:
+                continue
+            if activation == 'identity':
+                # consumer += w * (bias + response * sum(links))
+                replacement = [(i, response * w) for i, w in links]
+                constant = bias
+            elif not links:
+                replacement = []
+                constant = genome_config.activation_defs.get(activation)(bias + response * 0.0)
+            else:
+                continue
+            for consumer in nodes.values():
+                weight = dict(consumer[0]).get(node)
+                if weight is None:
+                    continue
+                folded = []
+                for i, w in consumer[0]:
+                    folded.extend([(j, weight * v) for j, v in replacement] if i == node else [(i, w)])
+                consumer[0] = _merge(folded, tolerance)
+                consumer[1] += consumer[2] * weight * constant
+
+    # Keep only what an output depends on
+    needed = set(outputs)
+    for node in reversed(nodes):
+        if node in needed:
+            needed.update(i for i, _ in nodes[node][0])
+    nodes = OrderedDict((node, gene) for node, gene in nodes.items() if node in needed)
+
+    # Lay the nodes out again by longest path from the inputs
+    depth = {key: 0 for key in input_keys}
+    layers = []
+    for node, (links, bias, response, activation) in nodes.items():
+        depth[node] = 1 + max([depth[i] for i, _ in links] + [0])
+        while len(layers) < depth[node]:
+            layers.append([])
+        layers[depth[node] - 1].append((node, links, bias, response, activation))
+
+    slots = {key: i for i, key in enumerate(input_keys + output_keys)}
+    for layer in layers:
+        for node, _, _, _, _ in layer:
+            slots.setdefault(node, len(slots))
+    pruned = NetworkPlan(slots, layers)
+    return pruned, PruneReport(*[v for pair in zip(_size(plan), _size(pruned)) for v in pair])
+
+
+def pruned_genome(genome, config, fold_identity=True, tolerance=0.0):
+    """
+    Genome with only the nodes and links of the pruned network (for drawing; folded links get
+    the combined weight).
+
+    Returns:
+        genome_codec.GenomeView.
+    """
+    plan, _ = prune_plan(compile_plan(genome, config), config, fold_identity, tolerance)
+    nodes = {key: genome.nodes[key] for key in config.genome_config.output_keys}
+    connections = {}
+    for layer in plan.layers:
+        for node, links, bias, response, activation in layer:
+            nodes[node] = NodeView(node, bias, response, activation, genome.nodes[node].aggregation)
+            for i, w in links:
+                connections[(i, node)] = ConnectionView((i, node), w, True)
+    return GenomeView(genome.key, genome.fitness, nodes, connections)
+
+
+class Pruner(object):
+    """Pruning settings and the operation counts of every plan pruned with them."""
+
+    def __init__(self, fold_identity=True, tolerance=0.0):
+        self.fold_identity = fold_identity
+        self.tolerance = tolerance
+        self.genomes = 0
+        self.operations_before = 0
+        self.operations_after = 0
+
+    @property
+    def settings(self):
+        """The options the pruned plans depend on, (fold_identity, tolerance)."""
+        return self.fold_identity, self.tolerance
+
+    @classmethod
+    def from_config(cls, filename=DEFAULT_CONFIG_PATH):
+        """
+        Build the pruner from the [Pruning] section of a NEAT configuration file.
+
+        Returns:
+            Pruner, or None if pruning is disabled.
+        """
+        params = read_section(filename, 'Pruning')
+        if not get_bool(params, 'enabled', True):
+            return None
+        return cls(fold_identity=get_bool(params, 'fold_identity', True),
+                   tolerance=get_float(params, 'tolerance', 0.0))
+
+    def prune(self, plan, config):
+        """Returns the pruned plan and its PruneReport."""
+        pruned, report = prune_plan(plan, config, self.fold_identity, self.tolerance)
+        self.genomes += 1
+        self.operations_before += report.operations_before
+        self.operations_after += report.operations_after
+        return pruned, report
+
+    def stats(self):
+        """Return a dict with the number of pruned genomes and the mean operations saved per genome."""
+        saved = self.operations_before - self.operations_after
+        return {'genomes': self.genomes,
+                'operations_saved_per_genome': saved / self.genomes if self.genomes else 0.0,
+                'operations_saved_share': saved / self.operations_before if self.operations_before else 0.0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report what pruning removes from genomes.")
+    parser.add_argument('genome', nargs='?', help="Saved genome (.genome or .pkl).")
+    parser.add_argument('--checkpoint', help="neat-checkpoint-* file, reports every genome of its population.")
+    parser.add_argument('--config', default=DEFAULT_CONFIG_PATH, help="NEAT configuration file.")
+    args = parser.parse_args()
+    if (args.genome is None) == (args.checkpoint is None):
+        parser.error("give either a genome file or --checkpoint")
+
+    config = neat.Config(neat.DefaultGenome, neat.DefaultReproduction,
+                         neat.DefaultSpeciesSet, neat.DefaultStagnation, args.config)
+    if args.checkpoint:
+        genomes = list(neat.Checkpointer.restore_checkpoint(args.checkpoint).population.values())
+    else:
+        genomes = [load_genome(args.genome, config)]
+
+    pruner = Pruner.from_config(args.config) or Pruner()
+    print("{0:>8} {1:>13} {2:>13} {3:>9} {4:>11}".format('genome', 'nodes', 'links', 'layers', 'ops saved'))
+    for genome in genomes:
+        _, r = pruner.prune(compile_plan(genome, config), config)
+        print("{0:>8} {1:>6} -> {2:<4} {3:>6} -> {4:<4} {5:>2} -> {6:<3} {7:>5}/{8:<5}".format(
+            genome.key, r.nodes_before, r.nodes_after, r.links_before, r.links_after, r.layers_before,
+            r.layers_after, r.operations_saved, r.operations_before))
+    print(pruner.stats())
+
+
+if __name__ == '__main__':
+    main()
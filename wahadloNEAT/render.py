@@ -0,0 +1,87 @@
+"""
+Pygame rendering for the pendulum simulators.
+
+Renderers are observers attached to a simulation for replays only; the simulator modules import
+this module lazily, so evaluation never loads pygame/SDL.
+
+Observer protocol: ``step(space, state, force)`` is called after every control step with the
+pymunk space, the observed state vector and the force applied to the cart. Returning False ends
+the episode (e.g. the window was closed).
+"""
+import pygame
+import pymunk.pygame_util
+
+
+class PymunkDebugRenderer(object):
+    """Draws every shape of the space with pymunk's debug drawing (double pendulum model)."""
+
+    def __init__(self, width, height, fps, frame_time=None):
+        """
+        Args:
+            width, height: Window size in pixels.
+            fps: Frame rate of the window; steps in between are not drawn.
+            frame_time: Simulated seconds between two calls of ``step`` (default ``1 / fps``).
+        """
+        pygame.init()
+        self.screen = pygame.display.set_mode((width, height))              # Set up the simulation window
+        self.draw_options = pymunk.pygame_util.DrawOptions(self.screen)     # Helper for drawing Pymunk objects
+        self.clock = pygame.time.Clock()                                    # Clock to control simulation speed
+        self.fps = fps
+        self.frame_time = frame_time or 1.0 / fps
+        self.pending = 0.0                                                  # Simulated seconds since the last frame
+
+    def step(self, space, state, force):
+        running = True
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+
+        self.pending += self.frame_time
+        if self.pending < 1.0 / self.fps - 1e-9:
+            return running
+        self.screen.fill(pygame.Color("white"))     # Clear the screen
+        space.debug_draw(self.draw_options)         # Draw all elements in the space
+        pygame.display.flip()                       # Update the display
+        self.clock.tick(1.0 / self.pending)         # Play in real time
+        self.pending = 0.0
+        return running
+
+
+class PendulumRenderer(object):
+    """Draws the cart and the single arm of odwroconeWahadloModelNN_modul as simple shapes."""
+
+    def __init__(self, width, height, fps, cart, arm1):
+        pygame.init()
+        self.screen = pygame.display.set_mode((width, height))
+        self.clock = pygame.time.Clock()
+        self.fps = fps
+        self.cart = cart
+        self.arm1 = arm1
+
+    def step(self, space, state, force):
+        running = True
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+
+        self.screen.fill(pygame.Color("grey"))  # Set the background color
+
+        # Draw the cart
+        cart_pos = (int(self.cart.position.x), int(self.cart.position.y))
+        pygame.draw.rect(
+            self.screen,
+            (255, 165, 0),  # Orange color for the cart
+            pygame.Rect(cart_pos[0] - 25, cart_pos[1] - 5, 50, 10)  # Rectangle dimensions
+        )
+
+        # Draw the first arm (as an orange circle)
+        arm1_pos = (int(self.arm1.position.x), int(self.arm1.position.y))
+        pygame.draw.circle(self.screen, (255, 165, 0), arm1_pos, 10)
+
+        # Draw a line connecting the cart to the first arm
+        pygame.draw.line(self.screen, "white", cart_pos, arm1_pos, 5)
+        pygame.draw.circle(self.screen, "purple", cart_pos, 5)
+
+        pygame.display.flip()
+        self.clock.tick(self.fps)
+        return running
@@ -0,0 +1,142 @@
+"""
+Robustness evaluation of a genome over a set of scenarios.
+
+The default fitness comes from a single episode (upright start, INIT_FORCE kick, target
+DESIRED_STATES), which the winners overfit to. A ``ScenarioSet`` describes several episodes
+(start angles of the arms, kick force, target cart position). Every worker runs its whole chunk of
+genomes over all scenarios as one lockstep batch of the analytic model (batch_sim with a
+BatchNetwork), so the per-step overhead is shared by G x S episodes and S scenarios cost far less
+than S separate episodes per genome.
+
+The per-scenario error vectors are reduced to one vector ([Scenarios] section of neat-config.txt):
+
+    mean    average over the scenarios
+    worst   the scenario with the largest weighted error
+    cvar    average of the worst ``cvar_alpha`` fraction of the scenarios (conditional value at risk)
+"""
+import itertools
+import math
+
+import numpy as np
+
+import batch_sim
+from fitness import weighted_error
+from odwroconeWahadloModelNN_modul_old import INIT_FORCE, DESIRED_STATES, SIM_TIME
+from settings import DEFAULT_CONFIG_PATH, read_section, get_bool, get_float
+
+REDUCTIONS = ('mean', 'worst', 'cvar')
+
+
+def _floats(params, name, default):
+    value = params.get(name)
+    if value is None:
+        return list(default)
+    return [float(v) for v in value.replace(',', ' ').split()]
+
+
+class ScenarioSet(object):
+    """Initial conditions and targets of the scenarios plus the reduction of their errors."""
+
+    def __init__(self, arm1_angles=(0.0,), arm2_angles=(0.0,), kicks=(INIT_FORCE,), targets=(DESIRED_STATES[0],),
+                 reduction='mean', cvar_alpha=0.25, integrator=None):
+        """
+        The scenarios are all combinations of the given values.
+
+        Args:
+            arm1_angles: Start angles of the first arm (radians, 0 = upright).
+            arm2_angles: Start angles of the second arm.
+            kicks: Initial perturbation forces.
+            targets: Target cart positions (first component of DESIRED_STATES).
+            reduction: 'mean', 'worst' or 'cvar'.
+            cvar_alpha: Fraction of the worst scenarios averaged by 'cvar'.
+            integrator: Integrator of the analytic model, default batch_sim.DEFAULT_INTEGRATOR.
+        """
+        if reduction not in REDUCTIONS:
+            raise ValueError("Unknown scenario reduction {0!r}, expected one of {1}".format(
+                reduction, ', '.join(REDUCTIONS)))
+        if not 0.0 < cvar_alpha <= 1.0:
+            raise ValueError("cvar_alpha must be in (0, 1], got {0}".format(cvar_alpha))
+        self.scenarios = list(itertools.product(arm1_angles, arm2_angles, kicks, targets))
+        self.reduction = reduction
+        self.cvar_alpha = cvar_alpha
+        self.integrator = integrator
+
+        columns = np.array(self.scenarios, dtype=float).T
+        self.theta1, self.theta2, self.kicks, target_x = columns
+        self.desired = np.tile(np.asarray(DESIRED_STATES, dtype=float), (len(self.scenarios), 1))
+        self.desired[:, 0] = target_x
+
+    def __len__(self):
+        return len(self.scenarios)
+
+    def __repr__(self):
+        return "ScenarioSet(scenarios={0!r}, reduction={1!r}, cvar_alpha={2!r}, integrator={3!r})".format(
+            self.scenarios, self.reduction, self.cvar_alpha, self.integrator)
+
+    @classmethod
+    def from_config(cls, filename=DEFAULT_CONFIG_PATH):
+        """
+        Build the scenario set from the [Scenarios] section of a NEAT configuration file (the
+        integrator from its [Simulation] section).
+
+        Returns:
+            ScenarioSet, or None if the section is missing or disabled.
+        """
+        params = read_section(filename, 'Scenarios')
+        if not get_bool(params, 'enabled', False):
+            return None
+        return cls(arm1_angles=_floats(params, 'arm1_angles', [0.0]),
+                   arm2_angles=_floats(params, 'arm2_angles', [0.0]),
+                   kicks=_floats(params, 'kicks', [INIT_FORCE]),
+                   targets=_floats(params, 'targets', [DESIRED_STATES[0]]),
+                   reduction=params.get('reduction', 'mean').strip().lower(),
+                   cvar_alpha=get_float(params, 'cvar_alpha', 0.25),
+                   integrator=batch_sim.integrator_from_config(filename))
+
+    def simulate(self, nets, termination=None, duration=SIM_TIME):
+        """
+        Run every scenario for every network in one lockstep batch of G x S episodes.
+
+        Args:
+            nets: compiled_net.BatchNetwork of G genomes.
+            termination: Optional termination.TerminationPolicy applied to every episode.
+            duration: Episode length in seconds.
+
+        Returns:
+            np.ndarray: Array of shape (G, S, 6) with the cumulative error vectors.
+        """
+        g, s = len(nets), len(self)
+        errors = batch_sim.simulate_batch(nets.take(np.repeat(np.arange(g), s)), duration=duration,
+                                          termination=termination, integrator=self.integrator,
+                                          initial_angles=(np.tile(self.theta1, g), np.tile(self.theta2, g)),
+                                          kick=np.tile(self.kicks, g), desired=np.tile(self.desired, (g, 1)))
+        return errors.reshape(g, s, 6)
+
+    def reduce(self, errors):
+        """
+        Reduce the per-scenario error vectors of one genome to one cumulative error vector.
+
+        Args:
+            errors: Array of shape (S, 6).
+
+        Returns:
+            List[float]: Error vector accepted by fitness.fitness_from_errors.
+        """
+        errors = np.asarray(errors, dtype=float)
+        if self.reduction == 'mean':
+            return errors.mean(axis=0).tolist()
+        order = np.argsort(weighted_error(errors))[::-1]
+        if self.reduction == 'worst':
+            return errors[order[0]].tolist()
+        worst = max(1, int(math.ceil(self.cvar_alpha * len(errors))))
+        return errors[order[:worst]].mean(axis=0).tolist()
+
+    def evaluate(self, nets, termination=None, duration=None):
+        """
+        Simulate all scenarios and reduce their errors.
+
+        Returns:
+            List of G reduced error vectors, in the order of ``nets``.
+        """
+        errors = self.simulate(nets, termination, SIM_TIME if duration is None else duration)
+        return [self.reduce(e) for e in errors]
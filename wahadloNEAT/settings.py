@@ -0,0 +1,53 @@
+"""
+Access to the project-specific sections of neat-config.txt.
+
+neat.Config only reads the sections it knows about, so the simulator/evaluator settings live in
+extra sections of the same file and are read here with a plain ConfigParser.
+"""
+import os
+from configparser import ConfigParser
+
+DEFAULT_CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'neat-config.txt')
+
+
+def read_section(filename, section):
+    """
+    Read one section of a NEAT configuration file.
+
+    Args:
+        filename: Path to the configuration file.
+        section: Name of the section, e.g. 'Termination'.
+
+    Returns:
+        dict: The section's items as strings, empty if the section is missing.
+    """
+    parameters = ConfigParser()
+    with open(filename) as f:
+        parameters.read_file(f)
+    if not parameters.has_section(section):
+        return {}
+    return dict(parameters.items(section))
+
+
+def get_bool(params, name, default):
+    """Boolean option; a missing option gives ``default``."""
+    value = params.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def get_float(params, name, default):
+    """Float option; a missing option gives ``default``, the value 'none' gives None."""
+    value = params.get(name)
+    if value is None:
+        return default
+    if value.strip().lower() == 'none':
+        return None
+    return float(value)
+
+
+def get_int(params, name, default):
+    """Integer option; a missing option gives ``default``, the value 'none' gives None."""
+    value = get_float(params, name, default)
+    return None if value is None else int(value)
@@ -0,0 +1,245 @@
+"""
+Streaming fitness statistics with bounded memory.
+
+neat.StatisticsReporter keeps a deep copy of every generation's best genome and the fitness of
+every member of every species, so its memory grows with the length of the run. ``StreamingStatistics``
+keeps the last ``capacity`` generations in NumPy ring buffers, only the best genome ever seen, and
+appends every generation to an on-disk columnar store: one raw little-endian file per column,
+
+    <directory>/generations.<column>.bin   generation, best, mean, stdev, median, min, genomes, species
+    <directory>/species.<column>.bin       row, generation, species, size, mean_fitness (one row per
+                                           species, ``row`` is the index of its generation row)
+
+``StatsReader`` reads only the bytes appended since its last call, so visualize.plot_stats and
+visualize.plot_species can redraw a running evolution incrementally. Both plots also accept the
+reporter itself, which draws the generations still in its ring buffers.
+
+The reporter is not a drop-in for neat.StatisticsReporter: it keeps no per-generation genomes,
+so there is no ``most_fit_genomes``, ``best_genomes`` or ``save``. The fitness and species
+accessors (``get_fitness_mean``, ``get_fitness_stdev``, ``get_fitness_median``,
+``get_species_sizes``) and ``best_genome`` have StatisticsReporter's names and return the recent
+generations.
+"""
+import copy
+import os
+from collections import deque
+
+import numpy as np
+from neat.reporting import BaseReporter
+
+from settings import DEFAULT_CONFIG_PATH, read_section, get_int
+
+GENERATION_COLUMNS = (
+    ('generation', '<i8'), ('best', '<f8'), ('mean', '<f8'), ('stdev', '<f8'), ('median', '<f8'),
+    ('min', '<f8'), ('genomes', '<i8'), ('species', '<i8'),
+)
+SPECIES_COLUMNS = (
+    ('row', '<i8'), ('generation', '<i8'), ('species', '<i8'), ('size', '<i8'), ('mean_fitness', '<f8'),
+)
+TABLES = {'generations': GENERATION_COLUMNS, 'species': SPECIES_COLUMNS}
+
+
+def column_path(directory, table, column):
+    return os.path.join(directory, '{0}.{1}.bin'.format(table, column))
+
+
+class StreamingStatistics(BaseReporter):
+    """
+    Fitness statistics with bounded memory (see the module docstring for what it keeps).
+
+        stats = StreamingStatistics('stats')
+        p.add_reporter(stats)
+        ...
+        visualize.plot_stats(stats)                 # recent generations
+        visualize.plot_stats(StatsReader('stats'))  # the whole run
+    """
+
+    def __init__(self, directory='stats', capacity=1000):
+        """
+        Args:
+            directory: Directory of the column files, None keeps the statistics in memory only.
+            capacity: Number of recent generations kept in the ring buffers.
+        """
+        self.directory = directory
+        self.capacity = capacity
+        self.buffers = {name: np.zeros(capacity, dtype=dtype) for name, dtype in GENERATION_COLUMNS}
+        self.species_history = deque(maxlen=capacity)     # {species id: size} of the recent generations
+        self.count = 0                  # Generations recorded so far (the ring buffer holds the last ones)
+        self.best = None                # Copy of the best genome ever seen
+        self.generation = None
+        self.rows_written = 0           # Rows in the generation table on disk (a resumed run appends)
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            path = column_path(directory, 'generations', 'generation')
+            if os.path.exists(path):
+                self.rows_written = os.path.getsize(path) // np.dtype('<i8').itemsize
+
+    @classmethod
+    def from_config(cls, filename=DEFAULT_CONFIG_PATH):
+        """Build the reporter from the [Statistics] section of a NEAT configuration file."""
+        params = read_section(filename, 'Statistics')
+        directory = params.get('directory', 'stats').strip()
+        return cls(directory=None if directory.lower() == 'none' else directory,
+                   capacity=get_int(params, 'capacity', 1000))
+
+    def start_generation(self, generation):
+        self.generation = generation
+
+    def post_evaluate(self, config, population, species, best_genome):
+        fitness = np.fromiter((g.fitness for g in population.values()), dtype=float, count=len(population))
+        row = {'generation': self.generation, 'best': fitness.max(), 'mean': fitness.mean(), 'stdev': fitness.std(),
+               'median': np.median(fitness), 'min': fitness.min(), 'genomes': len(fitness),
+               'species': len(species.species)}
+        index = self.count % self.capacity
+        for name, value in row.items():
+            self.buffers[name][index] = value
+        self.count += 1
+        self.species_history.append({sid: len(s.members) for sid, s in species.species.items()})
+        if self.best is None or best_genome.fitness > self.best.fitness:
+            self.best = copy.deepcopy(best_genome)
+
+        if self.directory is not None:
+            species_rows = {'row': [], 'generation': [], 'species': [], 'size': [], 'mean_fitness': []}
+            for sid, s in species.species.items():
+                member_fitness = [m.fitness for m in s.members.values()]
+                species_rows['row'].append(self.rows_written)
+                species_rows['generation'].append(self.generation)
+                species_rows['species'].append(sid)
+                species_rows['size'].append(len(member_fitness))
+                species_rows['mean_fitness'].append(np.mean(member_fitness) if member_fitness else np.nan)
+            self._append('generations', {name: [value] for name, value in row.items()})
+            self._append('species', species_rows)
+            self.rows_written += 1
+
+    def _append(self, table, columns):
+        for name, dtype in TABLES[table]:
+            with open(column_path(self.directory, table, name), 'ab') as f:
+                f.write(np.asarray(columns[name], dtype=dtype).tobytes())
+
+    def recent(self):
+        """
+        The generations still in the ring buffers, oldest first.
+
+        Returns:
+            dict: column name -> array.
+        """
+        n = min(self.count, self.capacity)
+        start = self.count - n
+        order = (np.arange(start, self.count)) % self.capacity
+        return {name: buffer[order] for name, buffer in self.buffers.items()}
+
+    def generations(self):
+        """Per-generation statistics of the recent generations, as StatsReader.generations."""
+        return self.recent()
+
+    def species_sizes(self):
+        """
+        Species sizes of the recent generations, as StatsReader.species_sizes.
+
+        Returns:
+            Tuple (generations array, species ids array, sizes array of shape (generations, species)).
+        """
+        species_ids = np.array(sorted(set().union(*self.species_history)), dtype=int)
+        sizes = np.array([[sizes.get(sid, 0) for sid in species_ids] for sizes in self.species_history],
+                         dtype=int).reshape(len(self.species_history), len(species_ids))
+        return self.recent()['generation'], species_ids, sizes
+
+    def best_genome(self):
+        """Returns the most fit genome ever seen."""
+        return self.best
+
+    def get_fitness_mean(self):
+        """Mean fitness of the recent generations (same name as StatisticsReporter)."""
+        return self.recent()['mean'].tolist()
+
+    def get_fitness_stdev(self):
+        """Fitness standard deviation of the recent generations."""
+        return self.recent()['stdev'].tolist()
+
+    def get_fitness_median(self):
+        """Median fitness of the recent generations."""
+        return self.recent()['median'].tolist()
+
+    def get_species_sizes(self):
+        """Sizes of every species (0 where it did not exist) in each recent generation, as lists."""
+        return self.species_sizes()[2].tolist()
+
+
+class StatsReader(object):
+    """
+    Incremental reader of the column files written by StreamingStatistics.
+
+    Every ``update`` reads only what was appended since the previous call. A resumed run appends
+    the generations after the checkpoint again; the tables keep the newest row of every generation.
+    """
+
+    def __init__(self, directory='stats'):
+        self.directory = directory
+        self.offsets = {(table, name): 0 for table, columns in TABLES.items() for name, _ in columns}
+        self.columns = {table: {name: np.zeros(0, dtype=dtype) for name, dtype in columns}
+                        for table, columns in TABLES.items()}
+
+    def update(self):
+        """
+        Read the rows appended since the last call.
+
+        Returns:
+            int: Number of new generation rows.
+        """
+        new_rows = 0
+        for table, columns in TABLES.items():
+            chunks = {}
+            for name, dtype in columns:
+                path = column_path(self.directory, table, name)
+                if not os.path.exists(path):
+                    return new_rows
+                with open(path, 'rb') as f:
+                    f.seek(self.offsets[(table, name)])
+                    data = f.read()
+                size = np.dtype(dtype).itemsize
+                chunks[name] = np.frombuffer(data[:len(data) // size * size], dtype=dtype)
+            # A writer may be in the middle of a row; take only complete rows
+            rows = min(len(chunk) for chunk in chunks.values())
+            for name, dtype in columns:
+                self.offsets[(table, name)] += rows * np.dtype(dtype).itemsize
+                self.columns[table][name] = np.concatenate([self.columns[table][name], chunks[name][:rows]])
+            if table == 'generations':
+                new_rows = rows
+        return new_rows
+
+    def _latest_rows(self):
+        """Indices of the newest row of every generation, sorted by generation."""
+        generation = self.columns['generations']['generation']
+        _, last = np.unique(generation[::-1], return_index=True)
+        return len(generation) - 1 - last
+
+    def generations(self):
+        """
+        Per-generation statistics, one row per generation (the newest one if it was written twice).
+
+        Returns:
+            dict: column name -> array sorted by generation.
+        """
+        keep = self._latest_rows()
+        return {name: column[keep] for name, column in self.columns['generations'].items()}
+
+    def species_sizes(self):
+        """
+        Species sizes per generation.
+
+        Returns:
+            Tuple (generations array, species ids array, sizes array of shape (generations, species)).
+        """
+        table = self.columns['species']
+        keep = self._latest_rows()
+        # Position of every kept generation row in the output, -1 for rows superseded by a resume
+        position = np.full(len(self.columns['generations']['generation']), -1)
+        position[keep] = np.arange(len(keep))
+        rows = table['row']
+        rows = np.where(rows < len(position), rows, 0)
+        valid = (table['row'] < len(position)) & (position[rows] >= 0)
+
+        species_ids = np.unique(table['species'][valid])
+        sizes = np.zeros((len(keep), len(species_ids)), dtype=int)
+        sizes[position[rows[valid]], np.searchsorted(species_ids, table['species'][valid])] = table['size'][valid]
+        return self.columns['generations']['generation'][keep], species_ids, sizes
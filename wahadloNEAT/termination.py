@@ -0,0 +1,150 @@
+"""
+Early termination of simulation episodes.
+
+An episode is stopped as soon as the controller can no longer recover (an arm fell past
+``max_angle`` or the cart reached the end of the groove) or can no longer beat the best genome
+found so far (its weighted cumulative error exceeded the error budget). The steps that were not
+simulated are charged as a penalty, so a genome that fails earlier always ends up with a larger
+cumulative error than one that fails later in the same way.
+"""
+import copy
+
+import numpy as np
+
+from fitness import BASE_FITNESS, weighted_error
+from odwroconeWahadloModelNN_modul_old import TRACK_MIN_X, TRACK_MAX_X
+from settings import DEFAULT_CONFIG_PATH, read_section, get_bool, get_float
+
+
+class TerminationPolicy(object):
+    """Decides when an episode can be stopped early and what the skipped steps cost."""
+
+    def __init__(self, max_angle=None, track_margin=None, budget_slack=None, penalty_factor=1.0,
+                 error_budget=None):
+        """
+        Args:
+            max_angle: Stop once the absolute angle of any arm exceeds this (radians), None = off.
+            track_margin: Stop once the cart is this close to an end of the groove, None = off.
+            budget_slack: Error budget relative to the best genome so far, e.g. 1.5 stops a genome
+                          once its weighted error is 1.5x the best one's total. None = off.
+            penalty_factor: Multiplier of the absolute error charged for every skipped step.
+            error_budget: Absolute weighted-error budget; normally set through ``with_budget``.
+        """
+        self.max_angle = max_angle
+        self.track_margin = track_margin
+        self.budget_slack = budget_slack
+        self.penalty_factor = penalty_factor
+        self.error_budget = error_budget
+
+    def __repr__(self):
+        return ("TerminationPolicy(max_angle={0!r}, track_margin={1!r}, budget_slack={2!r}, penalty_factor={3!r}, "
+                "error_budget={4!r})").format(self.max_angle, self.track_margin, self.budget_slack,
+                                              self.penalty_factor, self.error_budget)
+
+    @classmethod
+    def from_config(cls, filename=DEFAULT_CONFIG_PATH):
+        """
+        Build the policy from the [Termination] section of a NEAT configuration file.
+
+        Returns:
+            TerminationPolicy, or None if the section is missing or disabled.
+        """
+        return cls.from_params(read_section(filename, 'Termination'))
+
+    @classmethod
+    def from_params(cls, params):
+        """Build the policy from the items of a [Termination] section, None if not enabled."""
+        if not get_bool(params, 'enabled', False):
+            return None
+        return cls(max_angle=get_float(params, 'max_angle', None),
+                   track_margin=get_float(params, 'track_margin', None),
+                   budget_slack=get_float(params, 'budget_slack', None),
+                   penalty_factor=get_float(params, 'penalty_factor', 1.0))
+
+    def with_budget(self, best_fitness):
+        """
+        Return a copy whose error budget is derived from the best fitness found so far.
+
+        Args:
+            best_fitness: Best fitness so far, or None if nothing was evaluated yet.
+        """
+        policy = copy.copy(self)
+        if self.budget_slack is not None and best_fitness is not None:
+            policy.error_budget = (BASE_FITNESS - best_fitness) * self.budget_slack
+        return policy
+
+    def should_stop(self, cart_x, angles, cumulative_error):
+        """
+        Check a single episode.
+
+        Args:
+            cart_x: Horizontal position of the cart.
+            angles: Angles of the pendulum arms.
+            cumulative_error: Cumulative error vector so far, None skips the budget check.
+
+        Returns:
+            bool: True if the episode should end now.
+        """
+        if self.max_angle is not None and any(abs(a) > self.max_angle for a in angles):
+            return True
+        if self.track_margin is not None and not (
+                TRACK_MIN_X + self.track_margin <= cart_x <= TRACK_MAX_X - self.track_margin):
+            return True
+        if (self.error_budget is not None and cumulative_error is not None
+                and weighted_error(cumulative_error) > self.error_budget):
+            return True
+        return False
+
+    def stop_mask(self, cart_x, angles, cumulative_error):
+        """
+        Vectorized ``should_stop`` for a batch of episodes.
+
+        Args:
+            cart_x: Array of shape (N,).
+            angles: Array of shape (N, number of arms).
+            cumulative_error: Array of shape (N, 6).
+
+        Returns:
+            np.ndarray: Boolean array of shape (N,).
+        """
+        stop = np.zeros(np.shape(cart_x), dtype=bool)
+        if self.max_angle is not None:
+            stop |= np.any(np.abs(angles) > self.max_angle, axis=-1)
+        if self.track_margin is not None:
+            stop |= (cart_x < TRACK_MIN_X + self.track_margin) | (cart_x > TRACK_MAX_X - self.track_margin)
+        if self.error_budget is not None:
+            stop |= weighted_error(cumulative_error) > self.error_budget
+        return stop
+
+    @staticmethod
+    def remaining_steps(elapsed_time, duration, dt):
+        """
+        Number of control steps an episode would still run after the current one.
+
+        Counts with the same floating-point time accumulation as the simulation loops.
+        """
+        remaining = 0
+        elapsed_time += dt
+        while not elapsed_time > duration:
+            remaining += 1
+            elapsed_time += dt
+        return remaining
+
+    def charge_remaining(self, cumulative_error, error, remaining_steps):
+        """
+        Add the penalty for the steps that will not be simulated.
+
+        Every skipped step is charged the absolute error of the step the episode stopped at,
+        times ``penalty_factor``.
+
+        Args:
+            cumulative_error: Cumulative error (vector, or (N, k) array) including the last step.
+            error: Error of the last simulated step, same shape.
+            remaining_steps: Number of skipped steps.
+
+        Returns:
+            The cumulative error with the penalty added (list for list input, array otherwise).
+        """
+        if isinstance(cumulative_error, list):
+            return [c + remaining_steps * self.penalty_factor * abs(e) for c, e in zip(cumulative_error, error)]
+        return cumulative_error + remaining_steps * self.penalty_factor * np.abs(error)
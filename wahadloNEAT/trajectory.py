@@ -0,0 +1,330 @@
+"""
+Recorded trajectories: record an episode once, replay and plot it without re-simulating.
+
+A trajectory file is a plain ``.npy`` array of float32 rows
+
+    time, cart_x, cart_vx, arm1_angle, arm1_angular_velocity, arm2_angle, arm2_angular_velocity, force
+
+(one row per control step, the observed state before the step and the force applied in it), so it
+can be opened memory-mapped with ``np.load(filename, mmap_mode='r')``. A ``<file>.json`` sidecar
+holds the genome key, its fitness and the simulator. ``EvaluationExecutor.record_trajectories``
+records on the worker pool; ``TrajectoryReporter`` records the top K genomes every few generations
+during evolution ([Trajectories] section of neat-config.txt).
+
+    python trajectory.py record --genome ../best_genome.pkl best.npy
+    python trajectory.py record --checkpoint ../neat-checkpoint-1799 --top 5 --directory trajectories
+    python trajectory.py replay best.npy
+    python trajectory.py plot trajectories/*.npy --output trajectories.svg
+
+Replay keys: space pause, left/right seek 1 s (with shift 5 s), up/down double/halve the speed,
+home restart; clicking the progress bar seeks.
+"""
+import argparse
+import json
+import math
+import os
+
+import neat
+import numpy as np
+from neat.reporting import BaseReporter
+
+from genome_codec import load_genome
+from odwroconeWahadloModelNN_modul_old import DT, FPS, WIDTH, HEIGHT, L1, L2, MAX_FORCE, SIM_TIME
+from settings import DEFAULT_CONFIG_PATH, read_section, get_bool, get_int
+
+COLUMNS = ('time', 'cart_x', 'cart_vx', 'arm1_angle', 'arm1_angular_velocity', 'arm2_angle',
+           'arm2_angular_velocity', 'force')
+# Height of the cart's groove in the pymunk model (pixels)
+CART_Y = 400
+
+
+class TrajectoryRecorder(object):
+    """Observer storing the observed state and the applied force of every step."""
+
+    def __init__(self, dt=DT, capacity=None):
+        self.dt = dt
+        if capacity is None:
+            capacity = int(SIM_TIME / dt) + 2
+        self.rows = np.empty((capacity, len(COLUMNS)))
+        self.count = 0
+
+    def step(self, space, state, force):
+        if self.count == len(self.rows):
+            self.rows = np.concatenate([self.rows, np.empty_like(self.rows)])
+        row = self.rows[self.count]
+        row[0] = self.count * self.dt
+        row[1:7] = state
+        row[7] = force
+        self.count += 1
+        return True
+
+    def array(self):
+        """Recorded rows, shape (steps, len(COLUMNS))."""
+        return self.rows[:self.count]
+
+    @property
+    def states(self):
+        return self.array()[:, 1:7]
+
+    @property
+    def forces(self):
+        return self.array()[:, 7]
+
+
+def save_trajectory(filename, rows, **metadata):
+    """
+    Write a trajectory file and its JSON sidecar.
+
+    Args:
+        filename: Target ``.npy`` file.
+        rows: Array of shape (steps, len(COLUMNS)).
+        metadata: Stored in ``<filename>.json`` (e.g. genome, fitness, simulator).
+    """
+    dt = float(rows[1][0] - rows[0][0]) if len(rows) > 1 else DT
+    np.save(filename, np.asarray(rows, dtype=np.float32))
+    metadata.update(columns=list(COLUMNS), dt=dt)
+    with open(filename + '.json', 'w') as f:
+        json.dump(metadata, f, indent=2)
+
+
+def load_trajectory(filename):
+    """
+    Open a trajectory file memory-mapped.
+
+    Returns:
+        Tuple (array of shape (steps, len(COLUMNS)), metadata dict, empty if there is no sidecar).
+    """
+    rows = np.load(filename, mmap_mode='r')
+    metadata = {}
+    if os.path.exists(filename + '.json'):
+        with open(filename + '.json') as f:
+            metadata = json.load(f)
+    return rows, metadata
+
+
+def top_genomes(population, k):
+    """The ``k`` evaluated genomes of a population dict with the highest fitness, best first."""
+    evaluated = [(key, g) for key, g in population.items() if g.fitness is not None]
+    return sorted(evaluated, key=lambda item: item[1].fitness, reverse=True)[:k]
+
+
+def record_genomes(executor, genomes, directory, prefix=''):
+    """
+    Record genomes on the executor's pool and write one file per genome.
+
+    Args:
+        executor: A running evaluation.EvaluationExecutor.
+        genomes: List of (genome_id, genome) pairs.
+        directory: Output directory (created if missing).
+        prefix: Prefix of the file names, ``<prefix>genome-<key>.npy``.
+
+    Returns:
+        List of the written file names, in the order of ``genomes``.
+    """
+    os.makedirs(directory, exist_ok=True)
+    fitness = {key: g.fitness for key, g in genomes}
+    filenames = {}
+    for genome_id, rows in executor.record_trajectories(genomes).items():
+        filename = os.path.join(directory, '{0}genome-{1}.npy'.format(prefix, genome_id))
+        save_trajectory(filename, rows, genome=genome_id, fitness=fitness[genome_id], simulator=executor.simulator)
+        filenames[genome_id] = filename
+    return [filenames[key] for key, _ in genomes if key in filenames]
+
+
+class TrajectoryReporter(BaseReporter):
+    """Records the trajectories of the top K genomes every ``interval`` generations."""
+
+    def __init__(self, executor, directory='trajectories', top_k=5, interval=50):
+        self.executor = executor
+        self.directory = directory
+        self.top_k = top_k
+        self.interval = interval
+        self.generation = None
+
+    @classmethod
+    def from_config(cls, executor, filename=DEFAULT_CONFIG_PATH):
+        """
+        Build the reporter from the [Trajectories] section of a NEAT configuration file.
+
+        Returns:
+            TrajectoryReporter, or None if the section is missing or disabled.
+        """
+        params = read_section(filename, 'Trajectories')
+        if not get_bool(params, 'enabled', False):
+            return None
+        return cls(executor, directory=params.get('directory', 'trajectories').strip(),
+                   top_k=get_int(params, 'top_k', 5), interval=get_int(params, 'interval', 50))
+
+    def __getstate__(self):
+        # The species set keeps a reference to all reporters, do not pickle the worker pool
+        state = dict(self.__dict__)
+        state['executor'] = None
+        return state
+
+    def start_generation(self, generation):
+        self.generation = generation
+
+    def post_evaluate(self, config, population, species, best_genome):
+        if self.executor is None or self.generation % self.interval:
+            return
+        record_genomes(self.executor, top_genomes(population, self.top_k), self.directory,
+                       'gen{0}-'.format(self.generation))
+
+
+class TrajectoryViewer(object):
+    """Pygame player of a trajectory file with seek and speed control."""
+
+    BAR_HEIGHT = 20
+
+    def __init__(self, filename, speed=1.0):
+        import pygame
+        self.pygame = pygame
+        self.rows, self.metadata = load_trajectory(filename)
+        self.dt = self.metadata.get('dt', DT)
+        self.duration = len(self.rows) * self.dt
+        self.speed = speed
+        self.position = 0.0         # Seconds into the episode
+        self.paused = False
+        pygame.init()
+        pygame.display.set_caption(os.path.basename(filename))
+        self.screen = pygame.display.set_mode((WIDTH, HEIGHT))
+        self.font = pygame.font.Font(None, 22)
+        self.clock = pygame.time.Clock()
+
+    def seek(self, seconds):
+        self.position = min(max(seconds, 0.0), max(self.duration - self.dt, 0.0))
+
+    def handle(self, event):
+        """Apply one pygame event; returns False when the window was closed."""
+        pygame = self.pygame
+        if event.type == pygame.QUIT:
+            return False
+        if event.type == pygame.KEYDOWN:
+            step = 5.0 if event.mod & pygame.KMOD_SHIFT else 1.0
+            if event.key == pygame.K_SPACE:
+                self.paused = not self.paused
+            elif event.key == pygame.K_LEFT:
+                self.seek(self.position - step)
+            elif event.key == pygame.K_RIGHT:
+                self.seek(self.position + step)
+            elif event.key == pygame.K_UP:
+                self.speed = min(self.speed * 2, 64.0)
+            elif event.key == pygame.K_DOWN:
+                self.speed = max(self.speed / 2, 1.0 / 16)
+            elif event.key == pygame.K_HOME:
+                self.seek(0.0)
+        elif event.type == pygame.MOUSEBUTTONDOWN and event.pos[1] >= HEIGHT - self.BAR_HEIGHT:
+            self.seek(event.pos[0] / float(WIDTH) * self.duration)
+        return True
+
+    def draw(self, row):
+        pygame = self.pygame
+        _, cart_x, _, theta1, _, theta2, _, force = row.tolist()
+        cart = (cart_x, CART_Y)
+        # Same geometry as the pymunk model: angle 0 = upright, positive angles lean to the right
+        joint = (cart[0] + L1 * math.sin(theta1), cart[1] - L1 * math.cos(theta1))
+        tip = (joint[0] + L2 * math.sin(theta2), joint[1] - L2 * math.cos(theta2))
+
+        self.screen.fill(pygame.Color("white"))
+        pygame.draw.line(self.screen, "grey", (0, CART_Y), (WIDTH, CART_Y), 1)
+        pygame.draw.rect(self.screen, (255, 165, 0), pygame.Rect(cart[0] - 25, cart[1] - 5, 50, 10))
+        pygame.draw.line(self.screen, "black", cart, joint, 6)
+        pygame.draw.line(self.screen, "blue", joint, tip, 6)
+        pygame.draw.circle(self.screen, "purple", (int(cart[0]), int(cart[1])), 5)
+        # Applied force as an arrow from the cart
+        end = cart[0] + 200 * force / MAX_FORCE
+        pygame.draw.line(self.screen, "red", (cart[0], cart[1] + 15), (end, cart[1] + 15), 3)
+
+        text = "t = {0:6.2f} / {1:.2f} s   speed x{2:g}{3}   genome {4}   fitness {5}".format(
+            self.position, self.duration, self.speed, '   (paused)' if self.paused else '',
+            self.metadata.get('genome', '-'), self.metadata.get('fitness', '-'))
+        self.screen.blit(self.font.render(text, True, pygame.Color("black")), (10, 10))
+        bar = pygame.Rect(0, HEIGHT - self.BAR_HEIGHT, WIDTH, self.BAR_HEIGHT)
+        pygame.draw.rect(self.screen, pygame.Color("lightgrey"), bar)
+        done = bar.copy()
+        done.width = int(WIDTH * self.position / self.duration) if self.duration else 0
+        pygame.draw.rect(self.screen, pygame.Color("steelblue"), done)
+        pygame.display.flip()
+
+    def run(self):
+        """Play until the window is closed; the file is read one row per frame."""
+        if not len(self.rows):
+            return
+        running = True
+        while running:
+            for event in self.pygame.event.get():
+                running = self.handle(event) and running
+            elapsed = self.clock.tick(FPS) / 1000.0
+            if not self.paused:
+                self.seek(self.position + elapsed * self.speed)
+            self.draw(self.rows[int(self.position / self.dt)])
+        self.pygame.quit()
+
+
+def main():
+    from evaluation import EvaluationExecutor, simulator_from_config, simulation_options_from_config
+    from pruning import Pruner
+
+    parser = argparse.ArgumentParser(description="Record, replay and plot pendulum trajectories.")
+    parser.add_argument('--config', default=DEFAULT_CONFIG_PATH, help="NEAT configuration file")
+    commands = parser.add_subparsers(dest='command', required=True)
+    record_parser = commands.add_parser('record', help="Simulate genomes once and record their trajectories")
+    record_parser.add_argument('output', nargs='?', default=None, help="Output file for --genome")
+    record_parser.add_argument('--genome', help="Pickled genome")
+    record_parser.add_argument('--checkpoint', help="Checkpoint log or neat-checkpoint-* file (use with --top)")
+    record_parser.add_argument('--top', type=int, default=5, help="Number of best genomes to record")
+    record_parser.add_argument('--directory', default='trajectories')
+    replay_parser = commands.add_parser('replay', help="Play a trajectory file")
+    replay_parser.add_argument('file')
+    replay_parser.add_argument('--speed', type=float, default=1.0)
+    plot_parser = commands.add_parser('plot', help="Plot trajectory files side by side")
+    plot_parser.add_argument('files', nargs='+')
+    plot_parser.add_argument('--output', default='trajectories.svg')
+    plot_parser.add_argument('--view', action='store_true')
+    args = parser.parse_args()
+
+    if args.command == 'replay':
+        TrajectoryViewer(args.file, args.speed).run()
+        return
+    if args.command == 'plot':
+        import visualize
+        visualize.plot_trajectories(args.files, view=args.view, filename=args.output)
+        return
+
+    if args.genome is not None:
+        config = neat.Config(neat.DefaultGenome, neat.DefaultReproduction,
+                             neat.DefaultSpeciesSet, neat.DefaultStagnation, args.config)
+        genome = load_genome(args.genome, config)
+        genomes = [(genome.key, genome)]
+    elif args.checkpoint is not None:
+        import checkpoint_log
+        from termination import TerminationPolicy
+        population, _ = checkpoint_log.restore(args.checkpoint)
+        config = population.config
+        genomes = list(population.population.items())
+        # The restored population is unevaluated, rank it first
+        with EvaluationExecutor(config, simulator=simulator_from_config(args.config),
+                                simulation_options=simulation_options_from_config(args.config),
+                                pruner=Pruner.from_config(args.config),
+                                termination=TerminationPolicy.from_config(args.config)) as executor:
+            executor.eval_genomes(genomes, config)
+        genomes = top_genomes(dict(genomes), args.top)
+    else:
+        parser.error("record needs --genome or --checkpoint")
+
+    with EvaluationExecutor(config, simulator=simulator_from_config(args.config),
+                            simulation_options=simulation_options_from_config(args.config),
+                            pruner=Pruner.from_config(args.config)) as executor:
+        if args.genome is not None and args.output:
+            (genome_id, rows), = executor.record_trajectories(genomes).items()
+            save_trajectory(args.output, rows, genome=genome_id, fitness=genomes[0][1].fitness,
+                            simulator=executor.simulator)
+            filenames = [args.output]
+        else:
+            filenames = record_genomes(executor, genomes, args.directory)
+    for filename in filenames:
+        print("Trajectory saved to {0}".format(filename))
+
+
+if __name__ == '__main__':
+    main()
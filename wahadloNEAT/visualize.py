@@ -2,13 +2,30 @@ import warnings
 import matplotlib.pyplot as plt
 import numpy as np
 
+from pruning import pruned_genome
+
 
 def plot_stats(statistics, ylog=False, view=False, filename='avg_fitness.svg'):
-    """Plots the population's average and best fitness."""
-    generation = range(len(statistics.most_fit_genomes))
-    best_fitness = [c.fitness for c in statistics.most_fit_genomes]
-    avg_fitness = np.array(statistics.get_fitness_mean())
-    stdev_fitness = np.array(statistics.get_fitness_stdev())
+    """
+    Plots the population's average and best fitness.
+
+    ``statistics`` is a neat.StatisticsReporter, a streaming_stats.StreamingStatistics (its recent
+    generations) or a streaming_stats.StatsReader; the reader is updated first, so calling this
+    repeatedly during a run only reads the new generations.
+    """
+    if hasattr(statistics, 'generations'):
+        if hasattr(statistics, 'update'):
+            statistics.update()
+        table = statistics.generations()
+        generation = table['generation']
+        best_fitness = table['best']
+        avg_fitness = table['mean']
+        stdev_fitness = table['stdev']
+    else:
+        generation = range(len(statistics.most_fit_genomes))
+        best_fitness = [c.fitness for c in statistics.most_fit_genomes]
+        avg_fitness = np.array(statistics.get_fitness_mean())
+        stdev_fitness = np.array(statistics.get_fitness_stdev())
 
     plt.plot(generation, avg_fitness, 'b-', label="average")
     plt.plot(generation, avg_fitness - stdev_fitness, 'g-.', label="-1 sd")
@@ -81,13 +98,24 @@ def plot_spikes(spikes, view=False, filename=None, title=None):
 
 
 def plot_species(statistics, view=False, filename='speciation.svg'):
-    """Visualizes speciation throughout evolution."""
-    species_sizes = statistics.get_species_sizes()
-    num_generations = len(species_sizes)
-    curves = np.array(species_sizes).T
+    """
+    Visualizes speciation throughout evolution.
+
+    ``statistics`` is a neat.StatisticsReporter, a streaming_stats.StreamingStatistics or a
+    streaming_stats.StatsReader (see plot_stats).
+    """
+    if hasattr(statistics, 'species_sizes'):
+        if hasattr(statistics, 'update'):
+            statistics.update()
+        generations, _, sizes = statistics.species_sizes()
+        curves = sizes.T
+    else:
+        species_sizes = statistics.get_species_sizes()
+        generations = range(len(species_sizes))
+        curves = np.array(species_sizes).T
 
     fig, ax = plt.subplots()
-    ax.stackplot(range(num_generations), *curves)
+    ax.stackplot(generations, *curves)
 
     plt.title("Speciation")
     plt.ylabel("Size per Species")
@@ -101,6 +129,34 @@ def plot_species(statistics, view=False, filename='speciation.svg'):
     plt.close()
 
 
+def plot_trajectories(filenames, columns=('cart_x', 'arm1_angle', 'arm2_angle', 'force'), view=False,
+                      filename='trajectories.svg'):
+    """Plots recorded trajectory files (see trajectory.py) side by side, one subplot per column."""
+    from trajectory import COLUMNS, load_trajectory
+
+    fig, axes = plt.subplots(len(columns), 1, sharex=True, figsize=(10, 2.5 * len(columns)))
+    axes = np.atleast_1d(axes)
+    for name in filenames:
+        rows, metadata = load_trajectory(name)
+        label = "genome {0} ({1:.1f})".format(metadata['genome'], metadata['fitness']) \
+            if metadata.get('fitness') is not None else name
+        for ax, column in zip(axes, columns):
+            ax.plot(rows[:, 0], rows[:, COLUMNS.index(column)], label=label)
+
+    for ax, column in zip(axes, columns):
+        ax.set_ylabel(column)
+        ax.grid()
+    axes[0].set_title("Trajectories")
+    axes[0].legend(loc="best", fontsize='small')
+    axes[-1].set_xlabel("Time (s)")
+
+    plt.savefig(filename)
+    if view:
+        plt.show()
+
+    plt.close()
+
+
 def draw_net(config, genome, view=False, filename=None, node_names=None, show_disabled=True, prune_unused=False,
              node_colors=None, fmt='svg'):
     """Visualizes a neural network using matplotlib."""
@@ -110,7 +166,8 @@ def draw_net(config, genome, view=False, filename=None, node_names=None, show_di
     graph = nx.DiGraph()
 
     if prune_unused:
-        genome = genome.get_pruned_copy(config.genome_config)
+        # Only what the evaluated network computes (see pruning.prune_plan)
+        genome = pruned_genome(genome, config)
 
     if node_names is None:
         node_names = {}